@@ -0,0 +1,296 @@
+"""
+Student x school-day attendance matrices for class and term analytics.
+
+A class (or stream) over a date range is loaded with one values_list() pass
+into an int8 matrix, one row per enrolled student and one column per school
+day (a day on which the class register was taken). Every metric is computed
+for all students at once with NumPy.
+"""
+from datetime import date, timedelta
+
+import numpy as np
+from django.db import transaction
+
+from .models import (
+    AbsenteeismFlag,
+    Attendance,
+    ClassSnapshot,
+    Classroom,
+    DailyClassAttendance,
+    Enrollment,
+    StudentProfile,
+    StudentSnapshot,
+)
+
+# Cell values; 0 means the student has no record on a day the register was taken
+NOT_MARKED, PRESENT, ABSENT, SICK = 0, 1, 2, 3
+STATUS_CODES = {'present': PRESENT, 'absent': ABSENT, 'sick': SICK}
+WEEKDAYS = ['Mon', 'Tue', 'Wed', 'Thu', 'Fri', 'Sat', 'Sun']
+
+
+class AttendanceMatrix:
+
+    def __init__(self, student_ids, days, matrix):
+        self.student_ids = student_ids  # int64 array, sorted
+        self.days = days                # list of dates, ascending
+        self.matrix = matrix            # int8 array, len(student_ids) x len(days)
+        self.ordinals = np.array([day.toordinal() for day in days], dtype=np.int64)
+
+    @classmethod
+    def load(cls, academic_year, classroom, stream=None, start=None, end=None):
+        """Build the matrix for a classroom (or one stream) of a year, optionally within start..end."""
+        enrollments = Enrollment.objects.filter(
+            academic_year=academic_year, classroom=classroom, student__isnull=False
+        )
+        records = Attendance.objects.filter(
+            enrollment__academic_year=academic_year, enrollment__classroom=classroom
+        )
+        if stream:
+            enrollments = enrollments.filter(stream=stream)
+            records = records.filter(enrollment__stream=stream)
+        if start:
+            records = records.filter(date__gte=start)
+        if end:
+            records = records.filter(date__lte=end)
+
+        student_ids = np.unique(np.fromiter(enrollments.values_list('student_id', flat=True), dtype=np.int64))
+        rows = list(records.values_list('student_id', 'date', 'status'))
+        if not rows:
+            return cls(student_ids, [], np.zeros((len(student_ids), 0), dtype=np.int8))
+
+        record_students, record_dates, record_statuses = zip(*rows)
+        ordinals = np.fromiter((day.toordinal() for day in record_dates), dtype=np.int64, count=len(rows))
+        statuses = np.fromiter((STATUS_CODES.get(status, NOT_MARKED) for status in record_statuses),
+                               dtype=np.int8, count=len(rows))
+        day_ordinals, columns = np.unique(ordinals, return_inverse=True)
+
+        record_students = np.fromiter(record_students, dtype=np.int64, count=len(rows))
+        row_index = np.searchsorted(student_ids, record_students)
+        # Drop records of students no longer on the roster (e.g. moved out mid-year)
+        on_roster = row_index < len(student_ids)
+        on_roster[on_roster] = student_ids[row_index[on_roster]] == record_students[on_roster]
+
+        matrix = np.zeros((len(student_ids), len(day_ordinals)), dtype=np.int8)
+        matrix[row_index[on_roster], columns[on_roster]] = statuses[on_roster]
+        return cls(student_ids, [date.fromordinal(int(day)) for day in day_ordinals], matrix)
+
+    # ---------------- metrics (one value per student) ----------------
+
+    def counts(self, status):
+        return (self.matrix == status).sum(axis=1)
+
+    def attendance_rate(self):
+        """Present days / marked days, as a percentage (NaN when the student was never marked)."""
+        return self._rate(self.counts(PRESENT), (self.matrix != NOT_MARKED).sum(axis=1))
+
+    def absence_rate(self):
+        """Absent days / marked days, as a percentage (NaN when the student was never marked)."""
+        return self._rate(self.counts(ABSENT), (self.matrix != NOT_MARKED).sum(axis=1))
+
+    def longest_absence_streak(self):
+        """Longest run of consecutive school days marked absent."""
+        if not self.days:
+            return np.zeros(len(self.student_ids), dtype=np.int64)
+        absent = self.matrix == ABSENT
+        running = np.cumsum(absent, axis=1)
+        # Running total at the last non-absent day, carried forward
+        reset = np.maximum.accumulate(np.where(absent, 0, running), axis=1)
+        return (running - reset).max(axis=1)
+
+    def absences_by_weekday(self):
+        """Students x 7 (Mon..Sun) absence counts."""
+        weekday = np.array([day.weekday() for day in self.days], dtype=np.int64)
+        onehot = np.zeros((len(self.days), 7), dtype=np.int32)
+        onehot[np.arange(len(self.days)), weekday] = 1
+        return (self.matrix == ABSENT).astype(np.int32) @ onehot
+
+    def rolling_rate(self, window_days=28):
+        """
+        Students x days: attendance rate over the `window_days` calendar days
+        ending on each school day (the rolling 4-week rate by default).
+        """
+        present = np.zeros((len(self.student_ids), len(self.days) + 1), dtype=np.int32)
+        marked = np.zeros_like(present)
+        np.cumsum(self.matrix == PRESENT, axis=1, out=present[:, 1:])
+        np.cumsum(self.matrix != NOT_MARKED, axis=1, out=marked[:, 1:])
+        first = np.searchsorted(self.ordinals, self.ordinals - (window_days - 1))
+        last = np.arange(1, len(self.days) + 1)
+        return self._rate(present[:, last] - present[:, first], marked[:, last] - marked[:, first])
+
+    @staticmethod
+    def _rate(numerator, denominator):
+        return np.where(denominator > 0, numerator * 100.0 / np.maximum(denominator, 1), np.nan)
+
+    # ---------------- report rows ----------------
+
+    def student_metrics(self):
+        """One dict per student (keyed by student_id) with every metric, ready for templates and exports."""
+        if not len(self.student_ids):
+            return {}
+        rate = self.attendance_rate()
+        recent = self.rolling_rate()[:, -1] if self.days else np.full(len(self.student_ids), np.nan)
+        streak = self.longest_absence_streak()
+        by_weekday = self.absences_by_weekday()
+        present, absent, sick = self.counts(PRESENT), self.counts(ABSENT), self.counts(SICK)
+
+        metrics = {}
+        for i, student_id in enumerate(self.student_ids.tolist()):
+            worst_day = int(by_weekday[i].argmax())
+            metrics[student_id] = {
+                'present': int(present[i]),
+                'absent': int(absent[i]),
+                'sick': int(sick[i]),
+                'attendance_rate': None if np.isnan(rate[i]) else round(float(rate[i]), 1),
+                'four_week_rate': None if np.isnan(recent[i]) else round(float(recent[i]), 1),
+                'longest_absence_streak': int(streak[i]),
+                'absences_by_weekday': dict(zip(WEEKDAYS[:5], by_weekday[i, :5].tolist())),
+                'most_missed_weekday': WEEKDAYS[worst_day] if by_weekday[i, worst_day] else None,
+            }
+        return metrics
+
+
+def get_student_analytics(academic_year, classroom, stream=None, start=None, end=None):
+    """Per-student metrics from the attendance matrix, as [{'student', ...metrics}] ordered by name."""
+    metrics = AttendanceMatrix.load(academic_year, classroom, stream, start, end).student_metrics()
+    students = StudentProfile.objects.filter(id__in=metrics).select_related('user').order_by(
+        'user__first_name', 'user__last_name'
+    )
+    return [{'student': student, **metrics[student.id]} for student in students]
+
+
+# ================= CHRONIC ABSENTEEISM =================
+
+def update_absenteeism_flags(academic_year, classroom, as_of, window_days, rate_threshold, streak_threshold):
+    """
+    Recompute one classroom's AbsenteeismFlag rows over the `window_days` calendar days
+    ending on `as_of`: a student is flagged when their absence rate reaches `rate_threshold`
+    percent or they have `streak_threshold` or more consecutive absences in the window.
+    Flags of students who no longer qualify are removed.
+    Returns the flags that are new since the previous run.
+    """
+    matrix = AttendanceMatrix.load(
+        academic_year, classroom, start=as_of - timedelta(days=window_days - 1), end=as_of
+    )
+    rate = matrix.absence_rate()
+    streak = matrix.longest_absence_streak()
+    absent = matrix.counts(ABSENT)
+    by_rate = np.nan_to_num(rate) >= rate_threshold
+    by_streak = streak >= streak_threshold
+
+    streams = dict(
+        Enrollment.objects.filter(academic_year=academic_year, classroom=classroom, student__isnull=False)
+        .values_list('student_id', 'stream_id')
+    )
+    flags = [
+        AbsenteeismFlag(
+            student_id=student_id,
+            academic_year=academic_year,
+            classroom=classroom,
+            stream_id=streams.get(student_id),
+            reason='both' if by_rate[i] and by_streak[i] else 'rate' if by_rate[i] else 'streak',
+            absence_rate=round(float(rate[i]), 1),
+            absent_days=int(absent[i]),
+            longest_streak=int(streak[i]),
+            as_of=as_of,
+        )
+        for i, student_id in enumerate(matrix.student_ids.tolist())
+        if by_rate[i] or by_streak[i]
+    ]
+
+    class_flags = AbsenteeismFlag.objects.filter(academic_year=academic_year, classroom=classroom)
+    with transaction.atomic():
+        already_flagged = set(class_flags.values_list('student_id', flat=True))
+        class_flags.exclude(student_id__in=[flag.student_id for flag in flags]).delete()
+        AbsenteeismFlag.objects.bulk_create(
+            flags,
+            update_conflicts=True,
+            unique_fields=['student', 'academic_year'],
+            update_fields=[
+                'classroom', 'stream', 'reason', 'absence_rate', 'absent_days',
+                'longest_streak', 'as_of', 'updated_at',
+            ],
+        )
+    return [flag for flag in flags if flag.student_id not in already_flagged]
+
+
+# ================= LOCKED YEAR SNAPSHOTS =================
+
+def freeze_academic_year(academic_year):
+    """
+    Materialize the reports of a locked year so they never touch the raw rows again:
+    a ClassSnapshot per classroom and per stream for the whole year and for every term
+    with dates, and a StudentSnapshot (every AttendanceMatrix metric) per student and term.
+    Earlier snapshots of the year are replaced. Returns (class rows, student rows) written.
+    """
+    terms = [('', None, None)] + [
+        (term, start, end) for term, _, start, end in academic_year.term_calendar if start and end
+    ]
+
+    # Roster and class teachers per classroom and per (classroom, stream); classrooms
+    # without any enrollment this year are left out, as in academic_year_summary
+    students, teachers, streams = {}, {}, {}
+    for classroom_id, stream_id, student_id, teacher_id, first_name, last_name in Enrollment.objects.filter(
+        academic_year=academic_year, classroom__isnull=False
+    ).values_list('classroom_id', 'stream_id', 'student_id', 'class_teacher_id',
+                  'class_teacher__user__first_name', 'class_teacher__user__last_name'):
+        for key in {(classroom_id, None), (classroom_id, stream_id)}:
+            students.setdefault(key, set())
+            if student_id:
+                students[key].add(student_id)
+            if teacher_id:
+                teachers.setdefault(key, {})[teacher_id] = f"{first_name} {last_name}".strip()
+        if student_id:
+            streams[student_id] = stream_id
+
+    days = {}
+    for row in DailyClassAttendance.objects.filter(academic_year=academic_year).values(
+        'classroom_id', 'stream_id', 'date', 'present', 'absent', 'sick'
+    ).order_by('date'):
+        for key in {(row['classroom_id'], None), (row['classroom_id'], row['stream_id'])}:
+            totals = days.setdefault(key, {}).setdefault(row['date'], {'present': 0, 'absent': 0, 'sick': 0})
+            for status in totals:
+                totals[status] += row[status]
+
+    classrooms = list(Classroom.objects.filter(id__in={classroom_id for classroom_id, _ in students}))
+    class_rows, student_rows = [], []
+    for term, start, end in terms:
+        for classroom_id, stream_id in sorted(students, key=lambda key: (key[0], key[1] or 0)):
+            term_days = [
+                {'date': day.isoformat(), **totals}
+                for day, totals in days.get((classroom_id, stream_id), {}).items()
+                if not start or start <= day <= end
+            ]
+            class_rows.append(ClassSnapshot(
+                academic_year=academic_year,
+                classroom_id=classroom_id,
+                stream_id=stream_id,
+                term=term,
+                students_count=len(students.get((classroom_id, stream_id), ())),
+                teacher_names=sorted(teachers.get((classroom_id, stream_id), {}).values()),
+                present=sum(day['present'] for day in term_days),
+                absent=sum(day['absent'] for day in term_days),
+                sick=sum(day['sick'] for day in term_days),
+                days=term_days,
+            ))
+
+        if term:
+            for classroom in classrooms:
+                metrics = AttendanceMatrix.load(academic_year, classroom, start=start, end=end).student_metrics()
+                student_rows += [
+                    StudentSnapshot(
+                        academic_year=academic_year,
+                        student_id=student_id,
+                        classroom=classroom,
+                        stream_id=streams.get(student_id),
+                        term=term,
+                        metrics=student_metrics,
+                    )
+                    for student_id, student_metrics in metrics.items()
+                ]
+
+    with transaction.atomic():
+        ClassSnapshot.objects.filter(academic_year=academic_year).delete()
+        StudentSnapshot.objects.filter(academic_year=academic_year).delete()
+        ClassSnapshot.objects.bulk_create(class_rows, batch_size=1000)
+        StudentSnapshot.objects.bulk_create(student_rows, batch_size=1000)
+    return len(class_rows), len(student_rows)
@@ -0,0 +1,179 @@
+import logging
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.decorators import api_view, permission_classes
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.response import Response
+
+from .models import AcademicYear, Attendance, Enrollment, SyncBatch, TeacherProfile
+from .serializers import AttendanceMarkSerializer, AttendanceSyncSerializer
+from .utils import (
+    get_enrollments_by_student,
+    get_notified_student_ids,
+    get_students_by_teacher_scope,
+    queue_absent_sms,
+    upsert_attendance,
+)
+
+logger = logging.getLogger(__name__)
+
+
+# ================= OFFLINE ATTENDANCE SYNC =================
+
+def apply_attendance_marks(teacher, active_year, marks):
+    """
+    Validate and save a batch of marks from the offline app, inside the caller's transaction.
+    Each mark gets one result code, in the same order as the input:
+    ok | stale (a newer mark already exists) | invalid | not_allowed (not in the class) | bad_date
+    Absence SMS are queued only for today's absences not already notified.
+    The teacher's assignment row is locked, so two syncs of the same class compare
+    marked_at one after the other.
+    """
+    teacher_enrollment = Enrollment.objects.select_for_update(of=('self',)).filter(
+        class_teacher=teacher,
+        academic_year=active_year
+    ).select_related('classroom', 'stream').first()
+    if not teacher_enrollment or not teacher_enrollment.classroom:
+        return None
+
+    roster = {
+        student.id: student
+        for student in get_students_by_teacher_scope(
+            teacher_enrollment.classroom, teacher_enrollment.stream, academic_year=active_year
+        ).select_related('user')
+    }
+    enrollments = get_enrollments_by_student(list(roster), active_year)
+
+    now = timezone.now()
+    today = timezone.localdate()
+    earliest = today - timedelta(days=settings.ATTENDANCE_SYNC_MAX_AGE_DAYS)
+
+    results = [None] * len(marks)
+    latest = {}  # (student_id, date) -> (index, mark); the newest mark in the batch wins
+    for index, raw in enumerate(marks):
+        serializer = AttendanceMarkSerializer(data=raw)
+        if not serializer.is_valid():
+            results[index] = 'invalid'
+            continue
+
+        mark = serializer.validated_data
+        # A phone clock running fast must not make its marks win over every later correction
+        mark['marked_at'] = min(mark.get('marked_at', now), now)
+        if mark['student'] not in roster or mark['student'] not in enrollments:
+            results[index] = 'not_allowed'
+            continue
+        if not earliest <= mark['date'] <= today:
+            results[index] = 'bad_date'
+            continue
+
+        key = (mark['student'], mark['date'])
+        previous = latest.get(key)
+        if previous and previous[1]['marked_at'] > mark['marked_at']:
+            results[index] = 'stale'
+            continue
+        if previous:
+            results[previous[0]] = 'stale'
+        latest[key] = (index, mark)
+
+    # Marks older than what is already saved lose (last writer wins on marked_at)
+    saved_at = {
+        (row['student_id'], row['date']): row['marked_at']
+        for row in Attendance.objects.select_for_update().filter(
+            enrollment__in=[enrollments[student_id] for student_id, _ in latest],
+            date__in={day for _, day in latest},
+        ).values('student_id', 'date', 'marked_at')
+    }
+
+    register = []
+    absent_today = []
+    for key, (index, mark) in latest.items():
+        existing = saved_at.get(key)
+        if existing and existing > mark['marked_at']:
+            results[index] = 'stale'
+            continue
+
+        results[index] = 'ok'
+        register.append(Attendance(
+            student_id=mark['student'],
+            enrollment=enrollments[mark['student']],
+            date=mark['date'],
+            status=mark['status'],
+            marked_by=teacher,
+            marked_at=mark['marked_at'],
+        ))
+        if mark['status'] == 'absent' and mark['date'] == today:
+            absent_today.append(mark['student'])
+
+    upsert_attendance(register)
+
+    sms_queued = 0
+    notified = get_notified_student_ids(absent_today, today)
+    for student_id in absent_today:
+        if student_id not in notified:
+            queued_count, _, _ = queue_absent_sms(
+                roster[student_id], teacher=teacher, classroom=teacher_enrollment.classroom
+            )
+            sms_queued += queued_count
+
+    return {'results': results, 'saved': len(register), 'sms_queued': sms_queued}
+
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def sync_attendance(request):
+    """
+    Upload a batch of attendance marks made offline.
+    Body: {"idempotency_key": "...", "marks": [{"student", "date", "status", "marked_at"}, ...]}
+    The key may also be sent as an Idempotency-Key header. A retried key gets the
+    stored response back without touching attendance or SMS again.
+    """
+    if request.user.role != 'teacher':
+        return Response({'detail': "Only teachers can sync attendance."}, status=status.HTTP_403_FORBIDDEN)
+
+    teacher = TeacherProfile.objects.filter(user=request.user).first()
+    active_year = AcademicYear.objects.filter(is_active=True).first()
+    if not teacher or not active_year:
+        return Response({'detail': "No active academic year found."}, status=status.HTTP_409_CONFLICT)
+
+    serializer = AttendanceSyncSerializer(data={
+        'idempotency_key': request.headers.get('Idempotency-Key') or request.data.get('idempotency_key'),
+        'marks': request.data.get('marks'),
+    })
+    serializer.is_valid(raise_exception=True)
+    key = serializer.validated_data['idempotency_key']
+
+    replay = SyncBatch.objects.filter(teacher=teacher, idempotency_key=key).first()
+    if replay:
+        return Response(replay.response, headers={'Idempotent-Replayed': 'true'})
+
+    try:
+        with transaction.atomic():
+            batch = SyncBatch.objects.create(teacher=teacher, idempotency_key=key)
+            result = apply_attendance_marks(teacher, active_year, serializer.validated_data['marks'])
+            if result is None:
+                transaction.set_rollback(True)
+                return Response(
+                    {'detail': "You are not assigned to a classroom or stream."},
+                    status=status.HTTP_403_FORBIDDEN
+                )
+            batch.response = {'idempotency_key': key, **result}
+            batch.save(update_fields=['response'])
+    except IntegrityError as e:
+        # Usually a concurrent retry with the same key that committed first
+        replay = SyncBatch.objects.filter(teacher=teacher, idempotency_key=key).first()
+        if replay is None:
+            # The conflict came from the marks themselves (e.g. a web submit queued the same SMS);
+            # nothing was saved, so the client can retry with the same key
+            logger.warning(f"Attendance sync {key} by {teacher} hit a conflicting write: {e}")
+            return Response(
+                {'detail': "A conflicting change was saved at the same time. Please retry."},
+                status=status.HTTP_409_CONFLICT
+            )
+        return Response(replay.response, headers={'Idempotent-Replayed': 'true'})
+
+    logger.info(f"Attendance sync {key} by {teacher}: {result['saved']} saved, {result['sms_queued']} SMS queued")
+    return Response(batch.response)
@@ -0,0 +1,16 @@
+"""
+Start-up for the spawned processes that render school bundle registers.
+This module is unpickled before Django is set up, so it must not import models.
+"""
+import django
+from django.db import connections
+
+
+def init_bundle_worker(database_names):
+    """
+    Load the apps, then point each connection at the database the parent is using
+    (under the test runner that is the test database, not the configured one).
+    """
+    django.setup()
+    for alias, name in database_names.items():
+        connections[alias].settings_dict['NAME'] = name
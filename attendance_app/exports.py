@@ -0,0 +1,516 @@
+"""
+Attendance register exports shared by the download views.
+Register rows are read with values_list().iterator() and written as they
+arrive, so a term-long register for a whole class is never held in memory.
+"""
+import hashlib
+import io
+import json
+import logging
+import multiprocessing
+import os
+import tempfile
+import zipfile
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from datetime import timedelta
+from itertools import islice
+
+import openpyxl
+import requests
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files import File
+from django.core.files.storage import FileSystemStorage
+from django.db import connections, transaction
+from django.db.models import Count, F, Max, Q, Sum
+from django.utils import timezone
+from django.utils.html import escape
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles import Alignment, Font
+from openpyxl.utils import get_column_letter
+from reportlab.lib import colors
+from reportlab.lib.pagesizes import A4
+from reportlab.lib.styles import getSampleStyleSheet
+from reportlab.lib.units import cm
+from reportlab.platypus import Image, Paragraph, SimpleDocTemplate, Spacer, Table, TableStyle
+
+from .analytics import get_student_analytics
+from .bundle_worker import init_bundle_worker
+from .models import (
+    AcademicYear,
+    Attendance,
+    Classroom,
+    DailyClassAttendance,
+    Enrollment,
+    ExportJob,
+    SchoolSettings,
+    Stream,
+)
+from .utils import ROLLUP_COUNTS, in_date_range
+
+logger = logging.getLogger(__name__)
+
+XLSX_CONTENT_TYPE = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+PDF_CONTENT_TYPE = "application/pdf"
+ZIP_CONTENT_TYPE = "application/zip"
+# Register rows per platypus Table; short tables keep reportlab's page splitting linear
+PDF_ROWS_PER_TABLE = 200
+REGISTER_FIELDS = [
+    'date', 'student__admission_number', 'student__user__first_name', 'student__user__last_name',
+    'student__user__gender', 'status',
+]
+STATUSES = ['present', 'absent', 'sick']
+
+
+def get_attendance_register(academic_year, classroom, stream=None, start=None, end=None):
+    """Attendance of a class (or one stream) of a year over start..end, by day then student name."""
+    records = Attendance.objects.filter(enrollment__academic_year=academic_year, enrollment__classroom=classroom)
+    if stream:
+        records = records.filter(enrollment__stream=stream)
+    return in_date_range(records, start, end).order_by('date', 'student__user__first_name', 'student__user__last_name')
+
+
+def get_register_summary(records):
+    """Status totals of a register, overall and by gender, from one aggregate query."""
+    summary = records.order_by().aggregate(total=Count('id'), **ROLLUP_COUNTS)
+    for gender in ('male', 'female'):
+        summary[f'{gender}_total'] = sum(summary[f'{gender}_{status}'] for status in STATUSES)
+    return summary
+
+
+def iter_register_rows(records):
+    """(no, admission no, name, gender, status, date) per record, fetched in chunks."""
+    rows = records.values_list(*REGISTER_FIELDS).iterator(chunk_size=settings.EXPORT_CHUNK_SIZE)
+    for i, (day, admission_number, first_name, last_name, gender, status) in enumerate(rows, start=1):
+        yield [
+            i,
+            admission_number,
+            f"{first_name} {last_name}".strip(),
+            gender.capitalize() if gender else "",
+            status.capitalize(),
+            day.strftime("%Y-%m-%d"),
+        ]
+
+
+def format_period(start, end):
+    if start == end:
+        return str(start)
+    return f"{start or '…'} to {end or '…'}"
+
+
+def write_attendance_xlsx(output, academic_year, classroom, stream=None, start=None, end=None, analytics=False):
+    """
+    Write the attendance register of a class over start..end to `output` (a path or binary file)
+    with a write-only workbook: summary block first, then one row per record streamed from the
+    database. `analytics` adds a per-student "Student Analytics" sheet for the same range.
+    """
+    records = get_attendance_register(academic_year, classroom, stream, start, end)
+    summary = get_register_summary(records)
+    total = summary['total']
+
+    def pct(x):
+        return round((x / total) * 100, 1) if total else 0
+
+    wb = openpyxl.Workbook(write_only=True)
+    ws = wb.create_sheet("Attendance")
+    for i, width in enumerate([6, 18, 28, 12, 14, 14], start=1):
+        ws.column_dimensions[get_column_letter(i)].width = width
+
+    bold = Font(bold=True)
+    center = Alignment(horizontal="center")
+
+    def styled(values, alignment=None):
+        cells = []
+        for value in values:
+            cell = WriteOnlyCell(ws, value=value)
+            cell.font = bold
+            if alignment:
+                cell.alignment = alignment
+            cells.append(cell)
+        return cells
+
+    class_name = f"{classroom.name} {stream.name}" if stream else classroom.name
+    ws.append(styled(["SMARTPRESENCE – ATTENDANCE REPORT"], center))
+    ws.append([])
+    ws.append(styled(["Class:", class_name, "Year:", str(academic_year), "Date:", format_period(start, end)]))
+    ws.append([])
+
+    ws.append(styled(["SUMMARY"]))
+    ws.append(["Total Students" if start and start == end else "Total Records", total])
+    for status in STATUSES:
+        ws.append([status.capitalize(), f"{summary[status]} ({pct(summary[status])}%)"])
+    ws.append([])
+
+    ws.append(styled(["GENDER SUMMARY"]))
+    for gender in ('male', 'female'):
+        ws.append([gender.capitalize(), summary[f'{gender}_total']] + [
+            f"{status.capitalize()} {summary[f'{gender}_{status}']}" for status in STATUSES
+        ])
+    ws.append([])
+
+    ws.append(styled(["No", "Admission No", "Student Name", "Gender", "Status", "Date"], center))
+    for row in iter_register_rows(records):
+        ws.append(row)
+
+    if analytics:
+        sheet = wb.create_sheet("Student Analytics")
+        sheet.append(styled([
+            "Admission No", "Student Name", "Present", "Absent", "Sick", "Attendance %",
+            "Last 4 Weeks %", "Longest Absence Streak", "Mon", "Tue", "Wed", "Thu", "Fri",
+        ]))
+        for row_data in get_student_analytics(academic_year, classroom, stream, start, end):
+            sheet.append([
+                row_data['student'].admission_number,
+                row_data['student'].user.get_full_name(),
+                row_data['present'],
+                row_data['absent'],
+                row_data['sick'],
+                row_data['attendance_rate'],
+                row_data['four_week_rate'],
+                row_data['longest_absence_streak'],
+                *row_data['absences_by_weekday'].values(),
+            ])
+
+    wb.save(output)
+
+
+# ================= PDF =================
+
+def get_school_logo():
+    """The SchoolSettings logo as image bytes (cached for a day), or None if unset or unreachable."""
+    school = SchoolSettings.objects.first()
+    if not school or not school.logo:
+        return None
+    key = f'school_logo:{school.logo.public_id}'
+    logo = cache.get(key)
+    if logo is None:
+        try:
+            response = requests.get(school.logo.url, timeout=5)
+            response.raise_for_status()
+            logo = response.content
+        except requests.RequestException as e:
+            logger.warning(f"School logo unavailable for PDF export: {e}")
+            return None
+        cache.set(key, logo, 60 * 60 * 24)
+    return logo
+
+
+def write_attendance_pdf(output, academic_year, classroom, stream=None, start=None, end=None):
+    """
+    Write the attendance register of a class over start..end to `output` as an A4 PDF
+    with reportlab platypus: school logo and name, a summary, then the register in
+    tables whose header row repeats on every page.
+    """
+    records = get_attendance_register(academic_year, classroom, stream, start, end)
+    summary = get_register_summary(records)
+    school = SchoolSettings.objects.first()
+    styles = getSampleStyleSheet()
+    class_name = f"{classroom.name} {stream.name}" if stream else classroom.name
+
+    story = []
+    logo = get_school_logo()
+    if logo:
+        story.append(Image(io.BytesIO(logo), width=2 * cm, height=2 * cm, kind='proportional'))
+    story += [
+        Paragraph(escape(school.school_name) if school else "", styles['Title']),
+        Paragraph("Attendance Register", styles['Heading2']),
+        Paragraph(
+            f"<b>Class:</b> {escape(class_name)} &nbsp; <b>Year:</b> {academic_year} &nbsp; "
+            f"<b>Date:</b> {format_period(start, end)}",
+            styles['Normal'],
+        ),
+        Paragraph(
+            f"<b>Records:</b> {summary['total']} &nbsp; <b>Present:</b> {summary['present']} &nbsp; "
+            f"<b>Absent:</b> {summary['absent']} &nbsp; <b>Sick:</b> {summary['sick']} &nbsp; "
+            f"<b>Male:</b> {summary['male_total']} &nbsp; <b>Female:</b> {summary['female_total']}",
+            styles['Normal'],
+        ),
+        Spacer(1, 0.4 * cm),
+    ]
+
+    header = ["No", "Admission No", "Student", "Gender", "Status", "Date"]
+    table_style = TableStyle([
+        ('FONT', (0, 0), (-1, 0), 'Helvetica-Bold', 9),
+        ('FONT', (0, 1), (-1, -1), 'Helvetica', 9),
+        ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#eeeeee')),
+        ('GRID', (0, 0), (-1, -1), 0.5, colors.black),
+        ('ROWBACKGROUNDS', (0, 1), (-1, -1), [colors.white, colors.HexColor('#f7f7f7')]),
+    ])
+    widths = [1.2 * cm, 3 * cm, 6.5 * cm, 2 * cm, 2.2 * cm, 2.6 * cm]
+
+    def add_table(rows):
+        table = Table([header] + rows, colWidths=widths, repeatRows=1)
+        table.setStyle(table_style)
+        story.append(table)
+
+    rows = []
+    for row in iter_register_rows(records):
+        rows.append(row)
+        if len(rows) == PDF_ROWS_PER_TABLE:
+            add_table(rows)
+            rows = []
+    if rows or not summary['total']:
+        add_table(rows)
+
+    generated = timezone.localtime().strftime("%Y-%m-%d %H:%M")
+
+    def footer(canvas, doc):
+        canvas.saveState()
+        canvas.setFont('Helvetica', 8)
+        canvas.drawString(doc.leftMargin, 1 * cm, f"{class_name} – {format_period(start, end)}")
+        canvas.drawRightString(A4[0] - doc.rightMargin, 1 * cm, f"Page {doc.page} · generated {generated}")
+        canvas.restoreState()
+
+    doc = SimpleDocTemplate(
+        output, pagesize=A4, title=f"Attendance {class_name}",
+        leftMargin=1.5 * cm, rightMargin=1.5 * cm, topMargin=1.5 * cm, bottomMargin=1.8 * cm,
+    )
+    doc.build(story, onFirstPage=footer, onLaterPages=footer)
+
+
+# ================= SCHOOL BUNDLE =================
+
+def get_bundle_registers(academic_year):
+    """(classroom, stream) of every register in the year: one per stream, or the whole class when it has none."""
+    registers = []
+    classrooms = Classroom.objects.filter(year=academic_year).prefetch_related('streams').order_by('name')
+    for classroom in classrooms:
+        streams = sorted(classroom.streams.all(), key=lambda stream: stream.name)
+        registers.extend([(classroom, stream) for stream in streams] or [(classroom, None)])
+    return registers
+
+
+def render_bundle_register(academic_year_id, classroom_id, stream_id, start, end, directory):
+    """
+    Render one class register to an XLSX file in `directory` and return its path.
+    Runs in a pool process, so it takes ids and reads everything itself.
+    """
+    academic_year = AcademicYear.objects.get(id=academic_year_id)
+    classroom = Classroom.objects.get(id=classroom_id)
+    stream = Stream.objects.get(id=stream_id) if stream_id else None
+    with tempfile.NamedTemporaryFile(dir=directory, suffix='.xlsx', delete=False) as output:
+        write_attendance_xlsx(output, academic_year, classroom, stream, start, end, analytics=True)
+    return output.name
+
+
+def write_school_bundle(output, academic_year, start=None, end=None, workers=None, progress=None):
+    """
+    Write one XLSX register per class and stream of the year into a ZIP at `output`.
+    Registers are rendered across a ProcessPoolExecutor of `workers` processes
+    (EXPORT_BUNDLE_WORKERS by default; 0 or 1 renders them here) with at most two per process
+    in flight; each finished file is copied into the ZIP and deleted, so memory and
+    scratch disk stay at a few registers however large the school is.
+    `progress(done, total)` is called after each register.
+    """
+    workers = settings.EXPORT_BUNDLE_WORKERS if workers is None else workers
+    registers = get_bundle_registers(academic_year)
+    total = len(registers)
+
+    with tempfile.TemporaryDirectory() as directory, zipfile.ZipFile(output, 'w', zipfile.ZIP_STORED) as bundle:
+        # XLSX files are already deflated, so members are stored as they are
+        tasks = iter([
+            (
+                f"{classroom.name}/{classroom.name} {stream.name if stream else 'All'}.xlsx",
+                (academic_year.id, classroom.id, stream.id if stream else None, start, end, directory),
+            )
+            for classroom, stream in registers
+        ])
+
+        def add(name, path):
+            bundle.write(path, name)
+            os.remove(path)
+            if progress:
+                progress(len(bundle.namelist()), total)
+
+        if workers < 2:
+            # A single pool process would only add its start-up time
+            for name, args in tasks:
+                add(name, render_bundle_register(*args))
+            return total
+
+        # spawn, not fork: a forked child would share the parent's database connections.
+        # Spawned processes load the apps before unpickling any task that imports models.
+        with ProcessPoolExecutor(
+            max_workers=workers, mp_context=multiprocessing.get_context('spawn'),
+            initializer=init_bundle_worker,
+            initargs=({connection.alias: connection.settings_dict['NAME'] for connection in connections.all()},),
+        ) as pool:
+            running = {pool.submit(render_bundle_register, *args): name for name, args in islice(tasks, workers * 2)}
+            while running:
+                finished, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    add(running.pop(future), future.result())
+                    for name, args in islice(tasks, 1):
+                        running[pool.submit(render_bundle_register, *args)] = name
+    return total
+
+
+# ================= EXPORT JOBS =================
+
+EXPORT_WRITERS = {
+    'xlsx': lambda output, job: write_attendance_xlsx(
+        output, job.academic_year, job.classroom, job.stream, job.start_date, job.end_date,
+        analytics=not (job.start_date and job.start_date == job.end_date),
+    ),
+    'pdf': lambda output, job: write_attendance_pdf(
+        output, job.academic_year, job.classroom, job.stream, job.start_date, job.end_date,
+    ),
+    'zip': lambda output, job: write_school_bundle(
+        output, job.academic_year, job.start_date, job.end_date,
+        progress=lambda done, total: report_export_progress(job, done, total),
+    ),
+}
+EXPORT_CONTENT_TYPES = {'xlsx': XLSX_CONTENT_TYPE, 'pdf': PDF_CONTENT_TYPE, 'zip': ZIP_CONTENT_TYPE}
+
+
+def get_export_storage():
+    return FileSystemStorage(location=settings.EXPORT_ROOT)
+
+
+def get_export_data_version(academic_year, classroom=None, stream=None, start=None, end=None):
+    """
+    Fingerprint of the data behind a register (the whole year's when classroom is None),
+    from a few small aggregates. Every attendance write (mark, edit, delete, backfill)
+    stamps Classroom.attendance_changed_at, so the newest stamp changes even when a rollup
+    row ends up with the same counts; the rollup count and totals cover the date range.
+    The enrollment count, newest id and newest updated_at cover roster changes, and the
+    newest StudentProfile/User updated_at covers renamed students or fixed genders.
+    Changes made with queryset.update() skip auto_now and are not seen.
+    """
+    classrooms = Classroom.objects.filter(year=academic_year)
+    rollups = in_date_range(DailyClassAttendance.objects.filter(academic_year=academic_year), start, end)
+    enrollments = Enrollment.objects.filter(academic_year=academic_year)
+    if classroom:
+        classrooms = classrooms.filter(id=classroom.id)
+        rollups = rollups.filter(classroom=classroom)
+        enrollments = enrollments.filter(classroom=classroom)
+    if stream:
+        rollups = rollups.filter(stream=stream)
+        enrollments = enrollments.filter(stream=stream)
+    version = [
+        classrooms.aggregate(changed=Max('attendance_changed_at')),
+        rollups.aggregate(
+            count=Count('id'), present=Sum('present'), absent=Sum('absent'), sick=Sum('sick')
+        ),
+        enrollments.aggregate(
+            count=Count('id'),
+            latest=Max('id'),
+            updated=Max('updated_at'),
+            student_updated=Max('student__updated_at'),
+            user_updated=Max('student__user__updated_at'),
+        ),
+    ]
+    return hashlib.sha256(json.dumps(version, default=str, sort_keys=True).encode()).hexdigest()
+
+
+def get_artifact_key(export_format, academic_year, classroom, stream, start, end, data_version):
+    scope = [
+        export_format, academic_year.id, classroom.id if classroom else None, stream.id if stream else None,
+        start, end, data_version,
+    ]
+    return hashlib.sha256(json.dumps(scope, default=str).encode()).hexdigest()
+
+
+def request_export(user, export_format, academic_year, classroom, stream=None, start=None, end=None):
+    """
+    Queue an export, or answer it straight away when the artifact for the current data
+    already exists. A request matching a job still pending or running joins that job.
+    """
+    data_version = get_export_data_version(academic_year, classroom, stream, start, end)
+    artifact_key = get_artifact_key(export_format, academic_year, classroom, stream, start, end, data_version)
+
+    in_progress = ExportJob.objects.filter(
+        artifact_key=artifact_key, status__in=['pending', 'running'], requested_by=user
+    ).first()
+    if in_progress:
+        return in_progress
+
+    job = ExportJob(
+        requested_by=user,
+        format=export_format,
+        academic_year=academic_year,
+        classroom=classroom,
+        stream=stream,
+        start_date=start,
+        end_date=end,
+        data_version=data_version,
+        artifact_key=artifact_key,
+    )
+    if get_export_storage().exists(job.artifact_name):
+        job.status, job.progress, job.finished_at = 'done', 100, timezone.now()
+    job.save()
+    return job
+
+
+def report_export_progress(job, done, total):
+    """Store a running job's progress; 100 is left for run_export_job once the file is saved."""
+    job.progress = min(done * 100 // total, 99) if total else 0
+    ExportJob.objects.filter(id=job.id).update(progress=job.progress)
+
+
+def claim_export_jobs(limit=1, lease_seconds=900, max_attempts=3):
+    """
+    Claim up to `limit` pending jobs (or jobs stuck in 'running' past the lease)
+    with SELECT ... FOR UPDATE SKIP LOCKED, like claim_pending_sms.
+    A stuck job that has already been claimed `max_attempts` times is marked failed instead.
+    """
+    now = timezone.now()
+    stale = now - timedelta(seconds=lease_seconds)
+
+    with transaction.atomic():
+        ExportJob.objects.filter(status='running', claimed_at__lt=stale, attempts__gte=max_attempts).update(
+            status='failed', error=f"Gave up after {max_attempts} attempts.", finished_at=now
+        )
+        ids = list(
+            ExportJob.objects.select_for_update(skip_locked=True)
+            .filter(Q(status='pending') | Q(status='running', claimed_at__lt=stale))
+            .order_by('created_at')
+            .values_list('id', flat=True)[:limit]
+        )
+        if not ids:
+            return []
+        ExportJob.objects.filter(id__in=ids).update(
+            status='running', claimed_at=now, attempts=F('attempts') + 1, progress=0
+        )
+
+    return list(ExportJob.objects.filter(id__in=ids).select_related('academic_year', 'classroom', 'stream'))
+
+
+def run_export_job(job):
+    """Render a claimed job's artifact unless another job already stored it, and record the outcome."""
+    storage = get_export_storage()
+    try:
+        if not storage.exists(job.artifact_name):
+            with tempfile.TemporaryFile() as output:
+                EXPORT_WRITERS[job.format](output, job)
+                output.seek(0)
+                saved = storage.save(job.artifact_name, File(output))
+            if saved != job.artifact_name:
+                # Another worker stored the same artifact meanwhile
+                storage.delete(saved)
+        job.status, job.progress, job.error = 'done', 100, ''
+    except Exception as e:
+        logger.exception(f"Export job {job.id} failed")
+        job.status, job.error = 'failed', str(e)[:500]
+    job.finished_at = timezone.now()
+    job.save(update_fields=['status', 'progress', 'error', 'finished_at'])
+    return job
+
+
+def sweep_export_artifacts(retention_days):
+    """
+    Delete finished jobs older than `retention_days` and every stored artifact no remaining
+    job points at. Returns (jobs deleted, files deleted).
+    """
+    cutoff = timezone.now() - timedelta(days=retention_days)
+    jobs_deleted, _ = ExportJob.objects.filter(status__in=['done', 'failed'], created_at__lt=cutoff).delete()
+
+    storage = get_export_storage()
+    if not storage.exists(''):
+        return jobs_deleted, 0
+    stored = {name.rsplit('.', 1)[0]: name for name in storage.listdir('')[1]}
+    referenced = set(ExportJob.objects.filter(artifact_key__in=stored).values_list('artifact_key', flat=True))
+    orphans = [name for key, name in stored.items() if key not in referenced]
+    for name in orphans:
+        storage.delete(name)
+    return jobs_deleted, len(orphans)
@@ -30,9 +30,16 @@ class UserUpdateForm(forms.ModelForm):
 class AcademicYearForm(forms.ModelForm):
     class Meta:
         model = AcademicYear
-        fields = ['year_start', 'year_end', 'is_active']
+        fields = [
+            'year_start', 'year_end', 'is_active',
+            'term1_start', 'term1_end', 'term2_start', 'term2_end', 'term3_start', 'term3_end',
+        ]
         widgets = {
             'year_start': forms.NumberInput(attrs={'class': 'form-control', 'placeholder': 'Start Year'}),
             'year_end': forms.NumberInput(attrs={'class': 'form-control', 'placeholder': 'End Year'}),
             'is_active': forms.CheckboxInput(attrs={'class': 'form-check-input'}),
+            **{
+                field: forms.DateInput(attrs={'class': 'form-control', 'type': 'date'})
+                for field in ['term1_start', 'term1_end', 'term2_start', 'term2_end', 'term3_start', 'term3_end']
+            },
         }
@@ -0,0 +1,44 @@
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from attendance_app.analytics import AttendanceMatrix
+from attendance_app.models import Classroom
+from attendance_app.synthetic_data import build_synthetic_year, school_days
+
+
+class Command(BaseCommand):
+    help = (
+        "Time the attendance matrix (load + every metric) for one class over a term "
+        "of synthetic data. The data is written inside a transaction that is rolled back."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--students', type=int, default=1000)
+        parser.add_argument('--days', type=int, default=65, help="School days in the term.")
+        parser.add_argument('--repeat', type=int, default=5)
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            year = build_synthetic_year(students=options['students'], days=options['days'], forms=1)
+            classroom = Classroom.objects.get(year=year)
+            days = school_days(options['days'])
+
+            load_times, metric_times = [], []
+            for _ in range(options['repeat']):
+                started = time.perf_counter()
+                matrix = AttendanceMatrix.load(year, classroom, start=days[0], end=days[-1])
+                loaded = time.perf_counter()
+                matrix.student_metrics()
+                load_times.append((loaded - started) * 1000)
+                metric_times.append((time.perf_counter() - loaded) * 1000)
+
+            self.stdout.write(
+                f"{matrix.matrix.shape[0]} students x {matrix.matrix.shape[1]} days "
+                f"({matrix.matrix.nbytes / 1024:.0f} KiB int8 matrix)\n"
+                f"load: median {statistics.median(load_times):.1f} ms | "
+                f"metrics: median {statistics.median(metric_times):.1f} ms"
+            )
+            transaction.set_rollback(True)
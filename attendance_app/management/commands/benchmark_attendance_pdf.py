@@ -0,0 +1,81 @@
+import io
+import statistics
+import subprocess
+import sys
+import time
+import tracemalloc
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.template.loader import render_to_string
+
+from attendance_app.exports import get_attendance_register, write_attendance_pdf
+from attendance_app.models import Classroom
+from attendance_app.synthetic_data import build_synthetic_year, school_days
+
+
+def import_seconds(module):
+    """Wall time of a fresh interpreter importing `module`, minus a bare interpreter start."""
+    def run(code):
+        started = time.perf_counter()
+        subprocess.run([sys.executable, '-c', code], check=True)
+        return time.perf_counter() - started
+    return run(f'import {module}') - run('pass')
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare the reportlab attendance PDF with the old xhtml2pdf (pisa) path on a synthetic "
+        "multi-day class register. The data is written inside a transaction that is rolled back."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--students', type=int, default=100)
+        parser.add_argument('--days', type=int, default=5, help="School days in the register.")
+        parser.add_argument('--repeat', type=int, default=3)
+
+    def measure(self, render):
+        timings = []
+        for _ in range(self.repeat):
+            output = io.BytesIO()
+            started = time.perf_counter()
+            render(output)
+            timings.append((time.perf_counter() - started) * 1000)
+
+        # One more pass under tracemalloc for the peak (kept out of the timings, it slows Python down)
+        tracemalloc.start()
+        render(io.BytesIO())
+        peak = tracemalloc.get_traced_memory()[1] / 1e6
+        tracemalloc.stop()
+        return f"median {statistics.median(timings):.0f} ms, peak {peak:.1f} MB traced, {output.tell() / 1024:.0f} KiB"
+
+    def handle(self, *args, **options):
+        from xhtml2pdf import pisa
+
+        self.repeat = options['repeat']
+        with transaction.atomic():
+            year = build_synthetic_year(students=options['students'], days=options['days'], forms=1)
+            classroom = Classroom.objects.get(year=year)
+            days = school_days(options['days'])
+            register = get_attendance_register(year, classroom, start=days[0], end=days[-1])
+            self.stdout.write(f"Register: {register.count()} rows over {len(days)} days")
+
+            def render_pisa(output):
+                html = render_to_string("attendance_app/attendance_pdf.html", {
+                    "records": register.select_related("student__user"),
+                    "classroom": classroom,
+                    "date": f"{days[0]} to {days[-1]}",
+                })
+                pisa.CreatePDF(html, dest=output)
+
+            self.stdout.write(f"xhtml2pdf: {self.measure(render_pisa)}")
+            def render_reportlab(output):
+                write_attendance_pdf(output, year, classroom, start=days[0], end=days[-1])
+
+            self.stdout.write(f"reportlab: {self.measure(render_reportlab)}")
+            transaction.set_rollback(True)
+
+        self.stdout.write(
+            f"import time: xhtml2pdf {import_seconds('xhtml2pdf.pisa') * 1000:.0f} ms, "
+            f"reportlab.platypus {import_seconds('reportlab.platypus') * 1000:.0f} ms"
+        )
@@ -0,0 +1,89 @@
+import asyncio
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from attendance_app.sms_backends import LocmemBackend, SimulatorBackend, get_async_sms_session, get_sms_backend
+from attendance_app.utils import SMSCircuitBreaker, SMSGatewayUnavailable, asend_bulk_sms, send_bulk_sms
+
+
+class Command(BaseCommand):
+    help = "Send fake messages through settings.SMS_BACKEND and report throughput and latency."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--messages', type=int, default=1000)
+        parser.add_argument('--batch-size', type=int, default=settings.SMS_BATCH_SIZE, help="Recipients per gateway call.")
+        parser.add_argument('--concurrency', type=int, default=4, help="Gateway requests in flight at once.")
+        parser.add_argument('--async', dest='use_async', action='store_true',
+                            help="Use the aiohttp path (one event loop) instead of a thread pool.")
+        parser.add_argument('--i-know-this-sends-real-sms', dest='real_sms', action='store_true',
+                            help="Allow a backend other than SimulatorBackend or LocmemBackend.")
+
+    def handle(self, *args, **options):
+        backend = get_sms_backend()
+        if not isinstance(backend, (SimulatorBackend, LocmemBackend)) and not options['real_sms']:
+            raise CommandError(
+                f"SMS_BACKEND is {settings.SMS_BACKEND}, which sends real messages to the fake numbers. "
+                "Use SimulatorBackend or LocmemBackend, or pass --i-know-this-sends-real-sms."
+            )
+
+        # Failures seen here must not open the breaker that guards real sends
+        breaker = SMSCircuitBreaker(name='sms_breaker:benchmark')
+        breaker.record_success()
+
+        numbers = [f'+2557{i:08d}' for i in range(options['messages'])]
+        size = max(1, options['batch_size'])
+        chunks = [numbers[i:i + size] for i in range(0, len(numbers), size)]
+        latencies = []
+        counts = {'sent': 0, 'failed': 0, 'deferred': 0}
+
+        def send_chunk(chunk):
+            started = time.perf_counter()
+            try:
+                results = send_bulk_sms(chunk, "Benchmark message", breaker=breaker)
+            except SMSGatewayUnavailable:
+                return time.perf_counter() - started, None
+            return time.perf_counter() - started, results
+
+        async def asend_chunk(session, semaphore, chunk):
+            async with semaphore:
+                started = time.perf_counter()
+                try:
+                    results = await asend_bulk_sms(chunk, "Benchmark message", session=session, breaker=breaker)
+                except SMSGatewayUnavailable:
+                    return time.perf_counter() - started, None
+                return time.perf_counter() - started, results
+
+        async def run_async():
+            semaphore = asyncio.Semaphore(options['concurrency'])
+            async with get_async_sms_session(limit=options['concurrency']) as session:
+                return await asyncio.gather(*(asend_chunk(session, semaphore, chunk) for chunk in chunks))
+
+        mode = 'async' if options['use_async'] else 'threads'
+        self.stdout.write(f"Backend: {settings.SMS_BACKEND} ({mode}, concurrency {options['concurrency']})")
+        self.stdout.write(f"Target: {getattr(backend, 'url', 'in memory')}")
+        started = time.perf_counter()
+        if options['use_async']:
+            outcomes = asyncio.run(run_async())
+        else:
+            with ThreadPoolExecutor(max_workers=options['concurrency']) as executor:
+                outcomes = list(executor.map(send_chunk, chunks))
+        total = time.perf_counter() - started
+
+        for chunk, (elapsed, results) in zip(chunks, outcomes):
+            latencies.append(elapsed * 1000)
+            if results is None:
+                counts['deferred'] += len(chunk)
+                continue
+            for success, _ in results.values():
+                counts['sent' if success else 'failed'] += 1
+
+        percentiles = statistics.quantiles(latencies, n=100) if len(latencies) > 1 else latencies * 99
+        self.stdout.write(
+            f"{len(numbers)} messages in {len(chunks)} calls, {total:.2f} s -> {len(numbers) / total:.1f} msg/s\n"
+            f"Sent: {counts['sent']} | Failed: {counts['failed']} | Deferred (breaker open): {counts['deferred']}\n"
+            f"Call latency p50 {percentiles[49]:.1f} ms, p95 {percentiles[94]:.1f} ms, p99 {percentiles[98]:.1f} ms"
+        )
@@ -0,0 +1,71 @@
+import statistics
+import time
+
+from django.contrib.messages.storage.fallback import FallbackStorage
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.db.models import Count, Q
+from django.test import RequestFactory
+from django.test.utils import CaptureQueriesContext
+
+from attendance_app.models import Attendance, User
+from attendance_app.synthetic_data import build_synthetic_year
+from attendance_app.views import academic_year_summary
+
+
+class Command(BaseCommand):
+    help = (
+        "Time academic_year_summary on a synthetic year. "
+        "The data is written inside a transaction that is rolled back."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--students', type=int, default=3000)
+        parser.add_argument('--days', type=int, default=190, help="School days of attendance.")
+        parser.add_argument('--repeat', type=int, default=5)
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            started = time.perf_counter()
+            year = build_synthetic_year(students=options['students'], days=options['days'])
+            rows = Attendance.objects.filter(enrollment__academic_year=year).count()
+            self.stdout.write(
+                f"Built {options['students']} students x {options['days']} days "
+                f"({rows} attendance rows) in {time.perf_counter() - started:.1f} s"
+            )
+
+            admin = User.objects.create(username=f'bench{year.year_start}_admin', role='admin')
+            request = RequestFactory().get('/academic-year-summary/', {'year': year.id})
+            request.user = admin
+            request.session = {}
+            request._messages = FallbackStorage(request)
+
+            timings = []
+            for _ in range(options['repeat']):
+                with CaptureQueriesContext(connection) as ctx:
+                    started = time.perf_counter()
+                    response = academic_year_summary(request)
+                    timings.append((time.perf_counter() - started) * 1000)
+            self.stdout.write(
+                f"academic_year_summary: {len(ctx.captured_queries)} queries, "
+                f"median {statistics.median(timings):.1f} ms (status {response.status_code})"
+            )
+
+            # The same totals straight from Attendance, GROUP BY classroom over the enrollment join
+            timings = []
+            for _ in range(options['repeat']):
+                started = time.perf_counter()
+                list(
+                    Attendance.objects.filter(enrollment__academic_year=year)
+                    .values('enrollment__classroom_id')
+                    .annotate(
+                        present=Count('id', filter=Q(status='present')),
+                        absent=Count('id', filter=Q(status='absent')),
+                        sick=Count('id', filter=Q(status='sick')),
+                    )
+                    .order_by()
+                )
+                timings.append((time.perf_counter() - started) * 1000)
+            self.stdout.write(f"GROUP BY over Attendance: median {statistics.median(timings):.1f} ms")
+
+            transaction.set_rollback(True)
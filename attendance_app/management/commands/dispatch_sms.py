@@ -0,0 +1,41 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from attendance_app.utils import dispatch_pending_sms
+
+
+class Command(BaseCommand):
+    help = "Send queued (pending) SMS from the SMSLog outbox."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=50, help="Rows claimed per round.")
+        parser.add_argument('--concurrency', type=int, default=4, help="Gateway requests in flight at once.")
+        parser.add_argument('--poll-interval', type=float, default=2.0, help="Seconds to sleep when the outbox is empty.")
+        parser.add_argument('--lease', type=int, default=300, help="Seconds before a stuck 'sending' row is retried.")
+        parser.add_argument('--once', action='store_true', help="Drain the outbox once and exit (for cron).")
+
+    def handle(self, *args, **options):
+        self.stdout.write("SMS dispatcher started.")
+
+        try:
+            while True:
+                close_old_connections()
+                sent, failed = dispatch_pending_sms(
+                    limit=options['batch_size'],
+                    concurrency=options['concurrency'],
+                    lease_seconds=options['lease'],
+                )
+
+                if sent or failed:
+                    self.stdout.write(f"Sent: {sent} | Failed: {failed}")
+                    continue
+
+                if options['once']:
+                    break
+                time.sleep(options['poll_interval'])
+        except KeyboardInterrupt:
+            pass
+
+        self.stdout.write("SMS dispatcher stopped.")
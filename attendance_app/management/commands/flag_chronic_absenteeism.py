@@ -0,0 +1,82 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db.models import Max
+from django.utils import timezone
+
+from attendance_app.analytics import update_absenteeism_flags
+from attendance_app.models import AbsenteeismFlag, AcademicYear, Classroom, DailyClassAttendance, JobWatermark
+from attendance_app.utils import queue_absenteeism_sms
+
+JOB_NAME = 'chronic_absenteeism'
+# A write that commits while a run is reading carries a slightly earlier attendance_changed_at;
+# each run looks back this far past the previous one so it is not missed
+CHANGE_OVERLAP = timedelta(minutes=10)
+
+
+class Command(BaseCommand):
+    help = (
+        "Flag students with a high rolling absence rate or consecutive absences (run nightly). "
+        "Only classrooms whose attendance changed since the last run (new days, edits, deletes "
+        "or backfills) are recomputed."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sms', action='store_true', help="Queue a warning SMS to parents of newly flagged students.")
+        parser.add_argument('--full', action='store_true', help="Ignore the watermark and recompute every classroom.")
+        parser.add_argument('--window', type=int, default=settings.ABSENTEEISM_WINDOW_DAYS, help="Rolling window (calendar days).")
+        parser.add_argument('--threshold', type=float, default=settings.ABSENTEEISM_RATE_THRESHOLD, help="Absence rate (percent) that raises a flag.")
+        parser.add_argument('--streak', type=int, default=settings.ABSENTEEISM_STREAK_DAYS, help="Consecutive absences that raise a flag.")
+
+    def handle(self, *args, **options):
+        active_year = AcademicYear.objects.filter(is_active=True).first()
+        if not active_year:
+            self.stdout.write("No active academic year; nothing to do.")
+            return
+
+        watermark, _ = JobWatermark.objects.get_or_create(job=JOB_NAME)
+        today = timezone.localdate()
+        started = timezone.now()
+
+        classrooms = Classroom.objects.filter(year=active_year)
+        if watermark.changes_through and not options['full']:
+            classrooms = classrooms.filter(attendance_changed_at__gt=watermark.changes_through - CHANGE_OVERLAP)
+        else:
+            classrooms = classrooms.filter(attendance_changed_at__isnull=False)
+        classrooms = list(classrooms)
+
+        if not classrooms:
+            self.stdout.write(f"No new attendance since {watermark.changes_through}.")
+            return
+
+        # Each changed classroom is recomputed over the window ending on its latest school day,
+        # whichever day the change touched
+        latest_days = dict(
+            DailyClassAttendance.objects.filter(academic_year=active_year, classroom__in=classrooms, date__lte=today)
+            .values('classroom_id').annotate(latest=Max('date')).values_list('classroom_id', 'latest')
+        )
+        classroom_days = {classroom.id: latest_days.get(classroom.id, today) for classroom in classrooms}
+
+        new_flags = []
+        for classroom in classrooms:
+            new_flags += update_absenteeism_flags(
+                active_year,
+                classroom,
+                as_of=classroom_days[classroom.id],
+                window_days=options['window'],
+                rate_threshold=options['threshold'],
+                streak_threshold=options['streak'],
+            )
+
+        sms_queued = queue_absenteeism_sms(new_flags) if options['sms'] and new_flags else 0
+
+        watermark.processed_through = max(classroom_days.values())
+        watermark.changes_through = started
+        watermark.save(update_fields=['processed_through', 'changes_through', 'updated_at'])
+
+        total = AbsenteeismFlag.objects.filter(academic_year=active_year).count()
+        self.stdout.write(
+            f"Recomputed {len(classroom_days)} classroom(s) through {watermark.processed_through}: "
+            f"{len(new_flags)} newly flagged, {total} flagged in total, {sms_queued} SMS queued."
+        )
@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from attendance_app.analytics import freeze_academic_year
+from attendance_app.models import AcademicYear
+
+
+class Command(BaseCommand):
+    help = (
+        "Write the report snapshots of locked academic years (done automatically when a year "
+        "is locked; run this once for years locked earlier)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--year', type=int, help="Only this locked academic year (its start year, e.g. 2025).")
+
+    def handle(self, *args, **options):
+        years = AcademicYear.objects.filter(is_locked=True).order_by('year_start')
+        if options['year']:
+            years = years.filter(year_start=options['year'])
+            if not years:
+                raise CommandError(f"No locked academic year starting in {options['year']}.")
+
+        for year in years:
+            class_rows, student_rows = freeze_academic_year(year)
+            self.stdout.write(f"{year}: {class_rows} class snapshots, {student_rows} student snapshots.")
@@ -0,0 +1,38 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+
+from attendance_app.models import AcademicYear, Attendance, Classroom, DailyClassAttendance, Enrollment
+from attendance_app.utils import aggregate_daily_attendance, refresh_enrollment_counters
+
+
+class Command(BaseCommand):
+    help = "Rebuild the DailyClassAttendance rollup and the enrollment attendance counters from the Attendance table."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--year', type=int, help="Only rebuild this academic year (its start year, e.g. 2025).")
+
+    def handle(self, *args, **options):
+        attendance = Attendance.objects.all()
+        rollups = DailyClassAttendance.objects.all()
+        enrollments = Enrollment.objects.filter(student__isnull=False)
+
+        if options['year']:
+            academic_year = AcademicYear.objects.filter(year_start=options['year']).first()
+            if not academic_year:
+                raise CommandError(f"No academic year starting in {options['year']}.")
+            attendance = attendance.filter(enrollment__academic_year=academic_year)
+            rollups = rollups.filter(academic_year=academic_year)
+            enrollments = enrollments.filter(academic_year=academic_year)
+
+        with transaction.atomic():
+            deleted, _ = rollups.delete()
+            created = DailyClassAttendance.objects.bulk_create(
+                aggregate_daily_attendance(attendance), batch_size=1000
+            )
+            refresh_enrollment_counters(enrollments)
+            Classroom.objects.filter(id__in={rollup.classroom_id for rollup in created}).update(
+                attendance_changed_at=timezone.now()
+            )
+
+        self.stdout.write(f"Removed {deleted} rollup rows, wrote {len(created)}.")
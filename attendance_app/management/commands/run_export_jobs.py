@@ -0,0 +1,58 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from attendance_app.exports import claim_export_jobs, run_export_job, sweep_export_artifacts
+
+# Seconds between retention sweeps of a long-running worker
+SWEEP_INTERVAL = 3600
+
+
+class Command(BaseCommand):
+    help = "Render queued (pending) attendance exports into EXPORT_ROOT and remove expired ones."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1, help="Jobs claimed per round.")
+        parser.add_argument('--poll-interval', type=float, default=2.0, help="Seconds to sleep when the queue is empty.")
+        parser.add_argument('--lease', type=int, default=900, help="Seconds before a stuck 'running' job is retried.")
+        parser.add_argument('--max-attempts', type=int, default=3, help="Claims before a stuck job is marked failed.")
+        parser.add_argument('--retention-days', type=int, default=settings.EXPORT_RETENTION_DAYS,
+                            help="Days finished jobs and their files are kept.")
+        parser.add_argument('--once', action='store_true', help="Drain the queue once and exit (for cron).")
+
+    def sweep(self, retention_days):
+        jobs, files = sweep_export_artifacts(retention_days)
+        if jobs or files:
+            self.stdout.write(f"Expired: {jobs} job(s), {files} file(s)")
+
+    def handle(self, *args, **options):
+        self.stdout.write("Export worker started.")
+        last_sweep = None
+
+        try:
+            while True:
+                close_old_connections()
+                jobs = claim_export_jobs(
+                    limit=options['batch_size'], lease_seconds=options['lease'], max_attempts=options['max_attempts']
+                )
+
+                for job in jobs:
+                    run_export_job(job)
+                    self.stdout.write(f"Export {job.id} ({job.format}): {job.status}")
+                if jobs:
+                    continue
+
+                # Sweep only while idle, at most once per interval
+                if last_sweep is None or time.monotonic() - last_sweep >= SWEEP_INTERVAL:
+                    self.sweep(options['retention_days'])
+                    last_sweep = time.monotonic()
+
+                if options['once']:
+                    break
+                time.sleep(options['poll_interval'])
+        except KeyboardInterrupt:
+            pass
+
+        self.stdout.write("Export worker stopped.")
@@ -0,0 +1,40 @@
+from django.core.management.base import BaseCommand
+
+from attendance_app.sms_simulator import GatewaySimulator, make_simulator_server
+
+
+class Command(BaseCommand):
+    help = "Run a local fake Africa's Talking SMS gateway (use with SMS_BACKEND=...SimulatorBackend)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--host', default='127.0.0.1')
+        parser.add_argument('--port', type=int, default=8025)
+        parser.add_argument('--latency', type=float, default=150, help="Base milliseconds per request.")
+        parser.add_argument('--jitter', type=float, default=50, help="Mean extra milliseconds (exponential tail).")
+        parser.add_argument('--failure-rate', type=float, default=0.0, help="Share of recipients that fail (0-1).")
+        parser.add_argument('--error-rate', type=float, default=0.0, help="Share of requests answered with HTTP 500 (0-1).")
+        parser.add_argument('--rate-limit', type=int, default=0, help="Requests per second before HTTP 429 (0 = off).")
+        parser.add_argument('--balance', type=int, default=None, help="Messages paid for before InsufficientBalance.")
+        parser.add_argument('--seed', type=int, default=None)
+
+    def handle(self, *args, **options):
+        simulator = GatewaySimulator(
+            latency=options['latency'] / 1000,
+            jitter=options['jitter'] / 1000,
+            failure_rate=options['failure_rate'],
+            error_rate=options['error_rate'],
+            rate_limit=options['rate_limit'],
+            balance=options['balance'],
+            seed=options['seed'],
+        )
+        server = make_simulator_server(simulator, options['host'], options['port'])
+        self.stdout.write(f"SMS simulator listening on http://{options['host']}:{options['port']} (GET /stats for counters)")
+
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
+
+        self.stdout.write(f"SMS simulator stopped. {simulator.stats}")
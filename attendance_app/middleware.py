@@ -1,32 +1,55 @@
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
 from django.conf import settings
-from django.contrib.auth import logout
+from django.contrib.auth import alogout, logout
 from django.shortcuts import redirect
 from django.utils.timezone import now
 from datetime import timedelta
 
 
 class AutoLogoutMiddleware:
+    # Runs natively under ASGI too, so async views are not pushed onto a thread
+    sync_capable = True
+    async_capable = True
 
     def __init__(self, get_response):
         self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def is_expired(self, last_activity, current_time):
+        if not last_activity:
+            return False
+        last_activity = now().fromisoformat(last_activity)
+        return current_time - last_activity > timedelta(seconds=settings.SESSION_COOKIE_AGE)
 
     def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
 
         if request.user.is_authenticated:
 
             current_time = now()
 
-            last_activity = request.session.get('last_activity')
-
-            if last_activity:
-                last_activity = now().fromisoformat(last_activity)
-
-                if current_time - last_activity > timedelta(seconds=settings.SESSION_COOKIE_AGE):
-                    logout(request)
-                    return redirect('login')
+            if self.is_expired(request.session.get('last_activity'), current_time):
+                logout(request)
+                return redirect('login')
 
             request.session['last_activity'] = current_time.isoformat()
 
         response = self.get_response(request)
 
-        return response
\ No newline at end of file
+        return response
+
+    async def __acall__(self, request):
+        user = await request.auser()
+        if user.is_authenticated:
+
+            current_time = now()
+
+            if self.is_expired(await request.session.aget('last_activity'), current_time):
+                await alogout(request)
+                return redirect('login')
+
+            await request.session.aset('last_activity', current_time.isoformat())
+
+        return await self.get_response(request)
@@ -0,0 +1,50 @@
+# Generated by Django 5.2.5 on 2026-10-18 19:39
+
+from django.db import migrations, models
+from django.utils import timezone
+
+
+def backfill_sent_date(apps, schema_editor):
+    # Older rows may hold several notices for the same parent on the same day.
+    # Only the latest one gets the dedup key; the rest keep sent_date NULL.
+    SMSLog = apps.get_model('attendance_app', 'SMSLog')
+    seen = set()
+    batch = []
+    for log in SMSLog.objects.order_by('-timestamp', '-id').only('id', 'student_id', 'parent_id', 'kind', 'timestamp').iterator(chunk_size=2000):
+        day = timezone.localdate(log.timestamp) if timezone.is_aware(log.timestamp) else log.timestamp.date()
+        key = (log.student_id, log.parent_id, day, log.kind)
+        if key in seen:
+            continue
+        seen.add(key)
+        log.sent_date = day
+        batch.append(log)
+        if len(batch) >= 2000:
+            SMSLog.objects.bulk_update(batch, ['sent_date'])
+            batch = []
+    if batch:
+        SMSLog.objects.bulk_update(batch, ['sent_date'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('attendance_app', '0038_smslog_outbox'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='smslog',
+            name='kind',
+            field=models.CharField(choices=[('absent', 'Absent Notice'), ('general', 'General')], default='absent', max_length=10),
+        ),
+        migrations.AddField(
+            model_name='smslog',
+            name='sent_date',
+            field=models.DateField(blank=True, null=True),
+        ),
+        migrations.RunPython(backfill_sent_date, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='smslog',
+            constraint=models.UniqueConstraint(fields=('student', 'parent', 'sent_date', 'kind'), name='unique_sms_per_parent_per_day'),
+        ),
+    ]
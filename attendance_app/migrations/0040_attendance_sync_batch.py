@@ -0,0 +1,32 @@
+# Generated by Django 5.2.5 on 2026-10-18 19:42
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('attendance_app', '0039_smslog_dedup_key'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='attendance',
+            name='marked_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.CreateModel(
+            name='SyncBatch',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('idempotency_key', models.CharField(max_length=64)),
+                ('response', models.JSONField(default=dict)),
+                ('created_at', models.DateTimeField(auto_now_add=True, db_index=True)),
+                ('teacher', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='sync_batches', to='attendance_app.teacherprofile')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('teacher', 'idempotency_key'), name='unique_sync_batch_key')],
+            },
+        ),
+    ]
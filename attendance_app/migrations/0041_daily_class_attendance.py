@@ -0,0 +1,71 @@
+# Generated by Django 5.2.5 on 2026-10-18 19:49
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count, Q
+
+
+def build_rollups(apps, schema_editor):
+    Attendance = apps.get_model('attendance_app', 'Attendance')
+    DailyClassAttendance = apps.get_model('attendance_app', 'DailyClassAttendance')
+
+    counts = {}
+    for status in ('present', 'absent', 'sick'):
+        counts[status] = Count('id', filter=Q(status=status))
+        for gender in ('Male', 'Female'):
+            counts[f'{gender.lower()}_{status}'] = Count(
+                'id', filter=Q(status=status, student__user__gender__iexact=gender)
+            )
+
+    rows = (
+        Attendance.objects.filter(enrollment__classroom__isnull=False, enrollment__academic_year__isnull=False)
+        .values('enrollment__academic_year_id', 'enrollment__classroom_id', 'enrollment__stream_id', 'date')
+        .annotate(**counts)
+        .order_by()
+    )
+    DailyClassAttendance.objects.bulk_create(
+        (
+            DailyClassAttendance(
+                academic_year_id=row.pop('enrollment__academic_year_id'),
+                classroom_id=row.pop('enrollment__classroom_id'),
+                stream_id=row.pop('enrollment__stream_id'),
+                **row,
+            )
+            for row in rows.iterator()
+        ),
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('attendance_app', '0040_attendance_sync_batch'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyClassAttendance',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('present', models.PositiveIntegerField(default=0)),
+                ('absent', models.PositiveIntegerField(default=0)),
+                ('sick', models.PositiveIntegerField(default=0)),
+                ('male_present', models.PositiveIntegerField(default=0)),
+                ('male_absent', models.PositiveIntegerField(default=0)),
+                ('male_sick', models.PositiveIntegerField(default=0)),
+                ('female_present', models.PositiveIntegerField(default=0)),
+                ('female_absent', models.PositiveIntegerField(default=0)),
+                ('female_sick', models.PositiveIntegerField(default=0)),
+                ('academic_year', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_attendance', to='attendance_app.academicyear')),
+                ('classroom', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_attendance', to='attendance_app.classroom')),
+                ('stream', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='daily_attendance', to='attendance_app.stream')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['academic_year', 'date'], name='attendance__academi_410aa6_idx')],
+                'constraints': [models.UniqueConstraint(fields=('academic_year', 'classroom', 'stream', 'date'), name='unique_daily_class_attendance')],
+            },
+        ),
+        migrations.RunPython(build_rollups, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,43 @@
+# Generated by Django 5.2.5 on 2026-10-18 19:58
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('attendance_app', '0041_daily_class_attendance'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='academicyear',
+            name='term1_end',
+            field=models.DateField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='academicyear',
+            name='term1_start',
+            field=models.DateField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='academicyear',
+            name='term2_end',
+            field=models.DateField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='academicyear',
+            name='term2_start',
+            field=models.DateField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='academicyear',
+            name='term3_end',
+            field=models.DateField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='academicyear',
+            name='term3_start',
+            field=models.DateField(blank=True, null=True),
+        ),
+    ]
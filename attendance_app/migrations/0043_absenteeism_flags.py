@@ -0,0 +1,50 @@
+# Generated by Django 5.2.5 on 2026-10-18 20:03
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('attendance_app', '0042_academic_year_terms'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='JobWatermark',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('job', models.CharField(max_length=50, unique=True)),
+                ('processed_through', models.DateField(blank=True, null=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.AlterField(
+            model_name='smslog',
+            name='kind',
+            field=models.CharField(choices=[('absent', 'Absent Notice'), ('chronic', 'Chronic Absence Warning'), ('general', 'General')], default='absent', max_length=10),
+        ),
+        migrations.CreateModel(
+            name='AbsenteeismFlag',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('reason', models.CharField(choices=[('rate', 'High absence rate'), ('streak', 'Consecutive absences'), ('both', 'High rate and consecutive absences')], max_length=10)),
+                ('absence_rate', models.FloatField()),
+                ('absent_days', models.PositiveIntegerField()),
+                ('longest_streak', models.PositiveIntegerField()),
+                ('as_of', models.DateField()),
+                ('flagged_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('academic_year', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='absenteeism_flags', to='attendance_app.academicyear')),
+                ('classroom', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='absenteeism_flags', to='attendance_app.classroom')),
+                ('stream', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='absenteeism_flags', to='attendance_app.stream')),
+                ('student', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='absenteeism_flags', to='attendance_app.studentprofile')),
+            ],
+            options={
+                'ordering': ['-absence_rate'],
+                'indexes': [models.Index(fields=['academic_year', 'classroom', 'stream'], name='attendance__academi_e21e36_idx')],
+                'constraints': [models.UniqueConstraint(fields=('student', 'academic_year'), name='unique_absenteeism_flag')],
+            },
+        ),
+    ]
@@ -0,0 +1,49 @@
+# Generated by Django 5.2.5 on 2026-10-18 20:05
+
+from django.db import migrations, models
+from django.db.models import Count, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def count_attendance(apps, schema_editor):
+    Attendance = apps.get_model('attendance_app', 'Attendance')
+    Enrollment = apps.get_model('attendance_app', 'Enrollment')
+
+    def count(status):
+        records = (
+            Attendance.objects.filter(enrollment=OuterRef('pk'), status=status)
+            .order_by().values('enrollment').annotate(total=Count('id')).values('total')
+        )
+        return Coalesce(Subquery(records, output_field=IntegerField()), 0)
+
+    Enrollment.objects.filter(student__isnull=False).update(
+        present_count=count('present'),
+        absent_count=count('absent'),
+        sick_count=count('sick'),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('attendance_app', '0043_absenteeism_flags'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='enrollment',
+            name='absent_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='enrollment',
+            name='present_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='enrollment',
+            name='sick_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(count_attendance, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,50 @@
+# Generated by Django 5.2.5 on 2026-10-18 20:16
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('attendance_app', '0044_enrollment_attendance_counters'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ClassSnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('term', models.CharField(blank=True, choices=[('TERM1', 'Term 1'), ('TERM2', 'Term 2'), ('TERM3', 'Term 3')], max_length=5)),
+                ('students_count', models.PositiveIntegerField(default=0)),
+                ('teacher_names', models.JSONField(default=list)),
+                ('present', models.PositiveIntegerField(default=0)),
+                ('absent', models.PositiveIntegerField(default=0)),
+                ('sick', models.PositiveIntegerField(default=0)),
+                ('days', models.JSONField(default=list)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('academic_year', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='class_snapshots', to='attendance_app.academicyear')),
+                ('classroom', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='snapshots', to='attendance_app.classroom')),
+                ('stream', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='snapshots', to='attendance_app.stream')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['academic_year', 'term', 'classroom'], name='attendance__academi_5bbabd_idx')],
+            },
+        ),
+        migrations.CreateModel(
+            name='StudentSnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('term', models.CharField(choices=[('TERM1', 'Term 1'), ('TERM2', 'Term 2'), ('TERM3', 'Term 3')], max_length=5)),
+                ('metrics', models.JSONField(default=dict)),
+                ('academic_year', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='student_snapshots', to='attendance_app.academicyear')),
+                ('classroom', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='student_snapshots', to='attendance_app.classroom')),
+                ('stream', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='student_snapshots', to='attendance_app.stream')),
+                ('student', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='snapshots', to='attendance_app.studentprofile')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['academic_year', 'term', 'classroom', 'stream'], name='attendance__academi_02b863_idx')],
+                'constraints': [models.UniqueConstraint(fields=('student', 'academic_year', 'term'), name='unique_student_snapshot')],
+            },
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 5.2.5 on 2026-10-18 20:55
+
+from django.db import migrations, models
+from django.utils import timezone
+
+
+def mark_classrooms_with_attendance(apps, schema_editor):
+    # So the next flag_chronic_absenteeism run recomputes every classroom that has attendance
+    Classroom = apps.get_model('attendance_app', 'Classroom')
+    DailyClassAttendance = apps.get_model('attendance_app', 'DailyClassAttendance')
+    Classroom.objects.filter(id__in=DailyClassAttendance.objects.values('classroom_id')).update(
+        attendance_changed_at=timezone.now()
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('attendance_app', '0047_export_job_school_bundle'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='classroom',
+            name='attendance_changed_at',
+            field=models.DateTimeField(blank=True, db_index=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='jobwatermark',
+            name='changes_through',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.RunPython(mark_classrooms_with_attendance, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 5.2.5 on 2026-10-18 21:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('attendance_app', '0050_export_data_version_markers'),
+    ]
+
+    operations = [
+        migrations.RemoveConstraint(
+            model_name='dailyclassattendance',
+            name='unique_daily_class_attendance',
+        ),
+        migrations.AddConstraint(
+            model_name='dailyclassattendance',
+            constraint=models.UniqueConstraint(fields=('academic_year', 'classroom', 'stream', 'date'), name='unique_daily_class_attendance', nulls_distinct=False),
+        ),
+    ]
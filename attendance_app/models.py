@@ -47,6 +47,8 @@ class User(AbstractUser):
         blank=True,
         db_index=True
     )
+    # Last save (names, gender); part of the export data version
+    updated_at = models.DateTimeField(auto_now=True, null=True)
 
     class Meta:
         indexes = [
@@ -65,12 +67,26 @@ class User(AbstractUser):
 # ============================================================
 
 class AcademicYear(models.Model):
+    TERM_CHOICES = [
+        ('TERM1', 'Term 1'),
+        ('TERM2', 'Term 2'),
+        ('TERM3', 'Term 3'),
+    ]
+
     year_start = models.IntegerField(unique=True, db_index=True)
     year_end = models.IntegerField()
     is_active = models.BooleanField(default=False, db_index=True)
     is_locked = models.BooleanField(default=False, db_index=True)
     created_at = models.DateTimeField(auto_now_add=True, db_index=True)
 
+    # Term calendar (optional; reports fall back to the whole year)
+    term1_start = models.DateField(null=True, blank=True)
+    term1_end = models.DateField(null=True, blank=True)
+    term2_start = models.DateField(null=True, blank=True)
+    term2_end = models.DateField(null=True, blank=True)
+    term3_start = models.DateField(null=True, blank=True)
+    term3_end = models.DateField(null=True, blank=True)
+
     class Meta:
         indexes = [
             models.Index(fields=['is_active']),
@@ -80,6 +96,26 @@ class AcademicYear(models.Model):
     def clean(self):
         if self.year_end <= self.year_start:
             raise ValidationError("Year End must be greater than Year Start")
+        for term, label, start, end in self.term_calendar:
+            if bool(start) != bool(end):
+                raise ValidationError(f"{label} needs both a start and an end date")
+            if start and end < start:
+                raise ValidationError(f"{label} must end after it starts")
+
+    @property
+    def term_calendar(self):
+        """[(term, label, start, end), ...] in TERM_CHOICES order."""
+        return [
+            (term, label, getattr(self, f'{term.lower()}_start'), getattr(self, f'{term.lower()}_end'))
+            for term, label in self.TERM_CHOICES
+        ]
+
+    def term_dates(self, term):
+        """(start, end) of a term, or None if the term is unknown or has no dates yet."""
+        for code, _, start, end in self.term_calendar:
+            if code == term and start and end:
+                return start, end
+        return None
 
     def save(self, *args, **kwargs):
         self.year_end = self.year_start + 1
@@ -127,6 +163,10 @@ class Classroom(models.Model):
         db_index=True
     )
 
+    # Set by refresh_daily_rollups on every attendance write, including edits, deletes and
+    # backfills of past days; flag_chronic_absenteeism recomputes classrooms changed since its last run
+    attendance_changed_at = models.DateTimeField(null=True, blank=True, db_index=True)
+
     class Meta:
         constraints = [
             models.UniqueConstraint(
@@ -235,6 +275,8 @@ class StudentProfile(models.Model):
     user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='student_profile', db_index=True)
     admission_number = models.CharField(max_length=20, unique=True, db_index=True)
     date_of_birth = models.DateField(null=True, blank=True, db_index=True)
+    # Last save (admission number); part of the export data version
+    updated_at = models.DateTimeField(auto_now=True, null=True)
 
     class Meta:
         indexes = [
@@ -278,6 +320,13 @@ class Enrollment(models.Model):
         null=True, blank=True, related_name='class_enrollments', db_index=True
     )
     status = models.CharField(max_length=15, choices=STATUS_CHOICES, default='Active', db_index=True)
+    # Last save (roster moves, status changes); part of the export data version
+    updated_at = models.DateTimeField(auto_now=True, null=True)
+
+    # Attendance counters for this enrollment, kept in step with Attendance on every write
+    present_count = models.PositiveIntegerField(default=0)
+    absent_count = models.PositiveIntegerField(default=0)
+    sick_count = models.PositiveIntegerField(default=0)
 
     class Meta:
         constraints = [
@@ -349,6 +398,8 @@ class Attendance(models.Model):
     date = models.DateField(db_index=True)
     status = models.CharField(max_length=10, choices=STATUS_CHOICES, db_index=True)
     marked_by = models.ForeignKey(TeacherProfile, on_delete=models.SET_NULL, null=True, db_index=True)
+    # When the teacher made the mark (client clock for offline sync); the newest mark wins
+    marked_at = models.DateTimeField(null=True, blank=True)
 
     class Meta:
         constraints = [
@@ -368,6 +419,235 @@ class Attendance(models.Model):
             models.Index(fields=['enrollment', 'date']),
         ]
 
+# ============================================================
+# DAILY CLASS ATTENDANCE ROLLUP
+# ============================================================
+
+class DailyClassAttendance(models.Model):
+    """
+    Attendance counts for one class/stream on one day, split by gender.
+    Rebuilt for the touched (classroom, date) keys in the same transaction as
+    every attendance write; `python manage.py rebuild_attendance_rollups` rebuilds all.
+    present/absent/sick include students with no gender recorded.
+    """
+    academic_year = models.ForeignKey(AcademicYear, on_delete=models.CASCADE, related_name='daily_attendance')
+    classroom = models.ForeignKey(Classroom, on_delete=models.CASCADE, related_name='daily_attendance')
+    stream = models.ForeignKey(Stream, on_delete=models.CASCADE, null=True, blank=True, related_name='daily_attendance')
+    date = models.DateField()
+
+    present = models.PositiveIntegerField(default=0)
+    absent = models.PositiveIntegerField(default=0)
+    sick = models.PositiveIntegerField(default=0)
+    male_present = models.PositiveIntegerField(default=0)
+    male_absent = models.PositiveIntegerField(default=0)
+    male_sick = models.PositiveIntegerField(default=0)
+    female_present = models.PositiveIntegerField(default=0)
+    female_absent = models.PositiveIntegerField(default=0)
+    female_sick = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['academic_year', 'classroom', 'stream', 'date'],
+                name='unique_daily_class_attendance',
+                # A class without streams has stream NULL; it still gets one row per day
+                nulls_distinct=False,
+            )
+        ]
+        indexes = [
+            models.Index(fields=['academic_year', 'date']),
+        ]
+
+    def __str__(self):
+        return f"{self.classroom} {self.stream or ''} {self.date}"
+
+# ============================================================
+# CHRONIC ABSENTEEISM FLAGS
+# ============================================================
+
+class AbsenteeismFlag(models.Model):
+    """
+    Current early-warning flag for a student, written by the nightly
+    flag_chronic_absenteeism command. A row exists only while the student qualifies.
+    """
+    REASON_CHOICES = [
+        ('rate', 'High absence rate'),
+        ('streak', 'Consecutive absences'),
+        ('both', 'High rate and consecutive absences'),
+    ]
+
+    student = models.ForeignKey(StudentProfile, on_delete=models.CASCADE, related_name='absenteeism_flags')
+    academic_year = models.ForeignKey(AcademicYear, on_delete=models.CASCADE, related_name='absenteeism_flags')
+    classroom = models.ForeignKey(Classroom, on_delete=models.CASCADE, related_name='absenteeism_flags')
+    stream = models.ForeignKey(
+        Stream, on_delete=models.CASCADE, null=True, blank=True, related_name='absenteeism_flags'
+    )
+    reason = models.CharField(max_length=10, choices=REASON_CHOICES)
+    absence_rate = models.FloatField()
+    absent_days = models.PositiveIntegerField()
+    longest_streak = models.PositiveIntegerField()
+    as_of = models.DateField()
+    flagged_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['student', 'academic_year'], name='unique_absenteeism_flag')
+        ]
+        indexes = [
+            models.Index(fields=['academic_year', 'classroom', 'stream']),
+        ]
+        ordering = ['-absence_rate']
+
+    def __str__(self):
+        return f"{self.student} - {self.get_reason_display()} ({self.absence_rate:.0f}%)"
+
+
+class JobWatermark(models.Model):
+    """
+    How far a scheduled batch job has got: the last attendance date it processed and the
+    Classroom.attendance_changed_at time it has seen changes up to, so the next run starts after it.
+    """
+    job = models.CharField(max_length=50, unique=True)
+    processed_through = models.DateField(null=True, blank=True)
+    changes_through = models.DateTimeField(null=True, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.job}: {self.processed_through}"
+
+# ============================================================
+# LOCKED YEAR SNAPSHOTS
+# ============================================================
+
+class ClassSnapshot(models.Model):
+    """
+    Frozen report totals of a locked academic year for one classroom (stream is null)
+    or one of its streams, over the whole year (term is blank) or one term.
+    Written once by analytics.freeze_academic_year when the year is locked.
+    """
+    academic_year = models.ForeignKey(AcademicYear, on_delete=models.CASCADE, related_name='class_snapshots')
+    classroom = models.ForeignKey(Classroom, on_delete=models.CASCADE, related_name='snapshots')
+    stream = models.ForeignKey(Stream, on_delete=models.CASCADE, null=True, blank=True, related_name='snapshots')
+    term = models.CharField(max_length=5, choices=AcademicYear.TERM_CHOICES, blank=True)
+
+    students_count = models.PositiveIntegerField(default=0)
+    teacher_names = models.JSONField(default=list)
+    present = models.PositiveIntegerField(default=0)
+    absent = models.PositiveIntegerField(default=0)
+    sick = models.PositiveIntegerField(default=0)
+    # [{'date': 'YYYY-MM-DD', 'present', 'absent', 'sick'}, ...] in date order
+    days = models.JSONField(default=list)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['academic_year', 'term', 'classroom']),
+        ]
+
+    def __str__(self):
+        return f"{self.classroom} {self.stream or ''} {self.term or 'year'} ({self.academic_year})"
+
+
+class StudentSnapshot(models.Model):
+    """Frozen AttendanceMatrix metrics of one student for one term of a locked academic year."""
+    academic_year = models.ForeignKey(AcademicYear, on_delete=models.CASCADE, related_name='student_snapshots')
+    student = models.ForeignKey(StudentProfile, on_delete=models.CASCADE, related_name='snapshots')
+    classroom = models.ForeignKey(Classroom, on_delete=models.CASCADE, related_name='student_snapshots')
+    stream = models.ForeignKey(
+        Stream, on_delete=models.CASCADE, null=True, blank=True, related_name='student_snapshots'
+    )
+    term = models.CharField(max_length=5, choices=AcademicYear.TERM_CHOICES)
+    metrics = models.JSONField(default=dict)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['student', 'academic_year', 'term'], name='unique_student_snapshot')
+        ]
+        indexes = [
+            models.Index(fields=['academic_year', 'term', 'classroom', 'stream']),
+        ]
+
+    def __str__(self):
+        return f"{self.student} {self.term} ({self.academic_year})"
+
+# ============================================================
+# EXPORT JOBS
+# ============================================================
+
+class ExportJob(models.Model):
+    """
+    An attendance register export rendered by the run_export_jobs worker.
+    The file is stored under its artifact_key (hash of scope, range, format and the
+    data version), so a repeat request for unchanged data is served at once.
+    A 'zip' job has no classroom: it bundles every class and stream of the year.
+    """
+    FORMAT_CHOICES = [
+        ('xlsx', 'Excel'),
+        ('pdf', 'PDF'),
+        ('zip', 'School bundle (ZIP)'),
+    ]
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('running', 'Running'),
+        ('done', 'Done'),
+        ('failed', 'Failed'),
+    ]
+
+    requested_by = models.ForeignKey(User, on_delete=models.CASCADE, related_name='export_jobs')
+    format = models.CharField(max_length=5, choices=FORMAT_CHOICES)
+    academic_year = models.ForeignKey(AcademicYear, on_delete=models.CASCADE, related_name='export_jobs')
+    classroom = models.ForeignKey(Classroom, on_delete=models.CASCADE, null=True, blank=True, related_name='export_jobs')
+    stream = models.ForeignKey(Stream, on_delete=models.CASCADE, null=True, blank=True, related_name='export_jobs')
+    start_date = models.DateField(null=True, blank=True)
+    end_date = models.DateField(null=True, blank=True)
+
+    data_version = models.CharField(max_length=64)
+    artifact_key = models.CharField(max_length=64, db_index=True)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='pending', db_index=True)
+    progress = models.PositiveSmallIntegerField(default=0)  # percent
+    error = models.TextField(blank=True, default='')
+
+    # Worker bookkeeping, as in the SMS outbox
+    attempts = models.PositiveSmallIntegerField(default=0)
+    claimed_at = models.DateTimeField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'created_at']),
+        ]
+
+    @property
+    def artifact_name(self):
+        return f"{self.artifact_key}.{self.format}"
+
+    def __str__(self):
+        return f"{self.classroom or self.academic_year} {self.stream or ''} {self.format} ({self.status})"
+
+# ============================================================
+# OFFLINE SYNC BATCHES
+# ============================================================
+
+class SyncBatch(models.Model):
+    """
+    One attendance batch uploaded by the offline app.
+    The stored response is replayed when the same idempotency key is retried.
+    """
+    teacher = models.ForeignKey(TeacherProfile, on_delete=models.CASCADE, related_name='sync_batches')
+    idempotency_key = models.CharField(max_length=64)
+    response = models.JSONField(default=dict)
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['teacher', 'idempotency_key'], name='unique_sync_batch_key')
+        ]
+
+    def __str__(self):
+        return f"{self.teacher} - {self.idempotency_key}"
+
 # ============================================================
 # SMS LOGS (OPTIMIZED)
 # ============================================================
@@ -377,6 +657,13 @@ class SMSLog(models.Model):
         ('sent', 'Sent'),
         ('failed', 'Failed'),
         ('pending', 'Pending'),
+        ('sending', 'Sending'),
+    ]
+
+    KIND_CHOICES = [
+        ('absent', 'Absent Notice'),
+        ('chronic', 'Chronic Absence Warning'),
+        ('general', 'General'),
     ]
 
     student = models.ForeignKey(StudentProfile, on_delete=models.CASCADE, db_index=True)
@@ -385,6 +672,15 @@ class SMSLog(models.Model):
     status = models.CharField(max_length=10, choices=STATUS_CHOICES, db_index=True)
     timestamp = models.DateTimeField(auto_now_add=True, db_index=True)
 
+    # Dedup key: one notice of each kind per parent per school (local) day
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES, default='absent')
+    sent_date = models.DateField(null=True, blank=True)
+
+    # Outbox bookkeeping used by the dispatch_sms worker
+    phone_number = models.CharField(max_length=15, blank=True, default='')
+    attempts = models.PositiveSmallIntegerField(default=0)
+    claimed_at = models.DateTimeField(null=True, blank=True)
+
     class Meta:
         indexes = [
             models.Index(fields=['status']),
@@ -392,6 +688,13 @@ class SMSLog(models.Model):
             models.Index(fields=['student']),
             models.Index(fields=['parent']),
             models.Index(fields=['-timestamp']),
+            models.Index(fields=['status', 'timestamp']),
+        ]
+        constraints = [
+            models.UniqueConstraint(
+                fields=['student', 'parent', 'sent_date', 'kind'],
+                name='unique_sms_per_parent_per_day',
+            ),
         ]
 
 # ============================================================
@@ -0,0 +1,28 @@
+from django.conf import settings
+from rest_framework import serializers
+
+from .models import Attendance
+from .utils import ATTENDANCE_CODES
+
+
+class AttendanceMarkSerializer(serializers.Serializer):
+    """One mark from the offline app: {"student": 12, "date": "2026-10-18", "status": "a", "marked_at": "..."}"""
+    student = serializers.IntegerField()
+    date = serializers.DateField()
+    status = serializers.CharField(max_length=10)
+    marked_at = serializers.DateTimeField(required=False)
+
+    def validate_status(self, value):
+        status = ATTENDANCE_CODES.get(value, value)
+        if status not in dict(Attendance.STATUS_CHOICES):
+            raise serializers.ValidationError("Unknown status")
+        return status
+
+
+class AttendanceSyncSerializer(serializers.Serializer):
+    idempotency_key = serializers.CharField(max_length=64)
+    marks = serializers.ListField(
+        child=serializers.DictField(),
+        allow_empty=False,
+        max_length=settings.ATTENDANCE_SYNC_MAX_MARKS,
+    )
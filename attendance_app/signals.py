@@ -0,0 +1,13 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .models import Classroom, Enrollment, TeacherProfile
+from .utils import invalidate_admin_dashboard_cache
+
+
+@receiver([post_save, post_delete], sender=Enrollment)
+@receiver([post_save, post_delete], sender=Classroom)
+@receiver([post_save, post_delete], sender=TeacherProfile)
+def clear_admin_dashboard_cache(sender, **kwargs):
+    """Teacher assignments, enrollments and classrooms feed the cached admin dashboard counters."""
+    invalidate_admin_dashboard_cache()
@@ -0,0 +1,180 @@
+import json
+import threading
+
+import aiohttp
+import requests
+from aiohttp_retry import ExponentialRetry, RetryClient
+from africastalking.Service import AfricasTalkingException
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from django.utils.module_loading import import_string
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+
+def get_sms_session():
+    """Create a keep-alive session with a connection pool and retry strategy"""
+    session = requests.Session()
+
+    # Retry strategy: only retry when the gateway did not accept the request,
+    # so a read timeout never turns into a duplicate SMS
+    retry_strategy = Retry(
+        total=2,
+        connect=2,
+        read=0,
+        backoff_factor=1,
+        status_forcelist=[429, 503],
+        allowed_methods=["POST"]
+    )
+
+    adapter = HTTPAdapter(max_retries=retry_strategy, pool_connections=10, pool_maxsize=10)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+
+    return session
+
+
+def get_async_sms_session(limit=None):
+    """
+    aiohttp counterpart of get_sms_session for the async dispatcher: one pooled
+    connector and the same retry rules (connect errors, 429 and 503 only).
+    Create it inside the running event loop and close it when done.
+    """
+    retry_options = ExponentialRetry(
+        attempts=3,
+        start_timeout=1,
+        statuses={429, 503},
+        exceptions={aiohttp.ClientConnectorError},
+        retry_all_server_errors=False,
+    )
+    connector = aiohttp.TCPConnector(limit=limit or settings.SMS_ASYNC_CONCURRENCY)
+    return RetryClient(client_session=aiohttp.ClientSession(connector=connector), retry_options=retry_options)
+
+
+class BaseSMSBackend:
+    """
+    Base class for settings.SMS_BACKEND (works like EMAIL_BACKEND).
+    send_messages() sends one message to a list of numbers and returns a response
+    shaped like Africa's Talking's: {'SMSMessageData': {'Recipients': [...]}}
+    """
+
+    def send_messages(self, message, recipients):
+        raise NotImplementedError
+
+    async def asend_messages(self, message, recipients, session=None):
+        """Async variant; backends without a native one run send_messages in a thread."""
+        return await sync_to_async(self.send_messages, thread_sensitive=False)(message, recipients)
+
+
+class AfricasTalkingBackend(BaseSMSBackend):
+    """
+    Africa's Talking SMS API on top of one pooled requests session.
+    Timeouts are passed per request instead of touching global socket state.
+    """
+
+    def __init__(self, username=None, api_key=None, sender_id=None, base_url=None, timeout=None):
+        username = username if username is not None else settings.AFRICASTALKING_USERNAME
+        api_key = api_key if api_key is not None else settings.AFRICASTALKING_API_KEY
+        base_url = base_url or self.get_base_url(username)
+
+        self.url = f"{base_url.rstrip('/')}/version1/messaging"
+        self.username = username
+        self.sender_id = sender_id if sender_id is not None else settings.AFRICASTALKING_SENDER_ID
+        self.timeout = timeout or (settings.SMS_CONNECT_TIMEOUT, settings.SMS_READ_TIMEOUT)
+        self.headers = {
+            "Accept": "application/json",
+            "apiKey": api_key,
+        }
+        self.session = get_sms_session()
+
+    def get_base_url(self, username):
+        if settings.AFRICASTALKING_API_URL:
+            return settings.AFRICASTALKING_API_URL
+        domain = "sandbox.africastalking.com" if username == "sandbox" else "africastalking.com"
+        return f"https://api.{domain}"
+
+    def get_form(self, message, recipients):
+        data = {
+            "username": self.username,
+            "to": ",".join(recipients),
+            "message": message,
+            "bulkSMSMode": 1,
+        }
+        if self.sender_id:
+            data["from"] = self.sender_id
+        return data
+
+    def send_messages(self, message, recipients):
+        data = self.get_form(message, recipients)
+        response = self.session.post(self.url, data=data, headers=self.headers, timeout=self.timeout)
+        if not 200 <= response.status_code < 300:
+            raise AfricasTalkingException(response.text)
+        return response.json()
+
+    async def asend_messages(self, message, recipients, session=None):
+        """Send over an aiohttp session from get_async_sms_session() (one is opened if not given)."""
+        if session is None:
+            async with get_async_sms_session() as session:
+                return await self.asend_messages(message, recipients, session)
+
+        connect_timeout, read_timeout = self.timeout
+        timeout = aiohttp.ClientTimeout(sock_connect=connect_timeout, sock_read=read_timeout)
+        data = self.get_form(message, recipients)
+        async with session.post(self.url, data=data, headers=self.headers, timeout=timeout) as response:
+            text = await response.text()
+            if not 200 <= response.status < 300:
+                raise AfricasTalkingException(text)
+            return json.loads(text)
+
+
+class SimulatorBackend(AfricasTalkingBackend):
+    """Africa's Talking backend pointed at the local `run_sms_simulator` server."""
+
+    def get_base_url(self, username):
+        return settings.SMS_SIMULATOR_URL
+
+
+class LocmemBackend(BaseSMSBackend):
+    """Keep messages in memory (LocmemBackend.outbox) and report them all as sent."""
+
+    outbox = []
+
+    def send_messages(self, message, recipients):
+        recipients_data = []
+        for number in recipients:
+            self.outbox.append((number, message))
+            recipients_data.append({
+                'number': number,
+                'status': 'Success',
+                'statusCode': 101,
+                'cost': 'TZS 0.0000',
+                'messageId': f'locmem-{len(self.outbox)}',
+            })
+        return {'SMSMessageData': {
+            'Message': f'Sent to {len(recipients)}/{len(recipients)}',
+            'Recipients': recipients_data,
+        }}
+
+
+_sms_backend = None
+_sms_backend_lock = threading.Lock()
+
+
+def get_sms_backend():
+    """Return the process-wide instance of settings.SMS_BACKEND, building it on first use."""
+    global _sms_backend
+    if _sms_backend is None:
+        with _sms_backend_lock:
+            if _sms_backend is None:
+                _sms_backend = import_string(settings.SMS_BACKEND)()
+    return _sms_backend
+
+
+@receiver(setting_changed)
+def reset_sms_backend(*, setting, **kwargs):
+    """Rebuild the backend when tests override the SMS or gateway settings."""
+    global _sms_backend
+    if setting.startswith(('SMS_', 'AFRICASTALKING_')):
+        _sms_backend = None
@@ -0,0 +1,147 @@
+import json
+import random
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs
+
+# Per-recipient failures Africa's Talking reports with an HTTP 201
+RECIPIENT_FAILURES = [
+    (406, 'UserInBlacklist'),
+    (407, 'CouldNotRoute'),
+    (502, 'RejectedByGateway'),
+]
+
+
+class GatewaySimulator:
+    """
+    Fake Africa's Talking SMS endpoint for load tests without network or credit.
+    latency      -> base seconds per request, plus an exponential tail of mean `jitter`
+    failure_rate -> share of recipients reported as failed
+    error_rate   -> share of requests answered with HTTP 500
+    rate_limit   -> requests per second before HTTP 429 (0 = unlimited)
+    balance      -> messages that can be paid for before InsufficientBalance (None = unlimited)
+    """
+
+    def __init__(self, latency=0.0, jitter=0.0, failure_rate=0.0, error_rate=0.0,
+                 rate_limit=0, balance=None, seed=None):
+        self.latency = latency
+        self.jitter = jitter
+        self.failure_rate = failure_rate
+        self.error_rate = error_rate
+        self.rate_limit = rate_limit
+        self.balance = balance
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.window_start = time.monotonic()
+        self.window_requests = 0
+        self.in_flight = 0
+        self.stats = {'requests': 0, 'rate_limited': 0, 'errors': 0, 'sent': 0, 'failed': 0, 'no_balance': 0,
+                      'max_in_flight': 0}
+
+    def delay(self):
+        with self.lock:
+            tail = self.random.expovariate(1 / self.jitter) if self.jitter else 0
+        return self.latency + tail
+
+    def over_rate_limit(self):
+        if not self.rate_limit:
+            return False
+        now = time.monotonic()
+        if now - self.window_start >= 1:
+            self.window_start = now
+            self.window_requests = 0
+        self.window_requests += 1
+        return self.window_requests > self.rate_limit
+
+    def handle(self, form):
+        """Return (http_status, body, content_type) for one POST to /version1/messaging."""
+        with self.lock:
+            self.in_flight += 1
+            self.stats['max_in_flight'] = max(self.stats['max_in_flight'], self.in_flight)
+        try:
+            return self.respond(form)
+        finally:
+            with self.lock:
+                self.in_flight -= 1
+
+    def respond(self, form):
+        time.sleep(self.delay())
+
+        with self.lock:
+            self.stats['requests'] += 1
+
+            if self.over_rate_limit():
+                self.stats['rate_limited'] += 1
+                return 429, 'Too Many Requests', 'text/plain'
+
+            if self.random.random() < self.error_rate:
+                self.stats['errors'] += 1
+                return 500, 'Internal Server Error', 'text/plain'
+
+            numbers = [n for n in form.get('to', [''])[0].split(',') if n]
+            recipients = []
+            for number in numbers:
+                if self.balance is not None and self.balance <= 0:
+                    self.stats['no_balance'] += 1
+                    recipients.append({'number': number, 'status': 'InsufficientBalance',
+                                       'statusCode': 405, 'cost': '0', 'messageId': 'None'})
+                    continue
+
+                if self.random.random() < self.failure_rate:
+                    code, status = self.random.choice(RECIPIENT_FAILURES)
+                    self.stats['failed'] += 1
+                    recipients.append({'number': number, 'status': status,
+                                       'statusCode': code, 'cost': '0', 'messageId': 'None'})
+                    continue
+
+                if self.balance is not None:
+                    self.balance -= 1
+                self.stats['sent'] += 1
+                recipients.append({'number': number, 'status': 'Success', 'statusCode': 101,
+                                   'cost': 'TZS 20.0000', 'messageId': f'ATXid_{uuid.uuid4().hex}'})
+
+        sent = sum(1 for r in recipients if r['status'] == 'Success')
+        body = {'SMSMessageData': {
+            'Message': f'Sent to {sent}/{len(recipients)} Total Cost: TZS {sent * 20}.0000',
+            'Recipients': recipients,
+        }}
+        return 201, json.dumps(body), 'application/json'
+
+
+def make_simulator_server(simulator, host='127.0.0.1', port=8025):
+    """Build a threaded HTTP server that answers like the Africa's Talking SMS API."""
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+        disable_nagle_algorithm = True
+
+        def reply(self, status, body, content_type):
+            payload = body.encode()
+            self.send_response(status)
+            self.send_header('Content-Type', content_type)
+            self.send_header('Content-Length', str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def do_POST(self):
+            length = int(self.headers.get('Content-Length') or 0)
+            form = parse_qs(self.rfile.read(length).decode())
+            if self.path.rstrip('/') != '/version1/messaging':
+                self.reply(404, 'Not Found', 'text/plain')
+                return
+            self.reply(*simulator.handle(form))
+
+        def do_GET(self):
+            if self.path.rstrip('/') != '/stats':
+                self.reply(404, 'Not Found', 'text/plain')
+                return
+            with simulator.lock:
+                stats = dict(simulator.stats, balance=simulator.balance)
+            self.reply(200, json.dumps(stats), 'application/json')
+
+        def log_message(self, *args):
+            pass
+
+    return ThreadingHTTPServer((host, port), Handler)
@@ -0,0 +1,100 @@
+"""
+Synthetic school data for the benchmark commands.
+Everything is written with bulk_create, so callers should run it inside a
+transaction they roll back (the benchmarks do).
+"""
+import random
+from datetime import timedelta
+
+from django.utils import timezone
+
+from .models import (
+    AcademicYear,
+    Attendance,
+    Classroom,
+    DailyClassAttendance,
+    Enrollment,
+    Stream,
+    StudentProfile,
+    TeacherProfile,
+    User,
+)
+from .utils import aggregate_daily_attendance, refresh_enrollment_counters
+
+FORMS = [name for name, _ in Classroom.FORM_CHOICES]
+STREAMS = ['A', 'B', 'C', 'D', 'E', 'F']
+
+
+def school_days(count, end=None):
+    """The last `count` weekdays up to `end` (today by default), oldest first."""
+    day = end or timezone.localdate()
+    days = []
+    while len(days) < count:
+        if day.weekday() < 5:
+            days.append(day)
+        day -= timedelta(days=1)
+    return days[::-1]
+
+
+def build_synthetic_year(students=3000, days=190, forms=4, seed=0):
+    """
+    A new academic year with `students` spread over the first `forms` forms x streams A-F,
+    one class teacher per stream and `days` school days of attendance
+    (about 90% present, 7% absent, 3% sick). Returns the AcademicYear.
+    """
+    rng = random.Random(seed)
+    last_year = AcademicYear.objects.order_by('-year_start').values_list('year_start', flat=True).first()
+    year = AcademicYear.objects.create(year_start=(last_year or 2000) + 100)
+    tag = f'bench{year.year_start}'
+
+    groups = []
+    for form in FORMS[:forms]:
+        classroom = Classroom.objects.create(name=form, year=year)
+        for name in STREAMS:
+            groups.append((classroom, Stream.objects.create(name=name, classroom=classroom)))
+
+    teacher_users = User.objects.bulk_create([
+        User(username=f'{tag}_teacher{i}', role='teacher') for i in range(len(groups))
+    ])
+    teachers = TeacherProfile.objects.bulk_create([TeacherProfile(user=user) for user in teacher_users])
+    Enrollment.objects.bulk_create([
+        Enrollment(class_teacher=teacher, classroom=classroom, stream=stream, academic_year=year)
+        for teacher, (classroom, stream) in zip(teachers, groups)
+    ])
+
+    users = User.objects.bulk_create([
+        User(
+            username=f'{tag}_student{i}',
+            first_name=f'Student{i}',
+            role='student',
+            gender='Male' if i % 2 else 'Female',
+        )
+        for i in range(students)
+    ], batch_size=1000)
+    profiles = StudentProfile.objects.bulk_create([
+        StudentProfile(user=user, admission_number=f'{tag}-{i:05d}') for i, user in enumerate(users)
+    ], batch_size=1000)
+    enrollments = Enrollment.objects.bulk_create([
+        Enrollment(student=student, classroom=groups[i % len(groups)][0], stream=groups[i % len(groups)][1],
+                   academic_year=year)
+        for i, student in enumerate(profiles)
+    ], batch_size=1000)
+
+    statuses = ['present', 'absent', 'sick']
+    for day in school_days(days):
+        Attendance.objects.bulk_create([
+            Attendance(
+                student_id=enrollment.student_id,
+                enrollment=enrollment,
+                date=day,
+                status=rng.choices(statuses, weights=(90, 7, 3))[0],
+            )
+            for enrollment in enrollments
+        ], batch_size=5000)
+
+    DailyClassAttendance.objects.bulk_create(
+        aggregate_daily_attendance(Attendance.objects.filter(enrollment__academic_year=year)),
+        batch_size=1000,
+    )
+    refresh_enrollment_counters(Enrollment.objects.filter(academic_year=year, student__isnull=False))
+    return year
@@ -1,3 +1,1432 @@
-from django.test import TestCase
+import io
+import json
+import os
+import tempfile
+import threading
+import zipfile
+import time
+import tracemalloc
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import mock
 
-# Create your tests here.
+import africastalking
+import numpy as np
+import openpyxl
+import pypdf
+import requests
+
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.db import IntegrityError, connection
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from .analytics import AttendanceMatrix
+from .exports import PDF_CONTENT_TYPE, XLSX_CONTENT_TYPE, ZIP_CONTENT_TYPE, get_export_storage, write_school_bundle
+from .models import (
+    AbsenteeismFlag,
+    ClassSnapshot,
+    JobWatermark,
+    User,
+    TeacherProfile,
+    StudentProfile,
+    Classroom,
+    Stream,
+    AcademicYear,
+    Attendance,
+    DailyClassAttendance,
+    Enrollment,
+    ExportJob,
+    ParentProfile,
+    SchoolSettings,
+    SMSLog,
+    SyncBatch,
+)
+from .sms_backends import AfricasTalkingBackend, LocmemBackend
+from .sms_simulator import GatewaySimulator, make_simulator_server
+from .synthetic_data import build_synthetic_year, school_days
+from .utils import (
+    ADMIN_DASHBOARD_CACHE_OUTCOMES,
+    SMSGatewayUnavailable,
+    adispatch_pending_sms,
+    dispatch_pending_sms,
+    get_admin_dashboard_counters,
+    get_enrollments_by_student,
+    queue_absenteeism_sms,
+    refresh_daily_rollups,
+    send_bulk_sms,
+    sms_breaker,
+    upsert_attendance,
+)
+
+
+# The SMS dispatcher calls the gateway from worker threads; keep the breaker
+# state in process memory so those threads don't contend for the test database.
+LOCMEM_CACHES = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+
+
+def make_class(size, year_start=2026):
+    """Build an active year with one teacher and `size` enrolled students."""
+    year = AcademicYear.objects.create(year_start=year_start, is_active=True)
+    classroom = Classroom.objects.create(name='Form I', year=year)
+    stream = Stream.objects.create(name='A', classroom=classroom)
+
+    teacher_user = User.objects.create_user(username='teacher', password='pass', role='teacher')
+    teacher = TeacherProfile.objects.create(user=teacher_user)
+    Enrollment.objects.create(class_teacher=teacher, classroom=classroom, stream=stream, academic_year=year)
+
+    users = User.objects.bulk_create([
+        User(
+            username=f'student{i}',
+            first_name=f'Student{i}',
+            role='student',
+            gender='Male' if i % 2 else 'Female',
+        )
+        for i in range(size)
+    ])
+    students = StudentProfile.objects.bulk_create([
+        StudentProfile(user=user, admission_number=f'ADM{i:05d}')
+        for i, user in enumerate(users)
+    ])
+    Enrollment.objects.bulk_create([
+        Enrollment(student=student, classroom=classroom, stream=stream, academic_year=year)
+        for student in students
+    ])
+    return year, classroom, stream, teacher, students
+
+
+def make_other_student(year):
+    """A student enrolled in another classroom of the same year."""
+    classroom = Classroom.objects.create(name='Form II', year=year)
+    user = User.objects.create_user(username='other_student', role='student')
+    student = StudentProfile.objects.create(user=user, admission_number='OTHER')
+    Enrollment.objects.create(student=student, classroom=classroom, academic_year=year)
+    return student
+
+
+class MarkAttendanceTests(TestCase):
+
+    def setUp(self):
+        self.year, self.classroom, self.stream, self.teacher, self.students = make_class(160)
+        self.client.force_login(self.teacher.user)
+
+    def test_whole_register_in_one_submit(self):
+        register = {s.id: 's' if i % 10 == 0 else 'p' for i, s in enumerate(self.students)}
+
+        response = self.client.get(reverse('mark_attendance'))
+        self.assertEqual(len(response.context['students']), 160)
+
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.post(reverse('mark_attendance'), {'register': json.dumps(register)})
+        self.assertEqual(response.status_code, 302)
+
+        today = timezone.localdate()
+        self.assertEqual(Attendance.objects.filter(date=today).count(), 160)
+        self.assertEqual(Attendance.objects.filter(date=today, status='sick').count(), 16)
+        self.assertFalse(Attendance.objects.filter(enrollment__isnull=True).exists())
+        self.assertLess(len(ctx.captured_queries), 21)
+
+    def test_resubmit_overwrites_existing_rows(self):
+        url = reverse('mark_attendance')
+        self.client.post(url, {f'attendance_{s.id}': 'present' for s in self.students})
+        self.client.post(url, {'register': json.dumps({s.id: 's' for s in self.students})})
+
+        register = Attendance.objects.filter(date=timezone.localdate())
+        self.assertEqual(register.count(), 160)
+        self.assertEqual(register.filter(status='sick').count(), 160)
+
+    def test_malformed_register_is_rejected(self):
+        response = self.client.post(reverse('mark_attendance'), {'register': '[1, 2'})
+
+        self.assertRedirects(response, reverse('mark_attendance'), fetch_redirect_response=False)
+        self.assertFalse(Attendance.objects.exists())
+
+
+class DailyClassAttendanceTests(TestCase):
+
+    def setUp(self):
+        self.year, self.classroom, self.stream, self.teacher, self.students = make_class(40)
+        self.client.force_login(self.teacher.user)
+        # Even index -> Female, odd -> Male; every fourth student absent, every tenth sick
+        register = {
+            s.id: 's' if i % 10 == 0 else 'a' if i % 4 == 1 else 'p'
+            for i, s in enumerate(self.students)
+        }
+        self.client.post(reverse('mark_attendance'), {'register': json.dumps(register)})
+        self.today = timezone.localdate()
+
+    def rollup(self):
+        return DailyClassAttendance.objects.get(
+            academic_year=self.year, classroom=self.classroom, stream=self.stream, date=self.today
+        )
+
+    def expected_counts(self):
+        counts = {}
+        for record in Attendance.objects.filter(date=self.today).select_related('student__user'):
+            gender = record.student.user.gender.lower()
+            counts[record.status] = counts.get(record.status, 0) + 1
+            counts[f'{gender}_{record.status}'] = counts.get(f'{gender}_{record.status}', 0) + 1
+        return counts
+
+    def assertRollupMatches(self):
+        row = self.rollup()
+        for field, expected in self.expected_counts().items():
+            self.assertEqual(getattr(row, field), expected, field)
+        self.assertEqual(row.present + row.absent + row.sick, Attendance.objects.filter(date=self.today).count())
+
+    def test_rollup_written_with_register(self):
+        self.assertEqual(DailyClassAttendance.objects.count(), 1)
+        self.assertRollupMatches()
+        self.assertEqual(self.rollup().absent, 10)
+        self.assertEqual(self.rollup().male_absent, 10)
+
+        response = self.client.get(reverse('view_attendance'))
+        self.assertEqual(response.context['total_absent'], 10)
+        self.assertEqual(response.context['male_absent'], 10)
+        self.assertEqual(response.context['female_sick'], 4)
+
+    def test_edit_and_delete_update_rollup(self):
+        record = Attendance.objects.filter(date=self.today, status='present').first()
+        self.client.post(reverse('edit_attendance', args=[record.pk]), {'status': 'absent'})
+        self.assertRollupMatches()
+
+        self.client.post(reverse('delete_attendance', args=[record.pk]), HTTP_X_REQUESTED_WITH='XMLHttpRequest')
+        self.assertRollupMatches()
+        self.assertEqual(self.rollup().present + self.rollup().absent + self.rollup().sick, 39)
+
+    def test_class_without_streams_keeps_one_rollup_per_day(self):
+        other = make_other_student(self.year)
+        enrollment = other.enrollments.get()
+        for status in ('absent', 'present'):
+            upsert_attendance([Attendance(student=other, enrollment=enrollment, date=self.today, status=status)])
+        refresh_daily_rollups([(self.year.id, enrollment.classroom_id, self.today)])
+
+        row = DailyClassAttendance.objects.get(classroom=enrollment.classroom, date=self.today)
+        self.assertIsNone(row.stream)
+        self.assertEqual((row.present, row.absent), (1, 0))
+
+    def test_rebuild_command_reproduces_rollup(self):
+        before = list(DailyClassAttendance.objects.values(*[f.attname for f in DailyClassAttendance._meta.concrete_fields if f.name != 'id']))
+        DailyClassAttendance.objects.update(present=0, absent=0)
+
+        call_command('rebuild_attendance_rollups', year=self.year.year_start, stdout=io.StringIO())
+
+        after = list(DailyClassAttendance.objects.values(*before[0].keys()))
+        self.assertEqual(after, before)
+
+
+class ViewAttendanceTests(TestCase):
+
+    def setUp(self):
+        self.year, self.classroom, self.stream, self.teacher, self.students = make_class(200)
+        self.client.force_login(self.teacher.user)
+        make_other_student(self.year)
+        register = {s.id: 'a' if i % 5 == 0 else 'p' for i, s in enumerate(self.students)}
+        self.client.post(reverse('mark_attendance'), {'register': json.dumps(register)})
+
+    def test_statistics_for_200_students(self):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(reverse('view_attendance'))
+
+        context = response.context
+        self.assertEqual(context['students_count'], 200)
+        self.assertEqual((context['male_count'], context['female_count']), (100, 100))
+        self.assertEqual((context['total_present'], context['total_absent'], context['total_sick']), (160, 40, 0))
+        self.assertEqual((context['female_absent'], context['male_absent']), (20, 20))
+        self.assertEqual(context['present_percentage'], 80.0)
+        self.assertEqual(context['attendance_records'].paginator.count, 200)
+        # The roster is a subquery, not a 200-id IN list
+        self.assertFalse(any(f"{self.students[-1].id}, " in query['sql'] for query in ctx.captured_queries))
+        self.assertLessEqual(len(ctx.captured_queries), 16)
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class ReportCardTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.year, self.classroom, self.stream, self.teacher, self.students = make_class(30)
+        for i in range(23):
+            classroom = Classroom.objects.create(name=f'Form {i + 2}', year=self.year)
+            user = User.objects.create_user(username=f'pupil{i}', role='student')
+            student = StudentProfile.objects.create(user=user, admission_number=f'P{i:03d}')
+            Enrollment.objects.create(student=student, classroom=classroom, academic_year=self.year)
+        self.admin = User.objects.create_user(username='admin', password='pass', role='admin')
+
+    def get_cards(self):
+        response = self.client.get(reverse('attendance_report'))
+        return {classroom.id: classroom for classroom in response.context['classrooms']}
+
+    def test_cards_use_grouped_queries(self):
+        self.client.force_login(self.admin)
+        with CaptureQueriesContext(connection) as ctx:
+            cards = self.get_cards()
+
+        self.assertEqual(len(cards), 24)
+        self.assertEqual(cards[self.classroom.id].total_students, 30)
+        self.assertEqual(sum(card.total_students for card in cards.values()), 53)
+        self.assertLessEqual(len(ctx.captured_queries), 13)
+
+    def test_new_attendance_clears_cached_counts(self):
+        self.client.force_login(self.admin)
+        self.assertEqual(self.get_cards()[self.classroom.id].absent, 0)
+
+        self.client.force_login(self.teacher.user)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('mark_attendance'), {'register': json.dumps({s.id: 'a' for s in self.students})})
+
+        self.client.force_login(self.admin)
+        card = self.get_cards()[self.classroom.id]
+        self.assertEqual((card.present, card.absent), (0, 30))
+
+
+class AcademicYearSummaryTests(TestCase):
+
+    def test_totals_grouped_per_classroom(self):
+        year = build_synthetic_year(students=96, days=5)
+        admin = User.objects.create_user(username='admin', role='admin')
+        self.client.force_login(admin)
+
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(reverse('academic_year_summary'), {'year': year.id})
+        summary = response.context['summary_data']
+
+        self.assertEqual(len(summary), 4)
+        self.assertEqual(sum(row['students_count'] for row in summary), 96)
+        self.assertTrue(all(len(row['teachers']) == 6 for row in summary))
+        for row in summary:
+            records = Attendance.objects.filter(enrollment__classroom=row['classroom'])
+            self.assertEqual(row['total_absent'], records.filter(status='absent').count())
+            self.assertEqual(row['total_present'] + row['total_absent'] + row['total_sick'], records.count())
+        self.assertLess(len(ctx.captured_queries), 15)
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class TermReportTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        build_synthetic_year(students=48, days=10, seed=1)  # older history
+        self.year = build_synthetic_year(students=48, days=10)
+        self.days = school_days(10)
+        self.admin = User.objects.create_user(username='admin', role='admin')
+        self.client.force_login(self.admin)
+
+    def set_term(self, start, end):
+        response = self.client.post(reverse('edit_academic_year', args=[self.year.id]), {
+            'year_start': self.year.year_start, 'term1_start': start, 'term1_end': end,
+        })
+        self.assertRedirects(response, reverse('academic_years'), fetch_redirect_response=False)
+        self.year.refresh_from_db()
+
+    def records(self, start, end, **filters):
+        return Attendance.objects.filter(
+            enrollment__academic_year=self.year, date__range=(start, end), **filters
+        )
+
+    def test_term_calendar_is_saved_and_validated(self):
+        self.set_term(self.days[2], self.days[6])
+        self.assertEqual(self.year.term_dates('TERM1'), (self.days[2], self.days[6]))
+        self.assertIsNone(self.year.term_dates('TERM2'))
+
+        self.set_term(self.days[6], self.days[2])
+        self.assertEqual(self.year.term_dates('TERM1'), (self.days[2], self.days[6]))
+
+    def test_summary_and_cards_for_a_term(self):
+        start, end = self.days[2], self.days[6]
+        self.set_term(start, end)
+
+        response = self.client.get(reverse('academic_year_summary'), {'year': self.year.id, 'term': 'TERM1'})
+        summary = response.context['summary_data']
+        self.assertEqual(
+            sum(row['total_absent'] for row in summary),
+            self.records(start, end, status='absent').count()
+        )
+        self.assertEqual(
+            sum(row['total_present'] + row['total_absent'] + row['total_sick'] for row in summary),
+            self.records(start, end).count()
+        )
+
+        response = self.client.get(reverse('attendance_report'), {
+            'year': self.year.id, 'start': start.isoformat(), 'end': end.isoformat(),
+        })
+        cards = response.context['classrooms']
+        self.assertEqual(sum(card.sick for card in cards), self.records(start, end, status='sick').count())
+
+    def test_term_without_dates_is_reported(self):
+        self.set_term(self.days[2], self.days[6])
+
+        response = self.client.get(reverse('academic_year_summary'), {'year': self.year.id, 'term': 'TERM2'})
+        self.assertEqual(response.context['selected_term'], '')
+        self.assertEqual(response.context['terms'], [('TERM1', 'Term 1')])
+        self.assertIn('Term 2 has no dates set', [str(m) for m in response.context['messages']][-1])
+
+        response = self.client.get(reverse('attendance_report'), {'year': self.year.id, 'term': 'TERM1'})
+        self.assertEqual(response.context['selected_term'], 'TERM1')
+        self.assertEqual(len(response.context['messages']), 0)
+
+    def test_class_view_range_by_day(self):
+        classroom = Classroom.objects.filter(year=self.year).first()
+        response = self.client.get(reverse('view_class_attendance', args=[classroom.id]), {
+            'year': self.year.id, 'start': self.days[0].isoformat(),
+        })
+        range_days = response.context['range_days']
+        self.assertEqual([row['date'] for row in range_days], self.days)
+        self.assertEqual(
+            response.context['range_totals']['present'],
+            self.records(self.days[0], self.days[-1], status='present', enrollment__classroom=classroom).count()
+        )
+
+
+class YearSnapshotTests(TestCase):
+
+    def setUp(self):
+        self.year = build_synthetic_year(students=48, days=10, forms=1)
+        self.days = school_days(10)
+        self.year.term1_start, self.year.term1_end = self.days[2], self.days[6]
+        self.year.save()
+        self.classroom = Classroom.objects.get(year=self.year)
+        self.stream = self.classroom.streams.order_by('name').first()
+        self.client.force_login(User.objects.create_user(username='admin', role='admin'))
+
+    def reports(self):
+        summary = self.client.get(reverse('academic_year_summary'), {'year': self.year.id})
+        term_summary = self.client.get(reverse('academic_year_summary'), {'year': self.year.id, 'term': 'TERM1'})
+        class_view = self.client.get(reverse('view_class_attendance', args=[self.classroom.id]), {
+            'year': self.year.id, 'term': 'TERM1', 'stream': self.stream.id,
+        })
+        students = self.client.get(reverse('manage_student'), {'year': self.year.id})
+        return {
+            'summary': [dict(row, classroom=row['classroom'].id) for row in summary.context['summary_data']],
+            'term_summary': [row['total_absent'] for row in term_summary.context['summary_data']],
+            'range_totals': {k: class_view.context['range_totals'][k] for k in ('present', 'absent', 'sick')},
+            'range_days': class_view.context['range_days'],
+            'analytics': [dict(row, student=row['student'].id) for row in class_view.context['student_analytics']],
+            'student_counts': [classroom.student_count for classroom in students.context['classrooms']],
+        }
+
+    def test_locked_year_served_from_snapshots(self):
+        live = self.reports()
+        self.assertEqual(live['student_counts'], [48])
+        self.assertEqual(len(live['analytics']), 8)
+
+        self.year.is_locked = True
+        self.year.is_active = False
+        self.year.save()
+        call_command('freeze_academic_years', stdout=io.StringIO())
+        self.assertEqual(ClassSnapshot.objects.filter(academic_year=self.year, term='').count(), 7)
+
+        # The raw rows are no longer read at all
+        Attendance.objects.filter(enrollment__academic_year=self.year).delete()
+        DailyClassAttendance.objects.filter(academic_year=self.year).delete()
+        with CaptureQueriesContext(connection) as ctx:
+            frozen = self.reports()
+        self.assertEqual(frozen, live)
+        self.assertFalse([
+            query for query in ctx.captured_queries
+            if 'attendance_app_attendance"' in query['sql'] or 'dailyclassattendance' in query['sql']
+        ])
+
+    def test_custom_range_on_locked_year_reads_rollup(self):
+        self.year.is_locked = True
+        self.year.save()
+        call_command('freeze_academic_years', stdout=io.StringIO())
+        response = self.client.get(reverse('view_class_attendance', args=[self.classroom.id]), {
+            'year': self.year.id, 'start': self.days[0].isoformat(),
+        })
+        self.assertEqual(len(response.context['range_days']), 10)
+
+
+class StudentExportTests(TestCase):
+
+    def export(self, user, **params):
+        self.client.force_login(user)
+        response = self.client.get(reverse('export_students_excel'), params)
+        self.assertEqual(response['Content-Type'], 'text/csv')
+        return response
+
+    def test_teacher_gets_their_class(self):
+        year, classroom, stream, teacher, students = make_class(5)
+        make_other_student(year)
+        lines = b''.join(self.export(teacher.user).streaming_content).decode().splitlines()
+        self.assertEqual(len(lines), 6)
+        self.assertEqual(lines[1], 'ADM00000,Student0 ,,—,Female,Form I,A')
+
+    def test_admin_scopes(self):
+        build_synthetic_year(students=30, days=0, forms=1)
+        year = build_synthetic_year(students=40, days=0, forms=1)
+        admin = User.objects.create_user(username='admin', role='admin')
+
+        response = self.export(admin, scope='year', year=year.id)
+        self.assertIn(f'students_{year.year_start}_{year.year_end}.csv', response['Content-Disposition'])
+        self.assertEqual(len(b''.join(response.streaming_content).splitlines()), 41)
+        response = self.export(admin, scope='school')
+        self.assertEqual(len(b''.join(response.streaming_content).splitlines()), 71)
+
+    def test_memory_stays_flat_for_50k_students(self):
+        year = build_synthetic_year(students=50000, days=0, forms=4)
+        admin = User.objects.create_user(username='admin', role='admin')
+        self.client.force_login(admin)
+
+        tracemalloc.start()
+        try:
+            response = self.client.get(reverse('export_students_excel'), {'scope': 'year', 'year': year.id})
+            rows = 0
+            for _ in response.streaming_content:
+                rows += 1
+                if rows == 5000:
+                    _, early_peak = tracemalloc.get_traced_memory()
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+
+        self.assertEqual(rows, 50001)
+        # Only one chunk of rows is held at a time: ten times the rows, no more memory
+        self.assertLess(peak, early_peak * 1.2)
+
+
+class AttendanceMatrixTests(TestCase):
+
+    def setUp(self):
+        self.year, self.classroom, self.stream, self.teacher, self.students = make_class(3)
+        self.days = school_days(10)
+        # Student 0: absent on days 1-3 and 5-6; student 1: always absent; student 2: never marked
+        patterns = {0: 'PAAAPAAPPP', 1: 'AAAAAAAAAA'}
+        enrollments = get_enrollments_by_student(self.students, self.year)
+        Attendance.objects.bulk_create([
+            Attendance(
+                student=self.students[index],
+                enrollment=enrollments[self.students[index].id],
+                date=day,
+                status={'P': 'present', 'A': 'absent'}[code],
+            )
+            for index, pattern in patterns.items()
+            for day, code in zip(self.days, pattern)
+        ])
+
+    def test_metrics_for_every_student(self):
+        matrix = AttendanceMatrix.load(self.year, self.classroom)
+        self.assertEqual(matrix.matrix.dtype, np.int8)
+        self.assertEqual(matrix.matrix.shape, (3, 10))
+        self.assertEqual(matrix.days, self.days)
+
+        metrics = matrix.student_metrics()
+        first, always_absent, unmarked = (metrics[s.id] for s in self.students)
+        self.assertEqual(first['attendance_rate'], 50.0)
+        self.assertEqual(first['longest_absence_streak'], 3)
+        self.assertEqual(sum(first['absences_by_weekday'].values()), 5)
+        self.assertEqual(always_absent['longest_absence_streak'], 10)
+        self.assertEqual(always_absent['attendance_rate'], 0.0)
+        self.assertIsNone(unmarked['attendance_rate'])
+        self.assertIsNone(unmarked['most_missed_weekday'])
+
+        # Last school day's window covers the last 28 calendar days (all 10 days here)
+        self.assertEqual(first['four_week_rate'], 50.0)
+        self.assertEqual(matrix.rolling_rate(window_days=1)[0].tolist(), [100.0, 0, 0, 0, 100.0, 0, 0, 100.0, 100.0, 100.0])
+
+    def test_range_limits_columns(self):
+        matrix = AttendanceMatrix.load(self.year, self.classroom, start=self.days[4], end=self.days[7])
+        self.assertEqual(matrix.days, self.days[4:8])
+        self.assertEqual(matrix.student_metrics()[self.students[0].id]['longest_absence_streak'], 2)
+
+    def test_analytics_in_class_view_and_excel_export(self):
+        admin = User.objects.create_user(username='admin', role='admin')
+        self.client.force_login(admin)
+        response = self.client.get(reverse('view_class_attendance', args=[self.classroom.id]), {
+            'year': self.year.id, 'start': self.days[0].isoformat(),
+        })
+        rows = {row['student'].id: row for row in response.context['student_analytics']}
+        self.assertEqual(rows[self.students[1].id]['absent'], 10)
+
+        self.client.force_login(self.teacher.user)
+        response = self.client.get(reverse('attendance_export_excel'), {'start': self.days[0].isoformat()})
+        workbook = openpyxl.load_workbook(io.BytesIO(b''.join(response.streaming_content)))
+        sheet = workbook['Student Analytics']
+        self.assertEqual(sheet.max_row, 4)
+
+
+class AttendanceExcelExportTests(TestCase):
+
+    def setUp(self):
+        self.year, self.classroom, self.stream, self.teacher, self.students = make_class(6)
+        self.days = school_days(5)
+        enrollments = get_enrollments_by_student(self.students, self.year)
+        # Students 0-2 are female, 3-5 alternate; student i is absent on day i
+        upsert_attendance([
+            Attendance(student=student, enrollment=enrollments[student.id], date=day,
+                       status='absent' if d == i else 'sick' if i == 5 else 'present')
+            for i, student in enumerate(self.students)
+            for d, day in enumerate(self.days)
+        ])
+        self.client.force_login(self.teacher.user)
+
+    def export(self, **params):
+        response = self.client.get(reverse('attendance_export_excel'), params)
+        self.assertEqual(response['Content-Type'], XLSX_CONTENT_TYPE)
+        workbook = openpyxl.load_workbook(io.BytesIO(b''.join(response.streaming_content)))
+        return {sheet.title: list(sheet.iter_rows(values_only=True)) for sheet in workbook}
+
+    def test_single_day_summary_from_one_query(self):
+        with CaptureQueriesContext(connection) as ctx:
+            sheets = self.export(date=self.days[0].isoformat())
+        rows = sheets['Attendance']
+        self.assertEqual(list(sheets), ['Attendance'])
+        self.assertEqual(rows[5][:2], ('Total Students', 6))
+        self.assertEqual(rows[7][:2], ('Absent', '1 (16.7%)'))
+        # Genders are stored capitalized; the old lowercase filter always reported zero
+        self.assertEqual(rows[11][:5], ('Male', 3, 'Present 2', 'Absent 0', 'Sick 1'))
+        self.assertEqual(rows[12][:5], ('Female', 3, 'Present 2', 'Absent 1', 'Sick 0'))
+        self.assertEqual(rows[14][:2], ('No', 'Admission No'))
+        self.assertEqual(len(rows), 15 + 6)
+        self.assertEqual(sum('"attendance_app_attendance"' in q['sql'] for q in ctx.captured_queries), 2)
+
+    def test_term_register_for_the_class(self):
+        self.year.term1_start, self.year.term1_end = self.days[1], self.days[3]
+        self.year.save()
+        sheets = self.export(term='TERM1')
+        register = sheets['Attendance'][15:]
+        self.assertEqual(len(register), 18)
+        self.assertEqual({row[5] for row in register}, {day.isoformat() for day in self.days[1:4]})
+        self.assertEqual(len(sheets['Student Analytics']), 7)
+
+
+class AttendancePDFExportTests(TestCase):
+
+    def test_register_pages_repeat_the_header(self):
+        year, classroom, stream, teacher, students = make_class(60)
+        SchoolSettings.objects.create(school_name='Mgunga Sec School')
+        enrollments = get_enrollments_by_student(students, year)
+        days = school_days(5)
+        upsert_attendance([
+            Attendance(student=student, enrollment=enrollments[student.id], date=day, status='present')
+            for student in students for day in days
+        ])
+        self.client.force_login(teacher.user)
+
+        response = self.client.get(reverse('attendance_export_pdf'), {'start': days[0].isoformat()})
+        self.assertEqual(response['Content-Type'], PDF_CONTENT_TYPE)
+        pages = [page.extract_text() for page in pypdf.PdfReader(io.BytesIO(b''.join(response.streaming_content))).pages]
+
+        self.assertGreater(len(pages), 5)
+        self.assertIn('Mgunga Sec School', pages[0])
+        self.assertIn('Records: 300', pages[0])
+        self.assertTrue(all('Admission No' in page for page in pages))
+        self.assertEqual(sum(page.count('Present') for page in pages), 300 + 1)
+
+
+class ExportJobTests(TestCase):
+
+    def setUp(self):
+        export_root = tempfile.TemporaryDirectory()
+        self.addCleanup(export_root.cleanup)
+        settings_override = override_settings(EXPORT_ROOT=export_root.name)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+        self.year, self.classroom, self.stream, self.teacher, self.students = make_class(4)
+        self.enrollments = get_enrollments_by_student(self.students, self.year)
+        self.days = school_days(3)
+        self.mark(self.students, self.days, 'present')
+        self.client.force_login(self.teacher.user)
+
+    def mark(self, students, days, status):
+        upsert_attendance([
+            Attendance(student=student, enrollment=self.enrollments[student.id], date=day, status=status)
+            for student in students for day in days
+        ])
+
+    def request_export(self, export_format='xlsx'):
+        response = self.client.post(reverse('export_request'), {'format': export_format, 'start': self.days[0].isoformat()})
+        self.assertEqual(response.status_code, 202)
+        return response.json()
+
+    def run_worker(self):
+        call_command('run_export_jobs', '--once', stdout=io.StringIO())
+
+    def test_request_poll_and_download(self):
+        payload = self.request_export()
+        self.assertEqual(payload['status'], 'pending')
+        self.assertIsNone(payload['download_url'])
+
+        self.run_worker()
+        status = self.client.get(payload['status_url']).json()
+        self.assertEqual((status['status'], status['progress']), ('done', 100))
+
+        response = self.client.get(status['download_url'])
+        self.assertEqual(response['Content-Type'], XLSX_CONTENT_TYPE)
+        workbook = openpyxl.load_workbook(io.BytesIO(b''.join(response.streaming_content)), read_only=True)
+        self.assertEqual(workbook.sheetnames, ['Attendance', 'Student Analytics'])
+
+    def test_repeat_request_reuses_artifact(self):
+        first = self.request_export('pdf')
+        self.assertEqual(self.request_export('pdf')['id'], first['id'])
+        self.run_worker()
+
+        again = self.request_export('pdf')
+        self.assertNotEqual(again['id'], first['id'])
+        self.assertEqual(again['status'], 'done')
+        self.assertEqual(ExportJob.objects.get(id=again['id']).artifact_key, ExportJob.objects.get(id=first['id']).artifact_key)
+        self.assertEqual(len(get_export_storage().listdir('')[1]), 1)
+
+    def test_attendance_change_gives_new_artifact(self):
+        first = self.request_export()
+        self.run_worker()
+
+        self.mark(self.students[:1], self.days[-1:], 'absent')
+        second = self.request_export()
+        self.assertEqual(second['status'], 'pending')
+        self.assertNotEqual(
+            ExportJob.objects.get(id=second['id']).artifact_key, ExportJob.objects.get(id=first['id']).artifact_key
+        )
+
+    def test_edited_marks_with_same_totals_give_new_artifact(self):
+        today = timezone.localdate()
+        self.mark(self.students[:1], [today], 'absent')
+        self.mark(self.students[2:3], [today], 'present')
+        first = self.request_export()
+        self.run_worker()
+
+        # Swap two students of the same gender: the day's rollup counts stay the same
+        for student, status in ((self.students[0], 'present'), (self.students[2], 'absent')):
+            record = Attendance.objects.get(student=student, date=today)
+            self.client.post(reverse('edit_attendance', args=[record.pk]), {'status': status})
+        second = self.request_export()
+        self.assertEqual(second['status'], 'pending')
+        self.assertNotEqual(
+            ExportJob.objects.get(id=second['id']).artifact_key, ExportJob.objects.get(id=first['id']).artifact_key
+        )
+        self.run_worker()
+        self.assertEqual(len(get_export_storage().listdir('')[1]), 2)
+
+    def test_student_rename_gives_new_artifact(self):
+        first = self.request_export()
+        self.run_worker()
+
+        user = self.students[0].user
+        user.first_name = 'Renamed'
+        user.save()
+        second = self.request_export()
+        self.assertEqual(second['status'], 'pending')
+
+    def test_stuck_job_fails_after_max_attempts(self):
+        job = ExportJob.objects.get(id=self.request_export()['id'])
+        ExportJob.objects.filter(id=job.id).update(
+            status='running', attempts=3, claimed_at=timezone.now() - timezone.timedelta(hours=1)
+        )
+        self.run_worker()
+
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), ('failed', 3))
+        self.assertIn('3 attempts', job.error)
+
+    def test_expired_jobs_and_files_are_swept(self):
+        old = self.request_export()
+        self.run_worker()
+        self.mark(self.students[:1], self.days[-1:], 'absent')
+        new = self.request_export()
+        self.run_worker()
+        ExportJob.objects.filter(id=old['id']).update(created_at=timezone.now() - timezone.timedelta(days=8))
+
+        self.run_worker()
+        self.assertEqual(list(ExportJob.objects.values_list('id', flat=True)), [new['id']])
+        self.assertEqual(get_export_storage().listdir('')[1], [ExportJob.objects.get().artifact_name])
+
+    def test_other_users_cannot_see_a_job(self):
+        payload = self.request_export()
+        self.run_worker()
+        self.client.force_login(User.objects.create_user(username='other_teacher', role='teacher'))
+        self.assertEqual(self.client.get(payload['status_url']).status_code, 404)
+
+    @override_settings(EXPORT_BUNDLE_WORKERS=0)
+    def test_school_bundle_has_a_register_per_class_and_stream(self):
+        other = make_other_student(self.year)
+        self.assertEqual(self.client.post(reverse('export_request'), {'format': 'zip'}).status_code, 403)
+
+        self.client.force_login(User.objects.create_user(username='admin', role='admin'))
+        payload = self.client.post(reverse('export_request'), {'format': 'zip', 'year': self.year.id}).json()
+        self.run_worker()
+        status = self.client.get(payload['status_url']).json()
+        self.assertEqual((status['status'], status['progress']), ('done', 100))
+
+        response = self.client.get(status['download_url'])
+        self.assertEqual(response['Content-Type'], ZIP_CONTENT_TYPE)
+        with zipfile.ZipFile(io.BytesIO(b''.join(response.streaming_content))) as bundle:
+            self.assertEqual(bundle.namelist(), ['Form I/Form I A.xlsx', 'Form II/Form II All.xlsx'])
+            register = openpyxl.load_workbook(io.BytesIO(bundle.read('Form I/Form I A.xlsx')), read_only=True)
+            rows = list(register['Attendance'].iter_rows(min_row=16, values_only=True))
+        self.assertEqual(len(rows), len(self.students) * len(self.days))
+        self.assertNotIn(other.admission_number, {row[1] for row in rows})
+
+    def test_school_bundle_reports_progress(self):
+        make_other_student(self.year)
+        calls = []
+        with tempfile.TemporaryFile() as output:
+            total = write_school_bundle(output, self.year, workers=0, progress=lambda done, n: calls.append((done, n)))
+        self.assertEqual(total, 2)
+        self.assertEqual(calls, [(1, 2), (2, 2)])
+
+
+@override_settings(EXPORT_BUNDLE_WORKERS=2)
+class SchoolBundleProcessPoolTests(TransactionTestCase):
+    """Bundles rendered by spawned pool processes, which read committed rows over their own connections."""
+
+    def setUp(self):
+        if connection.vendor == 'sqlite' and connection.is_in_memory_db():
+            self.skipTest("Spawned pool processes cannot open an in-memory test database")
+        export_root = tempfile.TemporaryDirectory()
+        self.addCleanup(export_root.cleanup)
+        settings_override = override_settings(EXPORT_ROOT=export_root.name)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+        self.year, self.classroom, self.stream, self.teacher, self.students = make_class(4)
+        make_other_student(self.year)
+        enrollments = get_enrollments_by_student(self.students, self.year)
+        self.days = school_days(3)
+        upsert_attendance([
+            Attendance(student=student, enrollment=enrollments[student.id], date=day, status='present')
+            for student in self.students for day in self.days
+        ])
+
+    def test_bundle_job_renders_in_two_processes(self):
+        self.client.force_login(User.objects.create_user(username='admin', role='admin'))
+        payload = self.client.post(reverse('export_request'), {'format': 'zip', 'year': self.year.id}).json()
+        call_command('run_export_jobs', '--once', stdout=io.StringIO())
+
+        status = self.client.get(payload['status_url']).json()
+        self.assertEqual((status['status'], status['progress']), ('done', 100))
+        response = self.client.get(status['download_url'])
+        with zipfile.ZipFile(io.BytesIO(b''.join(response.streaming_content))) as bundle:
+            self.assertEqual(sorted(bundle.namelist()), ['Form I/Form I A.xlsx', 'Form II/Form II All.xlsx'])
+            register = openpyxl.load_workbook(io.BytesIO(bundle.read('Form I/Form I A.xlsx')), read_only=True)
+            rows = list(register['Attendance'].iter_rows(min_row=16, values_only=True))
+        self.assertEqual(len(rows), len(self.students) * len(self.days))
+
+    def test_bundle_reports_progress_per_register(self):
+        calls = []
+        with tempfile.TemporaryFile() as output:
+            total = write_school_bundle(output, self.year, progress=lambda done, n: calls.append((done, n)))
+        self.assertEqual(total, 2)
+        self.assertEqual(calls, [(1, 2), (2, 2)])
+
+
+class ChronicAbsenteeismTests(TestCase):
+
+    def setUp(self):
+        self.year, self.classroom, self.stream, self.teacher, self.students = make_class(3)
+        parent = User.objects.create_user(username='parent0', role='parent', phone_number='+255712345670')
+        ParentProfile.objects.create(user=parent, student=self.students[0])
+        self.enrollments = get_enrollments_by_student(self.students, self.year)
+        self.days = school_days(11)
+        # Student 0: three absences in a row; student 1: 2 of 10 days absent (20%); student 2: fine
+        self.record({0: 'PPPPPAAAPP', 1: 'APPPPAPPPP', 2: 'PPPPPPPPPP'}, self.days[:10])
+
+    def record(self, patterns, days):
+        rows = [
+            Attendance(
+                student=self.students[index],
+                enrollment=self.enrollments[self.students[index].id],
+                date=day,
+                status={'P': 'present', 'A': 'absent'}[code],
+            )
+            for index, pattern in patterns.items()
+            for day, code in zip(days, pattern)
+        ]
+        upsert_attendance(rows)
+
+    def run_job(self, *args):
+        out = io.StringIO()
+        call_command('flag_chronic_absenteeism', *args, stdout=out)
+        return out.getvalue()
+
+    def age_changes(self):
+        """Move the recorded attendance changes a day back, as if they came before last night's run."""
+        Classroom.objects.update(attendance_changed_at=timezone.now() - timezone.timedelta(days=1))
+
+    def test_flags_written_incrementally(self):
+        self.run_job('--sms')
+        flags = {flag.student_id: flag for flag in AbsenteeismFlag.objects.all()}
+        self.assertEqual(set(flags), {self.students[0].id, self.students[1].id})
+        self.assertEqual(flags[self.students[0].id].reason, 'both')
+        self.assertEqual(flags[self.students[0].id].longest_streak, 3)
+        self.assertEqual(flags[self.students[1].id].reason, 'rate')
+        self.assertEqual(flags[self.students[1].id].absence_rate, 20.0)
+        self.assertEqual(SMSLog.objects.filter(kind='chronic').count(), 1)
+        self.assertEqual(JobWatermark.objects.get().processed_through, self.days[9])
+
+        # Nothing new by the next night: the classroom is not recomputed
+        self.age_changes()
+        self.assertIn("No new attendance", self.run_job('--sms'))
+
+        # One more school day present: student 1 drops to 2/11 and is cleared; no repeat SMS
+        self.record({0: 'P', 1: 'P', 2: 'P'}, self.days[10:])
+        self.run_job('--sms')
+        self.assertEqual(
+            list(AbsenteeismFlag.objects.values_list('student_id', flat=True)), [self.students[0].id]
+        )
+        self.assertEqual(SMSLog.objects.filter(kind='chronic').count(), 1)
+        self.assertEqual(JobWatermark.objects.get().processed_through, self.days[10])
+
+    def test_parents_warned_today_are_not_counted_again(self):
+        flag = AbsenteeismFlag(student=self.students[0], absent_days=3, longest_streak=3)
+        self.assertEqual(queue_absenteeism_sms([flag]), 1)
+        self.assertEqual(queue_absenteeism_sms([flag]), 0)
+        self.assertEqual(SMSLog.objects.filter(kind='chronic').count(), 1)
+
+    def test_corrections_to_processed_days_are_picked_up(self):
+        self.run_job()
+        self.age_changes()
+
+        # A late correction of days already processed clears student 0's streak
+        self.record({0: 'PPP'}, self.days[5:8])
+        self.run_job()
+        self.assertEqual(
+            list(AbsenteeismFlag.objects.values_list('student_id', flat=True)), [self.students[1].id]
+        )
+        self.assertEqual(JobWatermark.objects.get().processed_through, self.days[9])
+
+        # Deleting the absences the remaining flag rests on clears it too
+        self.age_changes()
+        for record in Attendance.objects.filter(student=self.students[1], status='absent'):
+            self.client.force_login(self.teacher.user)
+            self.client.post(reverse('delete_attendance', args=[record.pk]), HTTP_X_REQUESTED_WITH='XMLHttpRequest')
+        self.run_job()
+        self.assertFalse(AbsenteeismFlag.objects.exists())
+
+    def test_flags_on_dashboards(self):
+        self.run_job()
+
+        self.client.force_login(self.teacher.user)
+        response = self.client.get(reverse('teacher_dashboard'))
+        self.assertEqual(len(response.context['absenteeism_flags']), 2)
+
+        admin = User.objects.create_user(username='admin', role='admin')
+        self.client.force_login(admin)
+        response = self.client.get(reverse('admin_dashboard'))
+        self.assertEqual(response.context['absenteeism_flag_count'], 2)
+        self.assertContains(response, 'Attendance Warnings')
+
+
+class TeacherDashboardTests(TestCase):
+
+    def setUp(self):
+        self.year, self.classroom, self.stream, self.teacher, self.students = make_class(20)
+        self.client.force_login(self.teacher.user)
+
+    def dashboard(self):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(reverse('teacher_dashboard'))
+        return response.context, len(ctx.captured_queries)
+
+    def test_counters_follow_every_write_and_ignore_other_years(self):
+        # History from an older year for the same students must not be counted
+        old_year = AcademicYear.objects.create(year_start=2020)
+        old_classroom = Classroom.objects.create(name='Form I', year=old_year)
+        old_enrollments = Enrollment.objects.bulk_create([
+            Enrollment(student=student, classroom=old_classroom, academic_year=old_year) for student in self.students
+        ])
+        upsert_attendance([
+            Attendance(student=enrollment.student, enrollment=enrollment, date=day, status='absent')
+            for enrollment in old_enrollments
+            for day in school_days(5, end=timezone.localdate().replace(year=2021))
+        ])
+        self.year.is_active = True
+        self.year.save()
+
+        self.dashboard()  # first request creates the SchoolSettings row
+        context, empty_queries = self.dashboard()
+        self.assertEqual((context['total_students'], context['total_attendance']), (20, 0))
+
+        register = {s.id: 'a' if i < 5 else 'p' for i, s in enumerate(self.students)}
+        self.client.post(reverse('mark_attendance'), {'register': json.dumps(register)})
+        context, queries = self.dashboard()
+        self.assertEqual((context['present_count'], context['absent_count'], context['total_attendance']), (15, 5, 20))
+        self.assertEqual(queries, empty_queries)
+
+        record = Attendance.objects.get(student=self.students[0], enrollment__academic_year=self.year)
+        self.client.post(reverse('edit_attendance', args=[record.pk]), {'status': 'sick'})
+        self.assertEqual(self.dashboard()[0]['sick_count'], 1)
+
+        self.client.post(reverse('delete_attendance', args=[record.pk]), HTTP_X_REQUESTED_WITH='XMLHttpRequest')
+        context = self.dashboard()[0]
+        self.assertEqual((context['absent_count'], context['sick_count'], context['total_attendance']), (4, 0, 19))
+
+        self.assertEqual(Enrollment.objects.get(id=old_enrollments[0].id).absent_count, 5)
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class AdminDashboardCacheTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        ADMIN_DASHBOARD_CACHE_OUTCOMES.clear()
+        self.year, self.classroom, self.stream, self.teacher, self.students = make_class(10)
+        self.year.is_active = True
+        self.year.save()
+        self.client.force_login(User.objects.create_user(username='admin', role='admin'))
+
+    def dashboard(self):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(reverse('admin_dashboard'))
+        return response.context, len(ctx.captured_queries)
+
+    def test_counters_cached_until_enrollments_change(self):
+        self.dashboard()  # first request creates the SchoolSettings row
+        cache.clear()
+        ADMIN_DASHBOARD_CACHE_OUTCOMES.clear()
+        context, miss_queries = self.dashboard()
+        self.assertEqual((context['total_students'], context['total_teachers'], context['classrooms_count']), (10, 1, 1))
+        self.assertEqual(context['teachers'][0]['classroom'], self.classroom.name)
+
+        context, hit_queries = self.dashboard()
+        self.assertEqual(context['total_students'], 10)
+        self.assertEqual(miss_queries - hit_queries, 3)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            make_other_student(self.year)
+        context, _ = self.dashboard()
+        self.assertEqual((context['total_students'], context['classrooms_count']), (11, 2))
+
+        response = self.client.get(reverse('admin_dashboard_cache_stats'))
+        self.assertEqual(response.json(), {'hits': 1, 'misses': 2, 'hit_rate': 33.3, 'pid': os.getpid()})
+
+    @override_settings(CACHES={'default': {
+        'BACKEND': 'django.core.cache.backends.db.DatabaseCache', 'LOCATION': 'attendance_cache',
+    }})
+    def test_database_cache_hit_is_one_read(self):
+        get_admin_dashboard_counters(self.year)
+        with CaptureQueriesContext(connection) as ctx:
+            counters = get_admin_dashboard_counters(self.year)
+        self.assertEqual(counters['total_students'], 10)
+        self.assertEqual(len(ctx.captured_queries), 1)
+        self.assertTrue(ctx.captured_queries[0]['sql'].startswith('SELECT'))
+
+    def test_teacher_removal_clears_cache(self):
+        self.dashboard()
+        with self.captureOnCommitCallbacks(execute=True):
+            Enrollment.objects.filter(class_teacher=self.teacher).delete()
+            self.teacher.delete()
+        context, _ = self.dashboard()
+        self.assertEqual((context['total_teachers'], context['teachers']), (0, []))
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class SMSOutboxTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.year, self.classroom, self.stream, self.teacher, self.students = make_class(3)
+        for i, student in enumerate(self.students):
+            parent = User.objects.create_user(username=f'parent{i}', role='parent', phone_number=f'+25571234567{i}')
+            ParentProfile.objects.create(user=parent, student=student)
+        self.client.force_login(self.teacher.user)
+
+    @mock.patch('attendance_app.utils.send_bulk_sms')
+    def test_absences_are_queued_then_dispatched(self, send_bulk_sms):
+        failing = self.students[1].parents.get().user.phone_number
+        send_bulk_sms.side_effect = lambda phones, message: {
+            phone: (True, "SMS sent successfully") if phone != failing else (False, "SMS failed: InvalidPhoneNumber")
+            for phone in phones
+        }
+        data = {f'attendance_{s.id}': 'absent' for s in self.students[:2]}
+
+        self.client.post(reverse('mark_attendance'), data)
+
+        send_bulk_sms.assert_not_called()
+        self.assertEqual(SMSLog.objects.filter(status='pending').count(), 2)
+
+        self.assertEqual(dispatch_pending_sms(limit=10, concurrency=1), (1, 1))
+        self.assertEqual(SMSLog.objects.filter(status='sent').count(), 1)
+        self.assertEqual(SMSLog.objects.filter(status='failed').count(), 1)
+        self.assertEqual(dispatch_pending_sms(), (0, 0))
+
+    @mock.patch('attendance_app.utils.send_bulk_sms')
+    def test_same_message_is_batched_per_gateway_call(self, send_bulk_sms):
+        send_bulk_sms.side_effect = lambda phones, message: {phone: (True, "SMS sent successfully") for phone in phones}
+        student = self.students[0]
+        for i in range(4):
+            parent = User.objects.create_user(username=f'extra{i}', role='parent', phone_number=f'+25565432100{i}')
+            ParentProfile.objects.create(user=parent, student=student)
+
+        self.client.post(reverse('mark_attendance'), {f'attendance_{student.id}': 'absent'})
+
+        self.assertEqual(dispatch_pending_sms(concurrency=1, batch_size=2), (5, 0))
+        self.assertEqual(send_bulk_sms.call_count, 3)
+
+    @mock.patch('attendance_app.utils.send_bulk_sms')
+    def test_class_absences_share_one_gateway_call(self, send_bulk_sms):
+        send_bulk_sms.side_effect = lambda phones, message: {phone: (True, "SMS sent successfully") for phone in phones}
+
+        self.client.post(reverse('mark_attendance'), {f'attendance_{s.id}': 'absent' for s in self.students})
+
+        self.assertEqual(SMSLog.objects.values('message').distinct().count(), 1)
+        self.assertEqual(dispatch_pending_sms(concurrency=1), (3, 0))
+        send_bulk_sms.assert_called_once()
+        phones, message = send_bulk_sms.call_args.args
+        self.assertEqual(len(phones), 3)
+        self.assertIn(self.classroom.name, message)
+
+    def test_absence_notice_is_sent_once_per_local_day(self):
+        student = self.students[0]
+        parent = student.parents.get()
+        yesterday = timezone.localdate() - timezone.timedelta(days=1)
+        SMSLog.objects.create(student=student, parent=parent, message="Jana", status='sent', sent_date=yesterday)
+        data = {f'attendance_{s.id}': 'absent' for s in self.students}
+
+        self.client.post(reverse('mark_attendance'), data)
+        with CaptureQueriesContext(connection) as ctx:
+            self.client.post(reverse('mark_attendance'), data)
+
+        today_logs = SMSLog.objects.filter(sent_date=timezone.localdate(), kind='absent')
+        self.assertEqual(today_logs.count(), 3)
+        self.assertEqual(SMSLog.objects.filter(student=student).count(), 2)
+        self.assertEqual(sum('"attendance_app_smslog"' in q['sql'] for q in ctx.captured_queries), 1)
+
+    @mock.patch('attendance_app.utils.get_sms_backend')
+    def test_recipients_are_mapped_back_to_numbers(self, get_sms_backend):
+        get_sms_backend.return_value.send_messages.return_value = {'SMSMessageData': {'Recipients': [
+            {'number': '+255711000002', 'status': 'InvalidPhoneNumber'},
+            {'number': '+255711000001', 'status': 'Success'},
+        ]}}
+
+        results = send_bulk_sms(['+255711000001', '+255711000002', '+255711000003'], "Habari")
+
+        self.assertTrue(results['+255711000001'][0])
+        self.assertEqual(results['+255711000002'], (False, "SMS failed: InvalidPhoneNumber"))
+        self.assertFalse(results['+255711000003'][0])
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class AttendanceSyncAPITests(TestCase):
+
+    def setUp(self):
+        self.year, self.classroom, self.stream, self.teacher, self.students = make_class(3)
+        parent = User.objects.create_user(username='parent', role='parent', phone_number='+255712345670')
+        ParentProfile.objects.create(user=parent, student=self.students[0])
+        self.client.force_login(self.teacher.user)
+        self.url = reverse('api_sync_attendance')
+        self.today = timezone.localdate()
+
+    def sync(self, key, marks):
+        return self.client.post(self.url, {'idempotency_key': key, 'marks': marks}, content_type='application/json')
+
+    def test_retry_replays_stored_response(self):
+        marks = [
+            {'student': self.students[0].id, 'date': str(self.today), 'status': 'a'},
+            {'student': self.students[1].id, 'date': str(self.today), 'status': 'present'},
+        ]
+
+        first = self.sync('batch-1', marks)
+        retry = self.sync('batch-1', marks)
+
+        self.assertEqual(first.status_code, 200)
+        self.assertEqual(first.json()['results'], ['ok', 'ok'])
+        self.assertEqual(first.json()['sms_queued'], 1)
+        self.assertEqual(retry.json(), first.json())
+        self.assertEqual(retry['Idempotent-Replayed'], 'true')
+        self.assertEqual(Attendance.objects.count(), 2)
+        self.assertEqual(SMSLog.objects.count(), 1)
+
+    def test_per_row_results(self):
+        other = make_other_student(self.year)
+        Attendance.objects.create(
+            student=self.students[1], enrollment=self.students[1].enrollments.get(), date=self.today,
+            status='sick', marked_at=timezone.now(),
+        )
+        marks = [
+            {'student': self.students[0].id, 'date': str(self.today), 'status': 'late'},
+            {'student': other.id, 'date': str(self.today), 'status': 'p'},
+            {'student': self.students[0].id, 'date': str(self.today + timezone.timedelta(days=1)), 'status': 'p'},
+            {'student': self.students[1].id, 'date': str(self.today), 'status': 'a',
+             'marked_at': (timezone.now() - timezone.timedelta(hours=1)).isoformat()},
+            {'student': self.students[2].id, 'date': str(self.today - timezone.timedelta(days=1)), 'status': 's'},
+        ]
+
+        response = self.sync('batch-2', marks)
+
+        self.assertEqual(response.json()['results'], ['invalid', 'not_allowed', 'bad_date', 'stale', 'ok'])
+        self.assertEqual(Attendance.objects.get(student=self.students[1]).status, 'sick')
+        self.assertEqual(SMSLog.objects.count(), 0)
+
+    def test_future_marked_at_is_clamped(self):
+        mark = {'student': self.students[1].id, 'date': str(self.today), 'status': 'a',
+                'marked_at': (timezone.now() + timezone.timedelta(days=1)).isoformat()}
+        self.assertEqual(self.sync('batch-fast', [mark]).json()['results'], ['ok'])
+        self.assertLessEqual(Attendance.objects.get(student=self.students[1]).marked_at, timezone.now())
+
+        correction = {'student': self.students[1].id, 'date': str(self.today), 'status': 'p'}
+        self.assertEqual(self.sync('batch-fix', [correction]).json()['results'], ['ok'])
+        self.assertEqual(Attendance.objects.get(student=self.students[1]).status, 'present')
+
+    def test_conflict_in_marks_is_409(self):
+        marks = [{'student': self.students[0].id, 'date': str(self.today), 'status': 'p'}]
+        with mock.patch('attendance_app.api.apply_attendance_marks', side_effect=IntegrityError):
+            response = self.sync('batch-3', marks)
+
+        self.assertEqual(response.status_code, 409)
+        self.assertFalse(SyncBatch.objects.exists())
+        self.assertEqual(self.sync('batch-3', marks).json()['results'], ['ok'])
+
+    def test_missing_key_is_rejected(self):
+        response = self.client.post(self.url, {'marks': [{}]}, content_type='application/json')
+
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(SyncBatch.objects.exists())
+
+
+@override_settings(CACHES=LOCMEM_CACHES, SMS_BREAKER_THRESHOLD=2, SMS_BREAKER_COOLDOWN=60)
+class SMSCircuitBreakerTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        patcher = mock.patch('attendance_app.utils.get_sms_backend')
+        self.client_send = patcher.start().return_value.send_messages
+        self.addCleanup(patcher.stop)
+
+    def test_opens_after_consecutive_failures_and_fails_fast(self):
+        self.client_send.side_effect = requests.exceptions.ConnectTimeout()
+
+        send_bulk_sms(['+255711000001'], "Habari")
+        self.assertEqual(sms_breaker.state(), 'closed')
+        send_bulk_sms(['+255711000001'], "Habari")
+        self.assertEqual(sms_breaker.state(), 'open')
+
+        with self.assertRaises(SMSGatewayUnavailable):
+            send_bulk_sms(['+255711000001'], "Habari")
+        self.assertEqual(self.client_send.call_count, 2)
+
+    def test_insufficient_balance_opens_immediately(self):
+        self.client_send.return_value = {'SMSMessageData': {'Recipients': [
+            {'number': '+255711000001', 'status': 'InsufficientBalance'},
+        ]}}
+
+        send_bulk_sms(['+255711000001'], "Habari")
+
+        self.assertEqual(sms_breaker.state(), 'open')
+        self.assertEqual(sms_breaker.reason(), 'balance')
+
+    def test_rejecting_every_recipient_counts_as_failure(self):
+        self.client_send.return_value = {'SMSMessageData': {'Recipients': [
+            {'number': '+255711000001', 'status': 'Success'},
+            {'number': '+255711000002', 'status': 'InvalidPhoneNumber'},
+        ]}}
+        send_bulk_sms(['+255711000001', '+255711000002'], "Habari")
+        self.client_send.return_value = {'SMSMessageData': {'Message': 'Rejected', 'Recipients': []}}
+        send_bulk_sms(['+255711000001'], "Habari")
+        self.assertEqual(sms_breaker.state(), 'closed')
+
+        self.client_send.return_value = {'SMSMessageData': {'Recipients': [
+            {'number': '+255711000001', 'status': 'UserInBlacklist'},
+        ]}}
+        send_bulk_sms(['+255711000001'], "Habari")
+        self.assertEqual(sms_breaker.state(), 'open')
+
+    def test_half_open_probe_closes_on_success(self):
+        self.client_send.side_effect = requests.exceptions.ConnectionError()
+        send_bulk_sms(['+255711000001'], "Habari")
+        send_bulk_sms(['+255711000001'], "Habari")
+
+        self.client_send.side_effect = None
+        self.client_send.return_value = {'SMSMessageData': {'Recipients': [
+            {'number': '+255711000001', 'status': 'Success'},
+        ]}}
+        with mock.patch('attendance_app.utils.time.time', return_value=time.time() + 61):
+            self.assertEqual(sms_breaker.state(), 'half-open')
+            self.assertTrue(sms_breaker.allow_request())
+            self.assertFalse(sms_breaker.allow_request())
+            cache.delete(sms_breaker.PROBE_KEY)
+            send_bulk_sms(['+255711000001'], "Habari")
+
+        self.assertEqual(sms_breaker.state(), 'closed')
+
+    def test_deferred_rows_stay_pending(self):
+        year, classroom, stream, teacher, students = make_class(1)
+        parent = User.objects.create_user(username='parent', role='parent', phone_number='+255711000001')
+        ParentProfile.objects.create(user=parent, student=students[0])
+        SMSLog.objects.create(student=students[0], parent=parent.parent_profiles.get(), message="Habari",
+                              status='pending', phone_number='+255711000001')
+        self.client_send.return_value = {'SMSMessageData': {'Recipients': [
+            {'number': '+255711000001', 'status': 'InsufficientBalance'},
+        ]}}
+
+        self.assertEqual(dispatch_pending_sms(), (0, 0))
+
+        self.assertEqual(SMSLog.objects.get().status, 'pending')
+        self.assertEqual(sms_breaker.state(), 'open')
+        self.assertEqual(dispatch_pending_sms(), (0, 0))
+        self.assertEqual(self.client_send.call_count, 1)
+
+
+class FakeGatewayHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+
+    def do_POST(self):
+        self.server.connections.add(self.client_address)
+        self.rfile.read(int(self.headers['Content-Length']))
+        body = json.dumps({'SMSMessageData': {'Message': 'Sent to 1/1', 'Recipients': [
+            {'number': '+255711000001', 'status': 'Success', 'statusCode': 101},
+        ]}}).encode()
+        self.send_response(201)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class SMSGatewayClientTests(TestCase):
+
+    def setUp(self):
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), FakeGatewayHandler)
+        self.server.connections = set()
+        self.base_url = f'http://127.0.0.1:{self.server.server_address[1]}'
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_sdk_opens_a_connection_per_message(self):
+        africastalking.initialize(username='school', api_key='key')
+        with mock.patch.object(africastalking.SMS, '_baseUrl', f'{self.base_url}/version1'):
+            for _ in range(3):
+                response = africastalking.SMS.send("Habari", ['+255711000001'])
+
+        self.assertEqual(response['SMSMessageData']['Recipients'][0]['status'], 'Success')
+        self.assertEqual(len(self.server.connections), 3)
+
+    def test_pooled_client_reuses_one_connection(self):
+        backend = AfricasTalkingBackend('school', 'key', base_url=self.base_url)
+        for _ in range(3):
+            response = backend.send_messages("Habari", ['+255711000001'])
+
+        self.assertEqual(response['SMSMessageData']['Recipients'][0]['status'], 'Success')
+        self.assertEqual(len(self.server.connections), 1)
+
+
+@override_settings(
+    CACHES=LOCMEM_CACHES,
+    SMS_BACKEND='attendance_app.sms_backends.SimulatorBackend',
+)
+class SMSSimulatorTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.simulator = GatewaySimulator(balance=2, seed=1)
+        self.server = make_simulator_server(self.simulator, port=0)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        settings_override = override_settings(SMS_SIMULATOR_URL=f'http://127.0.0.1:{self.server.server_address[1]}')
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_balance_runs_out_and_opens_breaker(self):
+        results = send_bulk_sms(['+255711000001', '+255711000002', '+255711000003'], "Habari")
+
+        self.assertTrue(results['+255711000001'][0])
+        self.assertTrue(results['+255711000002'][0])
+        self.assertFalse(results['+255711000003'][0])
+        self.assertEqual(sms_breaker.reason(), 'balance')
+        self.assertEqual(self.simulator.stats['sent'], 2)
+
+    def test_benchmark_has_its_own_breaker(self):
+        # Two messages of credit: the rest of the run gets InsufficientBalance
+        out = io.StringIO()
+        call_command('benchmark_sms', '--messages', '6', '--batch-size', '1', '--concurrency', '1', stdout=out)
+
+        self.assertIn('Sent: 2 | Failed: 1 | Deferred (breaker open): 3', out.getvalue())
+        self.assertEqual(sms_breaker.state(), 'closed')
+
+    def test_rate_limit_and_errors(self):
+        simulator = GatewaySimulator(rate_limit=1, error_rate=0, seed=1)
+        form = {'to': ['+255711000001']}
+
+        self.assertEqual(simulator.handle(form)[0], 201)
+        self.assertEqual(simulator.handle(form)[0], 429)
+
+        simulator.error_rate = 1
+        simulator.rate_limit = 0
+        self.assertEqual(simulator.handle(form)[0], 500)
+
+
+@override_settings(SMS_BACKEND='attendance_app.sms_backends.LocmemBackend', CACHES=LOCMEM_CACHES)
+class LocmemBackendTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        LocmemBackend.outbox.clear()
+
+    def test_messages_are_kept_in_outbox(self):
+        results = send_bulk_sms(['+255711000001', '+255711000001', '+255711000002'], "Habari")
+
+        self.assertEqual(len(LocmemBackend.outbox), 2)
+        self.assertTrue(all(success for success, _ in results.values()))
+
+    def test_benchmark_refuses_the_real_gateway(self):
+        out = io.StringIO()
+        call_command('benchmark_sms', '--messages', '5', stdout=out)
+        self.assertIn('Target: in memory', out.getvalue())
+        self.assertEqual(len(LocmemBackend.outbox), 5)
+
+        with override_settings(SMS_BACKEND='attendance_app.sms_backends.AfricasTalkingBackend'):
+            with self.assertRaises(CommandError):
+                call_command('benchmark_sms', '--messages', '5', stdout=io.StringIO())
+        self.assertEqual(len(LocmemBackend.outbox), 5)
+
+
+@override_settings(
+    CACHES=LOCMEM_CACHES,
+    SMS_BACKEND='attendance_app.sms_backends.SimulatorBackend',
+    SMS_BATCH_SIZE=1,
+)
+class AsyncAttendanceTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.simulator = GatewaySimulator(latency=0.2)
+        self.server = make_simulator_server(self.simulator, port=0)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        settings_override = override_settings(SMS_SIMULATOR_URL=f'http://127.0.0.1:{self.server.server_address[1]}')
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+        self.year, self.classroom, self.stream, self.teacher, self.students = make_class(10)
+        for i, student in enumerate(self.students):
+            parent = User.objects.create_user(username=f'parent{i}', role='parent', phone_number=f'+2557110000{i:02d}')
+            ParentProfile.objects.create(user=parent, student=student)
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    async def test_async_register_delivers_sms_concurrently(self):
+        await self.async_client.aforce_login(self.teacher.user)
+        register = {s.id: 'a' for s in self.students}
+
+        response = await self.async_client.post(reverse('mark_attendance_async'), {'register': json.dumps(register)})
+
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(await Attendance.objects.filter(status='absent').acount(), 10)
+        self.assertEqual(await SMSLog.objects.filter(status='sent').acount(), 10)
+        # Ten absence notices, one recipient per call, were at the gateway at the same time
+        self.assertEqual(self.simulator.stats['requests'], 10)
+        self.assertGreater(self.simulator.stats['max_in_flight'], 1)
+
+    async def test_dispatch_leaves_other_students_queued(self):
+        for student in self.students[:3]:
+            parent = await ParentProfile.objects.aget(student=student)
+            await SMSLog.objects.acreate(student=student, parent=parent, message=f"Habari {student.id}",
+                                         status='pending', phone_number=f'+2557120000{student.id:02d}')
+
+        sent, failed = await adispatch_pending_sms(student_ids=[self.students[0].id])
+
+        self.assertEqual((sent, failed), (1, 0))
+        self.assertEqual(await SMSLog.objects.filter(status='pending').acount(), 2)
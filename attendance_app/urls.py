@@ -1,5 +1,5 @@
 from django.urls import path
-from . import views
+from . import api, views
 from django.conf import settings
 from django.conf.urls.static import static
 
@@ -12,15 +12,21 @@ urlpatterns = [
     
     # ================= DASHBOARDS =================
     path('admin-dashboard/', views.admin_dashboard, name='admin_dashboard'),
+    path('admin-dashboard/cache-stats/', views.admin_dashboard_cache_stats, name='admin_dashboard_cache_stats'),
     path('teacher-dashboard/', views.teacher_dashboard, name='teacher_dashboard'),
     
     # ================= ATTENDANCE =================
     path('mark_attendance/', views.mark_attendance, name='mark_attendance'),
+    path('mark_attendance/async/', views.mark_attendance_async, name='mark_attendance_async'),
     path('view_attendance/', views.view_attendance, name='view_attendance'),
     path("attendance/export/pdf/", views.attendance_export_pdf, name="attendance_export_pdf"),
     path("attendance/export/excel/", views.attendance_export_excel, name="attendance_export_excel"),
+    path("exports/request/", views.export_request, name="export_request"),
+    path("exports/<int:job_id>/", views.export_status, name="export_status"),
+    path("exports/<int:job_id>/download/", views.download_export, name="download_export"),
     path('edit_attendance/<int:pk>/', views.edit_attendance, name='edit_attendance'),
     path('delete_attendance/<int:pk>/', views.delete_attendance, name='delete_attendance'),
+    path('api/attendance/sync/', api.sync_attendance, name='api_sync_attendance'),
     
     # ================= SMS LOGS =================
     path('teacher_sms_logs/', views.teacher_sms_logs, name='teacher_sms_logs'),
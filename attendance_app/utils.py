@@ -1,122 +1,566 @@
-import africastalking
+import asyncio
 import logging
+import os
+import re
+import threading
+import time
+import weakref
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+import aiohttp
+from asgiref.sync import sync_to_async
 from django.conf import settings
-from .models import AcademicYear
+from django.core.cache import cache
+from django.db import connections, transaction
+from django.db.models import Count, Exists, F, IntegerField, OuterRef, Q, Subquery, Sum
+from django.db.models.functions import Coalesce
+from .analytics import freeze_academic_year
+from .models import (
+    AcademicYear,
+    Attendance,
+    Classroom,
+    DailyClassAttendance,
+    Enrollment,
+    ParentProfile,
+    SMSLog,
+    StudentProfile,
+    TeacherProfile,
+)
+from .sms_backends import get_async_sms_session, get_sms_backend
 from django.utils import timezone
 import requests
-from requests.adapters import HTTPAdapter
-from urllib3.util.retry import Retry
 
 # Initialize logger
 logger = logging.getLogger(__name__)
 
 
-def get_sms_session():
-    """Create a session with timeout and retry strategy"""
-    session = requests.Session()
-    
-    # Set default timeout
-    session.timeout = 20
-    
-    # Retry strategy
-    retry_strategy = Retry(
-        total=2,
-        backoff_factor=1,
-        status_forcelist=[429, 500, 502, 503, 504],
-        allowed_methods=["POST"]
-    )
-    
-    adapter = HTTPAdapter(max_retries=retry_strategy, pool_connections=10, pool_maxsize=10)
-    session.mount("https://", adapter)
-    session.mount("http://", adapter)
-    
-    return session
+INSUFFICIENT_BALANCE_MESSAGE = "Insufficient SMS balance. Please contact Admin."
+GATEWAY_UNAVAILABLE_MESSAGE = "SMS service is paused. The message will be sent later."
+
+
+class SMSGatewayUnavailable(Exception):
+    """Raised instead of calling the gateway while the circuit breaker is open."""
+
+
+class SMSCircuitBreaker:
+    """
+    Circuit breaker around the SMS gateway, shared by every worker through the cache.
+    closed    -> calls go through, consecutive failed calls are counted
+    open      -> calls fail fast until the cooldown ends
+    half-open -> one worker at a time sends a probe; success closes, failure re-opens
+    An insufficient-balance response opens the breaker straight away with a longer cooldown.
+    Breakers with another `name` keep their own state (benchmark_sms uses one).
+    """
+
+    def __init__(self, name='sms_breaker'):
+        self.FAILURES_KEY = f'{name}:failures'
+        self.OPEN_UNTIL_KEY = f'{name}:open_until'
+        self.REASON_KEY = f'{name}:reason'
+        self.PROBE_KEY = f'{name}:probe'
+
+    def state(self):
+        open_until = cache.get(self.OPEN_UNTIL_KEY)
+        if open_until is None:
+            return 'closed'
+        return 'open' if time.time() < open_until else 'half-open'
+
+    def is_open(self):
+        return self.state() == 'open'
+
+    def reason(self):
+        return cache.get(self.REASON_KEY) if self.state() != 'closed' else None
+
+    def allow_request(self):
+        state = self.state()
+        if state == 'closed':
+            return True
+        if state == 'open':
+            return False
+        # Half-open: only the worker that wins the probe key may call the gateway
+        return cache.add(self.PROBE_KEY, 1, timeout=settings.SMS_BREAKER_COOLDOWN)
+
+    def record_success(self):
+        cache.delete_many([self.FAILURES_KEY, self.OPEN_UNTIL_KEY, self.REASON_KEY, self.PROBE_KEY])
+
+    def record_failure(self, insufficient_balance=False):
+        if insufficient_balance:
+            self.trip('balance', settings.SMS_BREAKER_BALANCE_COOLDOWN)
+            return
+
+        if self.state() != 'closed':
+            # The half-open probe failed
+            self.trip('failures', settings.SMS_BREAKER_COOLDOWN)
+            return
+
+        cache.add(self.FAILURES_KEY, 0, timeout=None)
+        failures = cache.incr(self.FAILURES_KEY)
+        if failures >= settings.SMS_BREAKER_THRESHOLD:
+            self.trip('failures', settings.SMS_BREAKER_COOLDOWN)
+
+    def trip(self, reason, cooldown):
+        logger.warning(f"SMS circuit breaker opened ({reason}) for {cooldown}s")
+        cache.set_many({
+            self.OPEN_UNTIL_KEY: time.time() + cooldown,
+            self.REASON_KEY: reason,
+            self.FAILURES_KEY: 0,
+        }, timeout=None)
+        cache.delete(self.PROBE_KEY)
+
+
+sms_breaker = SMSCircuitBreaker()
+
+
+def describe_sms_error(error):
+    """Turn a gateway exception into the short message shown to users."""
+    error_msg = str(error)
+    if 'insufficient' in error_msg.lower() or 'balance' in error_msg.lower():
+        return INSUFFICIENT_BALANCE_MESSAGE
+    elif 'timeout' in error_msg.lower():
+        return "SMS service timeout. Please try again."
+    elif 'network' in error_msg.lower():
+        return " Network error. Please try again."
+    else:
+        return f" SMS failed: {error_msg[:100]}"
+
+
+def send_bulk_sms(phone_numbers, message, breaker=None):
+    """
+    Send one message to many recipients in a single call to settings.SMS_BACKEND.
+    Each entry of SMSMessageData.Recipients is matched back to its number.
+    Raises SMSGatewayUnavailable without calling the gateway while the breaker is open
+    (`breaker`, sms_breaker by default).
+    Returns: {phone_number: (success, message)}
+    """
+    phone_numbers = list(dict.fromkeys(p for p in phone_numbers if p))
+    if not phone_numbers:
+        return {}
+    breaker = breaker or sms_breaker
+
+    if not breaker.allow_request():
+        raise SMSGatewayUnavailable(breaker.reason())
+
+    try:
+        response = get_sms_backend().send_messages(message, phone_numbers)
+
+    except requests.exceptions.Timeout:
+        logger.error(f"SMS timeout for {len(phone_numbers)} recipient(s)")
+        breaker.record_failure()
+        return {phone: (False, "SMS service timeout - please try again") for phone in phone_numbers}
+
+    except requests.exceptions.ConnectionError:
+        logger.error(f"SMS gateway unreachable for {len(phone_numbers)} recipient(s)")
+        breaker.record_failure()
+        return {phone: (False, " Network error. Please try again.") for phone in phone_numbers}
+
+    except Exception as e:
+        logger.error(f"SMS sending error: {e}")
+        error_msg = describe_sms_error(e)
+        breaker.record_failure(insufficient_balance=error_msg == INSUFFICIENT_BALANCE_MESSAGE)
+        return {phone: (False, error_msg) for phone in phone_numbers}
+
+    return read_sms_response(phone_numbers, response, breaker)
+
+
+def read_sms_response(phone_numbers, response, breaker=None):
+    """
+    Match each entry of SMSMessageData.Recipients back to its number and
+    update the circuit breaker from the outcome: success only when at least
+    one recipient was accepted.
+    Returns: {phone_number: (success, message)}
+    """
+    breaker = breaker or sms_breaker
+    results = {}
+    recipients = []
+    if isinstance(response, dict) and response.get('SMSMessageData'):
+        recipients = response['SMSMessageData'].get('Recipients') or []
+
+    insufficient_balance = False
+    for recipient in recipients:
+        number = recipient.get('number')
+        status = recipient.get('status', 'Unknown error')
+        if status == 'Success':
+            logger.info(f"SMS sent successfully to {number}")
+            results[number] = (True, "SMS sent successfully")
+        elif status == 'InsufficientBalance':
+            insufficient_balance = True
+            results[number] = (False, INSUFFICIENT_BALANCE_MESSAGE)
+        else:
+            logger.error(f"SMS failed for {number}: {status}")
+            results[number] = (False, f"SMS failed: {status}")
+
+    for phone in phone_numbers:
+        results.setdefault(phone, (False, "No response from SMS gateway"))
+
+    if insufficient_balance:
+        logger.error("SMS gateway reports insufficient balance")
+        breaker.record_failure(insufficient_balance=True)
+    elif any(success for success, _ in results.values()):
+        breaker.record_success()
+    else:
+        # An empty Recipients list or every number rejected: the gateway is not delivering
+        logger.error(f"SMS gateway accepted none of {len(phone_numbers)} recipient(s)")
+        breaker.record_failure()
+
+    return results
 
 
 def send_sms(phone_number, message):
     """
-    Send SMS using Africa's Talking with timeout
+    Send SMS through the configured SMS backend
     Returns: (success, message)
     """
     if not phone_number:
         return False, "No phone number provided"
-    
+
     try:
-        # Initialize Africa's Talking
-        africastalking.initialize(
-            username=settings.AFRICASTALKING_USERNAME,
-            api_key=settings.AFRICASTALKING_API_KEY
+        return send_bulk_sms([phone_number], message)[phone_number]
+    except SMSGatewayUnavailable:
+        return False, GATEWAY_UNAVAILABLE_MESSAGE
+
+
+# ================= SMS OUTBOX =================
+
+def normalize_parent_phone(parent_phone):
+    if not parent_phone:
+        return None
+    parent_phone = re.sub(r"[^\d+]", "", parent_phone)
+    if parent_phone.startswith("0") and len(parent_phone) == 10:
+        parent_phone = "+255" + parent_phone[1:]
+    elif parent_phone.startswith(("6", "7")) and len(parent_phone) == 9:
+        parent_phone = "+255" + parent_phone
+    elif parent_phone.startswith("255") and len(parent_phone) == 12:
+        parent_phone = "+" + parent_phone
+    if re.match(r"^\+255[67]\d{8}$", parent_phone):
+        return parent_phone
+    return None
+
+
+def get_absence_message(classroom, teacher, day):
+    """
+    Absence notice text shared by every absent student of one class on one day.
+    The student is not named, so all their parents can go out in one gateway call.
+    """
+    teacher_phone = teacher.user.phone_number if teacher and teacher.user.phone_number else "N/A"
+    teacher_name = teacher.user.get_full_name() if teacher else "Mwalimu"
+    class_part = f"wa {classroom.name} " if classroom else ""
+    return (
+        f"HABARI MZAZI: Mtoto wako {class_part}"
+        f"hajafika shuleni leo {day.strftime('%d/%m/%Y')}. "
+        f"Tafadhali wasiliana na mwalim {teacher_name} kwa namba {teacher_phone}. Asante."
+    )
+
+
+def queue_absent_sms(student, teacher=None, classroom=None):
+    """
+    Queue an absence SMS for every parent of the student.
+    Rows are written as 'pending' and delivered by the dispatch_sms worker.
+    Returns: (queued_count, failed_count, messages)
+    """
+    parents = ParentProfile.objects.filter(student=student).select_related('user')
+
+    if not parents.exists():
+        logger.warning(f"No parent found for student {student.user.get_full_name()}")
+        return 0, 1, ["No parent registered for this student"]
+
+    if teacher is None or classroom is None:
+        active_year = AcademicYear.objects.filter(is_active=True).first()
+        enrollment = student.enrollments.filter(
+            academic_year=active_year,
+            status='Active'
+        ).select_related('classroom').first()
+        classroom = classroom or (enrollment.classroom if enrollment else None)
+        if teacher is None:
+            teacher = TeacherProfile.objects.filter(
+                class_enrollments__classroom=classroom,
+                class_enrollments__academic_year=active_year
+            ).first()
+
+    today = timezone.localdate()
+    message_template = get_absence_message(classroom, teacher, today)
+
+    queued_count = 0
+    failed_count = 0
+    messages_list = []
+    logs = []
+
+    for parent in parents:
+        parent_phone = normalize_parent_phone(parent.user.phone_number)
+
+        if parent_phone:
+            queued_count += 1
+            status = 'pending'
+        else:
+            failed_count += 1
+            status = 'failed'
+            messages_list.append(f"Invalid phone for {parent.user.get_full_name()}")
+
+        logs.append(SMSLog(
+            student=student,
+            parent=parent,
+            message=message_template,
+            status=status,
+            phone_number=parent_phone or '',
+            kind='absent',
+            sent_date=today,
+        ))
+
+    # A concurrent submit may have queued the same notice; the dedup key drops it
+    SMSLog.objects.bulk_create(logs, ignore_conflicts=True)
+    return queued_count, failed_count, messages_list
+
+
+def queue_absenteeism_sms(flags):
+    """
+    Queue a chronic-absence warning for every parent of each flagged student.
+    At most one warning per parent per day (SMSLog dedup key, kind='chronic').
+    Returns the number of messages queued.
+    """
+    today = timezone.localdate()
+    flags = {flag.student_id: flag for flag in flags}
+    # Parents already warned today are left out here, so the count only covers new rows
+    warned = SMSLog.objects.filter(
+        parent=OuterRef('pk'), student=OuterRef('student'), sent_date=today, kind='chronic'
+    )
+    parents = (
+        ParentProfile.objects.filter(student_id__in=flags)
+        .exclude(Exists(warned))
+        .select_related('user', 'student__user')
+    )
+    logs = []
+    for parent in parents:
+        parent_phone = normalize_parent_phone(parent.user.phone_number)
+        if not parent_phone:
+            continue
+        flag = flags[parent.student_id]
+        logs.append(SMSLog(
+            student_id=parent.student_id,
+            parent=parent,
+            message=(
+                f"HABARI MZAZI: Mtoto wako {parent.student.user.get_full_name()} "
+                f"amekosa shule siku {flag.absent_days} ndani ya siku {settings.ABSENTEEISM_WINDOW_DAYS} zilizopita "
+                f"(mfululizo hadi siku {flag.longest_streak}). "
+                f"Tafadhali wasiliana na mwalimu wa darasa. Asante."
+            ),
+            status='pending',
+            phone_number=parent_phone,
+            kind='chronic',
+            sent_date=today,
+        ))
+    # A concurrent run may still take a dedup key first; ignore_conflicts drops that row
+    SMSLog.objects.bulk_create(logs, ignore_conflicts=True)
+    return len(logs)
+
+
+def get_notified_student_ids(student_ids, day=None, kind='absent'):
+    """
+    Return the set of students (out of `student_ids`) that already have an SMS
+    of this kind for the school's local `day`, in one query on the dedup key.
+    """
+    day = day or timezone.localdate()
+    return set(
+        SMSLog.objects.filter(student_id__in=student_ids, sent_date=day, kind=kind)
+        .values_list('student_id', flat=True)
+        .distinct()
+    )
+
+
+def claim_pending_sms(limit=50, lease_seconds=300, student_ids=None):
+    """
+    Claim up to `limit` queued SMS rows for this worker.
+    Rows are locked with SELECT ... FOR UPDATE SKIP LOCKED so concurrent
+    workers never pick the same row, then flipped to 'sending'. Rows left in
+    'sending' longer than the lease (a crashed worker) are claimed again.
+    `student_ids` limits the claim to those students' messages.
+    """
+    now = timezone.now()
+    stale = now - timedelta(seconds=lease_seconds)
+
+    with transaction.atomic():
+        queued = SMSLog.objects.select_for_update(skip_locked=True).filter(
+            Q(status='pending') | Q(status='sending', claimed_at__lt=stale)
         )
-        
-        sms = africastalking.SMS
-        
-        # ========== METHOD 1: Set timeout via socket (GLOBAL) ==========
-        import socket
-        original_timeout = socket.getdefaulttimeout()
-        socket.setdefaulttimeout(20)  # 20 seconds timeout
-        
+        if student_ids is not None:
+            queued = queued.filter(student_id__in=student_ids)
+        ids = list(queued.order_by('timestamp').values_list('id', flat=True)[:limit])
+        if not ids:
+            return []
+
+        SMSLog.objects.filter(id__in=ids).update(
+            status='sending',
+            claimed_at=now,
+            attempts=F('attempts') + 1,
+        )
+
+    return list(SMSLog.objects.filter(id__in=ids))
+
+
+def dispatch_pending_sms(limit=50, concurrency=4, lease_seconds=300, batch_size=None):
+    """
+    Send one claimed batch of queued SMS and record the outcome on each row.
+    Rows carrying the same message text go out together, up to `batch_size`
+    recipients per gateway call, with at most `concurrency` calls in flight.
+    Rows the circuit breaker kept from being sent go back to 'pending'.
+    Returns: (sent_count, failed_count)
+    """
+    batch_size = batch_size or settings.SMS_BATCH_SIZE
+    if sms_breaker.is_open():
+        return 0, 0
+
+    logs = claim_pending_sms(limit=limit, lease_seconds=lease_seconds)
+    if not logs:
+        return 0, 0
+
+    chunks = group_sms_chunks(logs, batch_size)
+
+    def send_chunk(chunk):
+        message, phones = chunk
         try:
-            # Send SMS
-            response = sms.send(
-                message,
-                [phone_number],
-                sender_id=settings.AFRICASTALKING_SENDER_ID
-            )
+            return send_bulk_sms(phones, message)
+        except SMSGatewayUnavailable:
+            return {phone: (False, GATEWAY_UNAVAILABLE_MESSAGE) for phone in phones}
         finally:
-            # Restore original timeout
-            socket.setdefaulttimeout(original_timeout)
-        
-        # ========== METHOD 2: If using custom HTTP session ==========
-        # Alternative: If you want more control, you can override the SDK's session
-        # Uncomment this if Method 1 doesn't work:
-        """
-        # Override the SDK's HTTP session with timeout
-        if hasattr(sms, '_session'):
-            sms._session = get_sms_session()
-        
-        response = sms.send(
-            message,
-            [phone_number],
-            sender_id=settings.AFRICASTALKING_SENDER_ID
+            # The breaker may have opened a cache connection in this thread
+            connections.close_all()
+
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        responses = list(pool.map(send_chunk, chunks))
+
+    return record_sms_results(logs, chunks, responses)
+
+
+def group_sms_chunks(logs, batch_size):
+    """
+    Group claimed rows by message and split each group into (message, phones) gateway calls.
+    Absence notices share one text per class and day, so a class's absences go out together.
+    """
+    by_message = {}
+    for log in logs:
+        by_message.setdefault(log.message, []).append(log)
+
+    chunks = []
+    for message, message_logs in by_message.items():
+        phones = list(dict.fromkeys(log.phone_number for log in message_logs))
+        for i in range(0, len(phones), batch_size):
+            chunks.append((message, phones[i:i + batch_size]))
+    return chunks
+
+
+def record_sms_results(logs, chunks, responses):
+    """
+    Write the gateway outcome of each chunk back to its SMSLog rows.
+    Returns: (sent_count, failed_count)
+    """
+    results = {}
+    for (message, _), response in zip(chunks, responses):
+        for phone, result in response.items():
+            results[(message, phone)] = result
+
+    sent_ids = []
+    failed_ids = []
+    deferred_ids = []
+    for log in logs:
+        success, response_msg = results.get(
+            (log.message, log.phone_number),
+            (False, "No phone number provided")
         )
-        """
-        
-        # Check response
-        if response and response.get('SMSMessageData'):
-            recipients = response['SMSMessageData']['Recipients']
-            if recipients and len(recipients) > 0:
-                status = recipients[0].get('status', '')
-                if status == 'Success':
-                    logger.info(f"SMS sent successfully to {phone_number}")
-                    return True, "SMS sent successfully"
-                else:
-                    error_msg = recipients[0].get('status', 'Unknown error')
-                    logger.error(f"SMS failed: {error_msg}")
-                    return False, f"SMS failed: {error_msg}"
-        
-        return False, "No response from SMS gateway"
-        
-    except requests.exceptions.Timeout:
-        logger.error(f"SMS timeout for {phone_number}")
-        return False, "SMS service timeout - please try again"
-        
-    except socket.timeout:
-        logger.error(f"Socket timeout for {phone_number}")
-        return False, "SMS service timeout - please try again"
-        
-    except Exception as e:
-        error_msg = str(e)
-        logger.error(f"SMS sending error: {error_msg}")
-        
-        # Check for specific errors
-        if 'insufficient' in error_msg.lower() or 'balance' in error_msg.lower():
-            return False, "Insufficient SMS balance. Please contact Admin."
-        elif 'timeout' in error_msg.lower():
-            return False, "SMS service timeout. Please try again."
-        elif 'network' in error_msg.lower():
-            return False, " Network error. Please try again."
+        if success:
+            sent_ids.append(log.id)
+        elif response_msg in (GATEWAY_UNAVAILABLE_MESSAGE, INSUFFICIENT_BALANCE_MESSAGE):
+            # Not sent at all: keep it queued until the breaker closes
+            deferred_ids.append(log.id)
         else:
-            return False, f" SMS failed: {error_msg[:100]}"
+            failed_ids.append(log.id)
+            logger.error(f"Queued SMS {log.id} to {log.phone_number} failed: {response_msg}")
+
+    if sent_ids:
+        SMSLog.objects.filter(id__in=sent_ids).update(status='sent')
+    if failed_ids:
+        SMSLog.objects.filter(id__in=failed_ids).update(status='failed')
+    if deferred_ids:
+        SMSLog.objects.filter(id__in=deferred_ids).update(status='pending', claimed_at=None)
+
+    return len(sent_ids), len(failed_ids)
+
+
+# ================= ASYNC SMS (ASGI) =================
+
+# One semaphore per event loop caps the gateway requests a worker has in flight,
+# however many teachers are submitting at the same time.
+_gateway_semaphores = weakref.WeakKeyDictionary()
+
+
+def get_gateway_semaphore():
+    loop = asyncio.get_running_loop()
+    semaphore = _gateway_semaphores.get(loop)
+    if semaphore is None:
+        semaphore = _gateway_semaphores[loop] = asyncio.Semaphore(settings.SMS_ASYNC_CONCURRENCY)
+    return semaphore
+
+
+async def asend_bulk_sms(phone_numbers, message, session=None, breaker=None):
+    """
+    Async send_bulk_sms: same breaker rules and result shape, but the gateway
+    call waits on the event loop instead of holding a worker thread.
+    """
+    phone_numbers = list(dict.fromkeys(p for p in phone_numbers if p))
+    if not phone_numbers:
+        return {}
+    breaker = breaker or sms_breaker
+
+    if not await sync_to_async(breaker.allow_request)():
+        raise SMSGatewayUnavailable(await sync_to_async(breaker.reason)())
+
+    try:
+        async with get_gateway_semaphore():
+            response = await get_sms_backend().asend_messages(message, phone_numbers, session=session)
+
+    except asyncio.TimeoutError:
+        logger.error(f"SMS timeout for {len(phone_numbers)} recipient(s)")
+        await sync_to_async(breaker.record_failure)()
+        return {phone: (False, "SMS service timeout - please try again") for phone in phone_numbers}
+
+    except aiohttp.ClientConnectionError:
+        logger.error(f"SMS gateway unreachable for {len(phone_numbers)} recipient(s)")
+        await sync_to_async(breaker.record_failure)()
+        return {phone: (False, " Network error. Please try again.") for phone in phone_numbers}
+
+    except Exception as e:
+        logger.error(f"SMS sending error: {e}")
+        error_msg = describe_sms_error(e)
+        await sync_to_async(breaker.record_failure)(insufficient_balance=error_msg == INSUFFICIENT_BALANCE_MESSAGE)
+        return {phone: (False, error_msg) for phone in phone_numbers}
+
+    return await sync_to_async(read_sms_response)(phone_numbers, response, breaker)
+
+
+async def adispatch_pending_sms(limit=50, lease_seconds=300, batch_size=None, student_ids=None):
+    """
+    Async dispatch_pending_sms: claimed chunks are sent concurrently with
+    asyncio.gather over one aiohttp session, bounded by SMS_ASYNC_CONCURRENCY.
+    Returns: (sent_count, failed_count)
+    """
+    batch_size = batch_size or settings.SMS_BATCH_SIZE
+    if await sync_to_async(sms_breaker.is_open)():
+        return 0, 0
+
+    logs = await sync_to_async(claim_pending_sms)(limit=limit, lease_seconds=lease_seconds, student_ids=student_ids)
+    if not logs:
+        return 0, 0
+
+    chunks = group_sms_chunks(logs, batch_size)
+
+    async def send_chunk(session, chunk):
+        message, phones = chunk
+        try:
+            return await asend_bulk_sms(phones, message, session=session)
+        except SMSGatewayUnavailable:
+            return {phone: (False, GATEWAY_UNAVAILABLE_MESSAGE) for phone in phones}
+
+    async with get_async_sms_session() as session:
+        responses = await asyncio.gather(*(send_chunk(session, chunk) for chunk in chunks))
+
+    return await sync_to_async(record_sms_results)(logs, chunks, responses)
 
 
 def auto_lock_expired_academic_year():
@@ -128,5 +572,290 @@ def auto_lock_expired_academic_year():
         active_year.is_active = False
         active_year.is_locked = True
         active_year.save()
+        freeze_academic_year(active_year)
         logger.info(f"Academic Year {active_year} has been auto-locked.")
-        print(f"Academic Year {active_year} locked.")
\ No newline at end of file
+        print(f"Academic Year {active_year} locked.")
+
+
+# ================= ATTENDANCE MARKING =================
+
+# Compact status codes used by the single-submit register payload
+ATTENDANCE_CODES = {'p': 'present', 'a': 'absent', 's': 'sick'}
+
+
+def get_enrollments_by_student(students, academic_year):
+    """Map student id -> Enrollment for the given year in a single query."""
+    return {
+        enrollment.student_id: enrollment
+        for enrollment in Enrollment.objects.filter(
+            student__in=students,
+            academic_year=academic_year
+        )
+    }
+
+
+def get_students_by_teacher_scope(classroom, stream=None, academic_year=None):
+    """Return students linked to the class/stream via Enrollment."""
+    qs = StudentProfile.objects.filter(
+        enrollments__classroom=classroom,
+        enrollments__status='Active'
+    )
+    if stream:
+        qs = qs.filter(enrollments__stream=stream)
+    if academic_year:
+        qs = qs.filter(enrollments__academic_year=academic_year)
+    return qs.distinct()
+
+
+# ================= ATTENDANCE ROLLUPS =================
+
+ROLLUP_COUNTS = {
+    'present': Count('id', filter=Q(status='present')),
+    'absent': Count('id', filter=Q(status='absent')),
+    'sick': Count('id', filter=Q(status='sick')),
+    'male_present': Count('id', filter=Q(status='present', student__user__gender__iexact='Male')),
+    'male_absent': Count('id', filter=Q(status='absent', student__user__gender__iexact='Male')),
+    'male_sick': Count('id', filter=Q(status='sick', student__user__gender__iexact='Male')),
+    'female_present': Count('id', filter=Q(status='present', student__user__gender__iexact='Female')),
+    'female_absent': Count('id', filter=Q(status='absent', student__user__gender__iexact='Female')),
+    'female_sick': Count('id', filter=Q(status='sick', student__user__gender__iexact='Female')),
+}
+
+
+def sum_daily_rollups(rollup_qs):
+    """Total every count column over a DailyClassAttendance queryset (zeros when empty)."""
+    totals = rollup_qs.aggregate(**{field: Sum(field) for field in ROLLUP_COUNTS})
+    return {field: value or 0 for field, value in totals.items()}
+
+
+def in_date_range(qs, start=None, end=None):
+    """Limit a DailyClassAttendance (or Attendance) queryset to start..end inclusive (either bound may be open)."""
+    if start:
+        qs = qs.filter(date__gte=start)
+    if end:
+        qs = qs.filter(date__lte=end)
+    return qs
+
+
+def aggregate_daily_attendance(attendance_qs):
+    """Group attendance rows into unsaved DailyClassAttendance rows (one query)."""
+    rows = (
+        attendance_qs.filter(enrollment__classroom__isnull=False, enrollment__academic_year__isnull=False)
+        .values('enrollment__academic_year_id', 'enrollment__classroom_id', 'enrollment__stream_id', 'date')
+        .annotate(**ROLLUP_COUNTS)
+        .order_by()
+    )
+    return [
+        DailyClassAttendance(
+            academic_year_id=row.pop('enrollment__academic_year_id'),
+            classroom_id=row.pop('enrollment__classroom_id'),
+            stream_id=row.pop('enrollment__stream_id'),
+            **row,
+        )
+        for row in rows
+    ]
+
+
+def get_rollup_keys(attendance_qs):
+    """(academic_year_id, classroom_id, date) keys touched by these attendance rows."""
+    return set(
+        attendance_qs.filter(enrollment__classroom__isnull=False)
+        .values_list('enrollment__academic_year_id', 'enrollment__classroom_id', 'date')
+        .distinct()
+    )
+
+
+def refresh_daily_rollups(keys):
+    """
+    Recompute the rollup rows for the given (academic_year_id, classroom_id, date)
+    keys from Attendance. Call inside the transaction that changed the attendance;
+    the classroom rows are locked so concurrent writers to one class queue up, and
+    their attendance_changed_at is set for flag_chronic_absenteeism.
+    """
+    by_year = {}
+    for year_id, classroom_id, day in keys:
+        if year_id and classroom_id:
+            classrooms, dates = by_year.setdefault(year_id, (set(), set()))
+            classrooms.add(classroom_id)
+            dates.add(day)
+
+    with transaction.atomic():
+        for year_id, (classroom_ids, dates) in by_year.items():
+            # The UPDATE locks the classroom rows; several are locked in id order first so
+            # two writers touching the same classrooms cannot deadlock
+            if len(classroom_ids) > 1:
+                list(Classroom.objects.select_for_update().filter(id__in=classroom_ids).order_by('id').values_list('id'))
+            Classroom.objects.filter(id__in=classroom_ids).update(attendance_changed_at=timezone.now())
+            DailyClassAttendance.objects.filter(
+                academic_year_id=year_id, classroom_id__in=classroom_ids, date__in=dates
+            ).delete()
+            DailyClassAttendance.objects.bulk_create(aggregate_daily_attendance(
+                Attendance.objects.filter(
+                    enrollment__academic_year_id=year_id,
+                    enrollment__classroom_id__in=classroom_ids,
+                    date__in=dates,
+                )
+            ))
+
+    # Cached report cards for these days are stale once the write commits
+    stale = [report_card_cache_key(year_id, day) for year_id, (_, dates) in by_year.items() for day in dates]
+    if stale:
+        transaction.on_commit(lambda: cache.delete_many(stale))
+
+
+def refresh_enrollment_counters(enrollments):
+    """
+    Recount present/absent/sick on an Enrollment queryset from Attendance in one UPDATE.
+    Call inside the transaction that changed the attendance.
+    """
+    def count(status):
+        records = (
+            Attendance.objects.filter(enrollment=OuterRef('pk'), status=status)
+            .order_by().values('enrollment').annotate(total=Count('id')).values('total')
+        )
+        return Coalesce(Subquery(records, output_field=IntegerField()), 0)
+
+    enrollments.update(
+        present_count=count('present'),
+        absent_count=count('absent'),
+        sick_count=count('sick'),
+    )
+
+
+def upsert_attendance(records):
+    """
+    Save a batch of Attendance rows with a single INSERT ... ON CONFLICT.
+    Rows that already exist for (student, date, enrollment) get their status,
+    marked_by and marked_at overwritten, matching the unique_attendance_per_day constraint.
+    The daily class rollups for the touched days and the enrollment counters
+    are refreshed in the same transaction.
+    """
+    if not records:
+        return []
+
+    with transaction.atomic():
+        saved = Attendance.objects.bulk_create(
+            records,
+            update_conflicts=True,
+            unique_fields=['student', 'date', 'enrollment'],
+            update_fields=['status', 'marked_by', 'marked_at'],
+        )
+        refresh_daily_rollups({
+            (record.enrollment.academic_year_id, record.enrollment.classroom_id, record.date)
+            for record in records
+            if record.enrollment
+        })
+        refresh_enrollment_counters(Enrollment.objects.filter(id__in={record.enrollment_id for record in records}))
+    return saved
+
+
+async def aupsert_attendance(records):
+    """Async upsert_attendance for ASGI views (the write and its rollup share one transaction)."""
+    return await sync_to_async(upsert_attendance)(records)
+
+
+# ================= REPORT CARDS =================
+
+def report_card_cache_key(academic_year_id, day):
+    return f'report_cards:{academic_year_id}:{day.isoformat()}'
+
+
+def get_report_card_counts(academic_year, start, end):
+    """
+    {classroom_id: {'total_students', 'present', 'absent', 'sick'}} for every classroom
+    of the year over start..end (either bound may be None), in two grouped queries.
+    Single days are cached per (year, day); attendance writes for that day clear the
+    entry and the timeout picks up enrollment changes. Ranges read the rollup directly.
+    """
+    key = report_card_cache_key(academic_year.id, start) if start and start == end else None
+    counts = cache.get(key) if key else None
+    if counts is not None:
+        return counts
+
+    counts = {}
+    enrolled = (
+        Enrollment.objects.filter(academic_year=academic_year, classroom__isnull=False, student__isnull=False)
+        .values('classroom_id')
+        .annotate(total=Count('student', distinct=True))
+        .order_by()
+    )
+    for row in enrolled:
+        counts[row['classroom_id']] = {'total_students': row['total'], 'present': 0, 'absent': 0, 'sick': 0}
+
+    day_totals = (
+        in_date_range(DailyClassAttendance.objects.filter(academic_year=academic_year), start, end)
+        .values('classroom_id')
+        .annotate(present=Sum('present'), absent=Sum('absent'), sick=Sum('sick'))
+        .order_by()
+    )
+    for row in day_totals:
+        classroom_counts = counts.setdefault(row['classroom_id'], {'total_students': 0})
+        classroom_counts.update(present=row['present'], absent=row['absent'], sick=row['sick'])
+
+    if key:
+        cache.set(key, counts, timeout=settings.REPORT_CARDS_CACHE_TIMEOUT)
+    return counts
+
+
+# ================= ADMIN DASHBOARD CACHE =================
+
+ADMIN_DASHBOARD_CACHE_KEY = 'admin_dashboard:counters'
+# Hits and misses of this process. Kept in memory: with the database cache a shared
+# counter would cost a write transaction on one row for every dashboard view.
+ADMIN_DASHBOARD_CACHE_OUTCOMES = Counter()
+_admin_dashboard_outcomes_lock = threading.Lock()
+
+
+def get_admin_dashboard_counters(active_year):
+    """
+    Headline counters and teacher assignments of the active year for admin_dashboard,
+    kept in the shared cache. Saving or deleting an Enrollment, Classroom or TeacherProfile
+    clears the entry (see signals.py); ADMIN_DASHBOARD_CACHE_TIMEOUT covers everything
+    else (e.g. a renamed user or stream).
+    """
+    counters = cache.get(ADMIN_DASHBOARD_CACHE_KEY)
+    if counters is not None and counters['year_id'] == active_year.id:
+        record_admin_dashboard_cache('hits')
+        return counters
+    record_admin_dashboard_cache('misses')
+
+    enrollments = Enrollment.objects.filter(academic_year=active_year)
+    counters = enrollments.aggregate(
+        total_students=Count('student', distinct=True, filter=Q(status='Active')),
+        total_teachers=Count('class_teacher', distinct=True),
+    )
+    counters['year_id'] = active_year.id
+    counters['classrooms_count'] = Classroom.objects.filter(year=active_year).count()
+    counters['teachers'] = [
+        {
+            'id': assignment.class_teacher.id,
+            'name': assignment.class_teacher.user.get_full_name(),
+            'username': assignment.class_teacher.user.username,
+            'classroom': assignment.classroom.name if assignment.classroom else '—',
+            'stream': assignment.stream.name if assignment.stream else '—',
+        }
+        for assignment in enrollments.filter(class_teacher__isnull=False).select_related(
+            'class_teacher__user', 'classroom', 'stream'
+        )
+    ]
+    cache.set(ADMIN_DASHBOARD_CACHE_KEY, counters, settings.ADMIN_DASHBOARD_CACHE_TIMEOUT)
+    return counters
+
+
+def invalidate_admin_dashboard_cache():
+    """Drop the cached admin dashboard counters once the current transaction commits."""
+    transaction.on_commit(lambda: cache.delete(ADMIN_DASHBOARD_CACHE_KEY))
+
+
+def record_admin_dashboard_cache(outcome):
+    with _admin_dashboard_outcomes_lock:
+        ADMIN_DASHBOARD_CACHE_OUTCOMES[outcome] += 1
+
+
+def get_admin_dashboard_cache_stats():
+    """Hit/miss totals of the admin dashboard cache in this worker process."""
+    stats = {'hits': ADMIN_DASHBOARD_CACHE_OUTCOMES['hits'], 'misses': ADMIN_DASHBOARD_CACHE_OUTCOMES['misses']}
+    requests_seen = stats['hits'] + stats['misses']
+    stats['hit_rate'] = round(stats['hits'] * 100 / requests_seen, 1) if requests_seen else None
+    stats['pid'] = os.getpid()
+    return stats
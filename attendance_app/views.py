@@ -1,8 +1,8 @@
 # ===============================
 # Django core imports
 # ===============================
-from django.shortcuts import render, redirect, get_object_or_404
-from django.http import HttpResponse, JsonResponse
+from django.shortcuts import render, redirect, get_object_or_404, aget_object_or_404
+from django.http import FileResponse, HttpResponse, JsonResponse, StreamingHttpResponse
 from django.contrib import messages
 from django.contrib.auth import (
     authenticate,
@@ -19,48 +19,62 @@ from django.core.paginator import Paginator
 from django.conf import settings
 from django.views.decorators.cache import never_cache
 from django.db import IntegrityError, transaction
-from django.db.models import Q, Prefetch
+from django.db.models import Count, F, OuterRef, Q, Prefetch, Subquery, Sum
+from django.db.models.functions import Coalesce
 from django.db.models.deletion import ProtectedError
 from django.utils import timezone
 from django.utils.timezone import now
 from django.core.exceptions import ValidationError
 from django.core.files.storage import default_storage
-from django.template.loader import render_to_string
 
 # ===============================
 # Python standard library
 # ===============================
 import csv
+import json
 import random
 import time
 import re
 import os
 import logging
+import tempfile
 from datetime import date, datetime
+from asgiref.sync import sync_to_async
 from math import radians, cos, sin, sqrt, atan2
 
 # ===============================
 # Third-party libraries
 # ===============================
 from reportlab.pdfgen import canvas
-import openpyxl
-from openpyxl.styles import Font, Alignment
-import africastalking
 import pandas as pd
-from xhtml2pdf import pisa
 
 # ===============================
 # Local app imports
 # ===============================
+from .analytics import freeze_academic_year, get_student_analytics
+from .exports import (
+    EXPORT_CONTENT_TYPES,
+    PDF_CONTENT_TYPE,
+    XLSX_CONTENT_TYPE,
+    get_export_storage,
+    request_export,
+    write_attendance_pdf,
+    write_attendance_xlsx,
+)
 from .models import (
+    AbsenteeismFlag,
     User,
     TeacherProfile,
     StudentProfile,
     ParentProfile,
     Classroom,
+    ClassSnapshot,
     AcademicYear,
     Attendance,
+    DailyClassAttendance,
+    ExportJob,
     SMSLog,
+    StudentSnapshot,
     Stream,
     SchoolSettings,
     Enrollment,
@@ -70,7 +84,28 @@ from .forms import (
     UserUpdateForm,
     AcademicYearForm,
 )
-from .utils import auto_lock_expired_academic_year, send_sms
+from .utils import (
+    ATTENDANCE_CODES,
+    adispatch_pending_sms,
+    aupsert_attendance,
+    auto_lock_expired_academic_year,
+    get_admin_dashboard_cache_stats,
+    get_admin_dashboard_counters,
+    get_enrollments_by_student,
+    get_notified_student_ids,
+    get_report_card_counts,
+    in_date_range,
+    get_rollup_keys,
+    get_students_by_teacher_scope,
+    normalize_parent_phone,
+    queue_absent_sms,
+    refresh_daily_rollups,
+    refresh_enrollment_counters,
+    send_sms,
+    sum_daily_rollups,
+    sms_breaker,
+    upsert_attendance,
+)
 from datetime import datetime
 from django.views.decorators.csrf import csrf_protect, ensure_csrf_cookie
 from django.http import JsonResponse
@@ -119,6 +154,26 @@ def get_teacher_current_assignment(teacher):
     return None, None
 
 
+def parse_register_payload(request):
+    """
+    Read the submitted register as {student_id: status}.
+    The page posts one `register` field holding {"<student id>": "p|a|s", ...};
+    plain `attendance_<id>` form fields are still accepted as a fallback.
+    """
+    raw = request.POST.get('register')
+    if raw is None:
+        return {
+            key[len('attendance_'):]: value
+            for key, value in request.POST.items()
+            if key.startswith('attendance_')
+        }
+
+    codes = json.loads(raw)
+    if not isinstance(codes, dict):
+        raise ValueError("register must be an object of student id -> status code")
+    return {str(student_id): ATTENDANCE_CODES.get(code, code) for student_id, code in codes.items()}
+
+
 def get_student_current_enrollment(student, academic_year=None):
     """Get student's current enrollment"""
     if not academic_year:
@@ -127,17 +182,64 @@ def get_student_current_enrollment(student, academic_year=None):
     return student.enrollments.filter(academic_year=academic_year).first()
 
 
-def get_students_by_teacher_scope(classroom, stream=None, academic_year=None):
-    """Return students linked to the class/stream via Enrollment."""
-    qs = StudentProfile.objects.filter(
-        enrollments__classroom=classroom,
-        enrollments__status='Active'
-    )
-    if stream:
-        qs = qs.filter(enrollments__stream=stream)
-    if academic_year:
-        qs = qs.filter(enrollments__academic_year=academic_year)
-    return qs.distinct()
+def parse_date_param(value):
+    """YYYY-MM-DD query value -> date, or None if missing or malformed."""
+    try:
+        return datetime.strptime(value, "%Y-%m-%d").date()
+    except (TypeError, ValueError):
+        return None
+
+
+def get_report_range(request, academic_year=None):
+    """
+    Date range asked for by a report: ?start=&end= (either may be left open),
+    else ?term= from the academic year's term calendar. POST requests read the form body.
+    Returns (start, end); (None, None) means the whole year.
+    """
+    params = request.POST if request.method == 'POST' else request.GET
+    start = parse_date_param(params.get('start'))
+    end = parse_date_param(params.get('end'))
+    if start or end:
+        if start and end and end < start:
+            start, end = end, start
+        return start, end
+
+    term = params.get('term')
+    if term and academic_year:
+        dates = academic_year.term_dates(term)
+        if dates:
+            return dates
+        # Say so rather than quietly reporting another period under the term's name
+        label = dict(AcademicYear.TERM_CHOICES).get(term, term)
+        messages.warning(
+            request, f"{label} has no dates set for {academic_year}, so it was not applied. "
+                     f"Set the term dates under Academic Years."
+        )
+    return None, None
+
+
+def get_term_choices(academic_year):
+    """(term, label) of the year's terms that have dates, for the term selectors."""
+    if not academic_year:
+        return []
+    return [(term, label) for term, label, start, _ in academic_year.term_calendar if start]
+
+
+def get_selected_term(request, academic_year):
+    """The ?term= being reported on, or '' when it is missing or has no dates in this year."""
+    term = request.GET.get('term', '')
+    return term if academic_year and academic_year.term_dates(term) else ''
+
+
+def get_snapshot_term(request, academic_year):
+    """
+    Snapshot term ('' for the whole year) that answers a report on a locked year,
+    or None when the year is still live or a custom ?start=&end= range was asked for.
+    """
+    if not academic_year.is_locked or request.GET.get('start') or request.GET.get('end'):
+        return None
+    term = request.GET.get('term')
+    return term if term and academic_year.term_dates(term) else ''
 
 
 # ================= AUTHENTICATION VIEWS =================
@@ -410,48 +512,12 @@ def admin_dashboard(request):
         # Get active academic year
         active_year = AcademicYear.objects.filter(is_active=True).first()
         
-        # ========== COUNT STUDENTS IN ACTIVE YEAR ONLY ==========
+        # Headline counters and teacher assignments of the active year, from the shared
+        # cache (cleared when enrollments, classrooms or teachers change)
         if active_year:
-            total_students = Enrollment.objects.filter(
-                academic_year=active_year,
-                status='Active',
-                student__isnull=False
-            ).values('student').distinct().count()
+            counters = get_admin_dashboard_counters(active_year)
         else:
-            total_students = 0
-        
-        # ========== COUNT TEACHERS IN ACTIVE YEAR ONLY ==========
-        if active_year:
-            total_teachers = Enrollment.objects.filter(
-                academic_year=active_year,
-                class_teacher__isnull=False
-            ).values('class_teacher').distinct().count()
-        else:
-            total_teachers = 0
-        
-        # ========== COUNT CLASSROOMS IN ACTIVE YEAR ONLY ==========
-        if active_year:
-            classrooms_count = Classroom.objects.filter(year=active_year).count()
-        else:
-            classrooms_count = 0
-        
-        # ========== GET TEACHERS WITH THEIR ASSIGNMENTS ==========
-        teachers_list = []
-        if active_year:
-            teacher_assignments = Enrollment.objects.filter(
-                academic_year=active_year,
-                class_teacher__isnull=False
-            ).select_related('class_teacher__user', 'classroom', 'stream')
-            
-            for assignment in teacher_assignments:
-                teacher = assignment.class_teacher
-                teachers_list.append({
-                    'id': teacher.id,
-                    'name': teacher.user.get_full_name(),
-                    'username': teacher.user.username,
-                    'classroom': assignment.classroom.name if assignment.classroom else '—',
-                    'stream': assignment.stream.name if assignment.stream else '—',
-                })
+            counters = {'total_students': 0, 'total_teachers': 0, 'classrooms_count': 0, 'teachers': []}
         
         # Get recent activities
         recent_students = []
@@ -470,13 +536,20 @@ def admin_dashboard(request):
                         'date': enrollment.enrollment_date if hasattr(enrollment, 'enrollment_date') else enrollment.academic_year.created_at,
                     })
         
+        # Early-warning flags from the nightly flag_chronic_absenteeism job
+        absenteeism_flags = AbsenteeismFlag.objects.filter(academic_year=active_year).select_related(
+            'student__user', 'classroom', 'stream'
+        )
+
         context = {
             'active_year': active_year,
-            'total_students': total_students,
-            'total_teachers': total_teachers,
-            'classrooms_count': classrooms_count,
-            'teachers': teachers_list,
+            'total_students': counters['total_students'],
+            'total_teachers': counters['total_teachers'],
+            'classrooms_count': counters['classrooms_count'],
+            'teachers': counters['teachers'],
             'recent_students': recent_students,
+            'absenteeism_flags': absenteeism_flags[:20],
+            'absenteeism_flag_count': absenteeism_flags.count(),
         }
         
         return render(request, 'attendance_app/admin_dashboard.html', context)
@@ -487,6 +560,14 @@ def admin_dashboard(request):
         return redirect('login')
 
 
+@never_cache
+@login_required
+@user_passes_test(lambda u: u.role == 'admin')
+def admin_dashboard_cache_stats(request):
+    """Hit/miss totals of the admin dashboard counter cache in the worker that answers (JSON)."""
+    return JsonResponse(get_admin_dashboard_cache_stats())
+
+
 # ================= TEACHER MANAGEMENT VIEWS =================
 
 @never_cache
@@ -638,18 +719,10 @@ def register_teacher(request):
             # ===== SEND SMS =====
             if phone_number:
                 try:
-                    africastalking.initialize(
-                        username=settings.AFRICASTALKING_USERNAME,
-                        api_key=settings.AFRICASTALKING_API_KEY
-                    )
-                    sms = africastalking.SMS
-                    sms.send(
-                        message=(
-                            f"Habari {first_name}, account yako "
-                            f"imesajiliwa kwa .\nEmail: {email}\nPassword: {DEFAULT_PASSWORD}"
-                        ),
-                        recipients=[phone_number],
-                        sender_id='School_SMS'
+                    send_sms(
+                        phone_number,
+                        f"Habari {first_name}, account yako "
+                        f"imesajiliwa kwa .\nEmail: {email}\nPassword: {DEFAULT_PASSWORD}"
                     )
                 except Exception as e:
                     logger.error(f"SMS failed: {e}")
@@ -1125,16 +1198,22 @@ def manage_student(request):
         
         if selected_academic_year:
             # Get classrooms for selected academic year only
-            classrooms = Classroom.objects.filter(year=selected_academic_year).order_by('name')
+            classrooms = Classroom.objects.filter(year=selected_academic_year).select_related('year').order_by('name')
             
             # Add student count to each classroom (include ALL statuses for counting)
-    # Count ONLY students for this academic year
-            for classroom in classrooms:
-                classroom.student_count = Enrollment.objects.filter(
-                    classroom=classroom,
+            # Count ONLY students for this academic year; locked years read their snapshots
+            student_counts = {}
+            if selected_academic_year.is_locked:
+                student_counts = dict(ClassSnapshot.objects.filter(
+                    academic_year=selected_academic_year, term='', stream__isnull=True
+                ).values_list('classroom_id', 'students_count'))
+            if not student_counts:
+                student_counts = dict(Enrollment.objects.filter(
                     academic_year=selected_academic_year,
                     student__isnull=False
-                ).count()
+                ).values('classroom_id').annotate(total=Count('id')).values_list('classroom_id', 'total').order_by())
+            for classroom in classrooms:
+                classroom.student_count = student_counts.get(classroom.id, 0)
             
             # If a classroom is selected, get its students
             if selected_classroom_id:
@@ -1589,6 +1668,11 @@ def edit_student_page(request, student_id):
 
         try:
             with transaction.atomic():
+                # Days this student already counts towards, by class (rollups move with them)
+                rollup_keys = get_rollup_keys(student.attendances.all())
+                old_gender = student.user.gender
+                old_placement = (enrollment.classroom_id, enrollment.stream_id) if enrollment else None
+
                 # UPDATE STUDENT USER
                 student.user.first_name = first_name
                 student.user.last_name = last_name
@@ -1621,6 +1705,10 @@ def edit_student_page(request, student_id):
                 if enrollment:
                     enrollment.save()
 
+                new_placement = (enrollment.classroom_id, enrollment.stream_id) if enrollment else None
+                if gender != old_gender or new_placement != old_placement:
+                    refresh_daily_rollups(rollup_keys | get_rollup_keys(student.attendances.all()))
+
                 # UPDATE OR CREATE PARENT
                 parent_names = parent_full_name.split(' ', 1)
                 parent_first = parent_names[0]
@@ -1692,17 +1780,22 @@ def edit_student_teacher(request, student_id):
         active_year = AcademicYear.objects.filter(is_active=True).first()
 
         if request.method == 'POST':
+            rollup_keys = get_rollup_keys(student.attendances.all())
+            old_gender = student.user.gender
+
             student.user.first_name = request.POST.get('first_name', student.user.first_name)
             student.user.last_name = request.POST.get('last_name', student.user.last_name)
             student.user.gender = request.POST.get('gender', student.user.gender)
             student.admission_number = request.POST.get('admission_number', student.admission_number)
             student.user.save()
             student.save()
+            placement_changed = student.user.gender != old_gender
 
             # Update enrollment for class & stream (only admin)
             if request.user.role == 'admin':
                 enrollment = student.enrollments.filter(academic_year=active_year).first()
                 if enrollment:
+                    old_placement = (enrollment.classroom_id, enrollment.stream_id)
                     classroom_id = request.POST.get('classroom')
                     if classroom_id:
                         enrollment.classroom = Classroom.objects.filter(id=classroom_id).first()
@@ -1710,6 +1803,10 @@ def edit_student_teacher(request, student_id):
                     if stream_id:
                         enrollment.stream = Stream.objects.filter(id=stream_id).first()
                     enrollment.save()
+                    placement_changed = placement_changed or old_placement != (enrollment.classroom_id, enrollment.stream_id)
+
+            if placement_changed:
+                refresh_daily_rollups(rollup_keys | get_rollup_keys(student.attendances.all()))
 
             if parent:
                 full_name = request.POST.get('parent_full_name', '').strip()
@@ -1830,11 +1927,14 @@ def delete_student(request, student_id):
                 parent_count = ParentProfile.objects.filter(student=student).count()
                 enrollment_count = student.enrollments.count()
                 
+                rollup_keys = get_rollup_keys(Attendance.objects.filter(student=student))
+
                 # Delete all related data in correct order
                 SMSLog.objects.filter(student=student).delete()
                 ParentProfile.objects.filter(student=student).delete()
                 Attendance.objects.filter(student=student).delete()
                 student.enrollments.all().delete()
+                refresh_daily_rollups(rollup_keys)
                 
                 # Delete student profile and user
                 student.delete()
@@ -1865,11 +1965,14 @@ def delete_student(request, student_id):
         
         academic_year = get_object_or_404(AcademicYear, id=selected_year_id)
         
-        # Delete only enrollment for selected year
-        deleted_count, _ = Enrollment.objects.filter(
-            student=student,
-            academic_year=academic_year
-        ).delete()
+        # Delete only enrollment for selected year (its attendance goes with it)
+        with transaction.atomic():
+            rollup_keys = get_rollup_keys(Attendance.objects.filter(enrollment__student=student, enrollment__academic_year=academic_year))
+            deleted_count, _ = Enrollment.objects.filter(
+                student=student,
+                academic_year=academic_year
+            ).delete()
+            refresh_daily_rollups(rollup_keys)
         
         if deleted_count > 0:
             messages.success(
@@ -1978,7 +2081,7 @@ def my_students(request):
 @login_required
 def teacher_dashboard(request):
     try:
-        """OPTIMIZED - Single query version"""
+        """Dashboard for the teacher's class in the active year (a fixed number of queries)."""
         teacher_profile = TeacherProfile.objects.select_related('user').get(user=request.user)
         active_year = AcademicYear.objects.filter(is_active=True).first()
         
@@ -1994,38 +2097,42 @@ def teacher_dashboard(request):
         classroom = enrollment.classroom if enrollment else None
         stream = enrollment.stream if enrollment else None
 
-        # OPTIMIZED: Get all students in one query
-        students = StudentProfile.objects.filter(
-            enrollments__classroom=classroom,
-            enrollments__academic_year=active_year
-        ).select_related('user').distinct()
-        
+        # The teacher's class this year; its size and attendance totals come from
+        # the per-enrollment counters, so one query whatever the history
+        roster = Enrollment.objects.filter(
+            academic_year=active_year,
+            classroom=classroom,
+            student__isnull=False
+        ) if classroom else Enrollment.objects.none()
         if stream:
-            students = students.filter(enrollments__stream=stream)
-        
-        total_students = students.count()
-        student_ids = list(students.values_list('id', flat=True))
-        
-        # OPTIMIZED: Get attendance counts in one query using aggregation
-        from django.db.models import Count, Q, Case, When, IntegerField, Sum
-        
-        attendance_counts = Attendance.objects.filter(
-            student_id__in=student_ids
-        ).aggregate(
-            total=Count('id'),
-            present=Sum(Case(When(status='present', then=1), default=0, output_field=IntegerField())),
-            absent=Sum(Case(When(status='absent', then=1), default=0, output_field=IntegerField())),
-            sick=Sum(Case(When(status='sick', then=1), default=0, output_field=IntegerField()))
+            roster = roster.filter(stream=stream)
+
+        attendance_counts = roster.aggregate(
+            students=Count('student', distinct=True),
+            present=Coalesce(Sum('present_count'), 0),
+            absent=Coalesce(Sum('absent_count'), 0),
+            sick=Coalesce(Sum('sick_count'), 0),
         )
+        attendance_counts['total'] = attendance_counts['present'] + attendance_counts['absent'] + attendance_counts['sick']
+        total_students = attendance_counts['students']
+        student_ids = roster.values('student_id')
+
+        students = StudentProfile.objects.filter(id__in=student_ids).select_related('user')
         
-        # OPTIMIZED: Get parents in one query
+        # Parents and recent SMS logs of the class (roster as a subquery)
         parents = ParentProfile.objects.filter(student_id__in=student_ids).select_related('user')
         
-        # OPTIMIZED: Get recent SMS logs in one query
         sms_logs = SMSLog.objects.filter(student_id__in=student_ids).select_related(
             'student__user', 'parent__user'
         ).order_by('-timestamp')[:10]
 
+        # Early-warning flags from the nightly flag_chronic_absenteeism job
+        absenteeism_flags = AbsenteeismFlag.objects.filter(
+            academic_year=active_year, classroom=classroom
+        ).select_related('student__user')
+        if stream:
+            absenteeism_flags = absenteeism_flags.filter(stream=stream)
+
         context = {
             'teacher': teacher_profile,
             'classroom': classroom,
@@ -2033,11 +2140,12 @@ def teacher_dashboard(request):
             'students': students,
             'parents': parents,
             'total_students': total_students,
-            'total_attendance': attendance_counts['total'] or 0,
-            'present_count': attendance_counts['present'] or 0,
-            'absent_count': attendance_counts['absent'] or 0,
-            'sick_count': attendance_counts['sick'] or 0,
+            'total_attendance': attendance_counts['total'],
+            'present_count': attendance_counts['present'],
+            'absent_count': attendance_counts['absent'],
+            'sick_count': attendance_counts['sick'],
             'sms_logs': sms_logs,
+            'absenteeism_flags': absenteeism_flags,
         }
 
         return render(request, 'attendance_app/teacher_dashboard.html', context)
@@ -2071,68 +2179,88 @@ def mark_attendance(request):
         classroom = teacher_enrollment.classroom
         stream = teacher_enrollment.stream
 
-        students_list = get_students_by_teacher_scope(classroom, stream, academic_year=active_year).order_by('admission_number')
-        paginator = Paginator(students_list, 25)
-        page_number = request.GET.get('page')
-        students = paginator.get_page(page_number)
+        # The whole class is marked on one page and saved in one submit
+        students = list(
+            get_students_by_teacher_scope(classroom, stream, academic_year=active_year)
+            .select_related('user')
+            .order_by('admission_number')
+        )
 
         if request.method == "POST":
             today = timezone.localdate()
             
             # Track SMS results
-            total_sms_sent = 0
+            total_sms_queued = 0
             total_sms_failed = 0
             sms_errors = []
-            low_balance_detected = False
 
+            try:
+                submitted = parse_register_payload(request)
+            except ValueError:
+                messages.error(request, "Invalid attendance data. Please try again.")
+                return redirect('mark_attendance')
+
+            enrollments = get_enrollments_by_student(students, active_year)
+            valid_statuses = {choice for choice, _ in Attendance.STATUS_CHOICES}
+
+            # Build the whole register, then save it with one upsert.
+            # Students missing from the payload are marked present.
+            marked_at = timezone.now()
+            register = []
+            absent_students = []
             for student in students:
-                status = request.POST.get(f'attendance_{student.id}', 'present')
-                student_enrollment = Enrollment.objects.filter(student=student, academic_year=active_year).first()
+                status = submitted.get(str(student.id), 'present')
+                if status not in valid_statuses:
+                    status = 'present'
 
-                # Save attendance
-                Attendance.objects.update_or_create(
+                student_enrollment = enrollments.get(student.id)
+                if not student_enrollment:
+                    continue
+
+                register.append(Attendance(
                     student=student,
                     date=today,
                     enrollment=student_enrollment,
-                    defaults={'status': status, 'marked_by': teacher}
-                )
-
-                # Send SMS only for absent students
+                    status=status,
+                    marked_by=teacher,
+                    marked_at=marked_at,
+                ))
                 if status == 'absent':
-                    # Check if SMS already sent today
-                    start = timezone.now().replace(hour=0, minute=0, second=0, microsecond=0)
-                    end = timezone.now().replace(hour=23, minute=59, second=59, microsecond=999999)
-                    sms_exists = SMSLog.objects.filter(student=student, timestamp__range=(start, end)).exists()
-
-                    if not sms_exists:
-                        try:
-                            success_count, failed_count, error_msgs = send_absent_sms(student, teacher=teacher)
-                            total_sms_sent += success_count
-                            total_sms_failed += failed_count
-                            
-                            # Check for low balance error
-                            for msg in error_msgs:
-                                if 'salio' in msg.lower() or 'balance' in msg.lower():
-                                    low_balance_detected = True
-                                sms_errors.append(f"{student.user.get_full_name()}: {msg}")
-                                
-                        except Exception as e:
-                            total_sms_failed += 1
-                            logger.error(f"Error sending absent SMS for {student.id}: {e}")
-                            sms_errors.append(f"{student.user.get_full_name()}: System error")
+                    absent_students.append(student)
+
+            upsert_attendance(register)
+
+            # Queue SMS only for absent students; the dispatch_sms worker sends them.
+            # Students who already got today's notice are looked up in one query.
+            notified = get_notified_student_ids([s.id for s in absent_students], today)
+            for student in absent_students:
+                if student.id in notified:
+                    continue
+
+                try:
+                    queued_count, failed_count, error_msgs = queue_absent_sms(
+                        student, teacher=teacher, classroom=classroom
+                    )
+                    total_sms_queued += queued_count
+                    total_sms_failed += failed_count
+
+                    for msg in error_msgs:
+                        sms_errors.append(f"{student.user.get_full_name()}: {msg}")
+
+                except Exception as e:
+                    total_sms_failed += 1
+                    logger.error(f"Error queueing absent SMS for {student.id}: {e}")
+                    sms_errors.append(f"{student.user.get_full_name()}: System error")
 
             # Prepare feedback message
             feedback_parts = [f" Attendance marked successfully for {today.strftime('%d/%m/%Y')}"]
             
-            if total_sms_sent > 0:
-                feedback_parts.append(f" SMS sent: {total_sms_sent} parent(s)")
+            if total_sms_queued > 0:
+                feedback_parts.append(f" SMS queued: {total_sms_queued} parent(s)")
             
             if total_sms_failed > 0:
                 feedback_parts.append(f" SMS failed: {total_sms_failed}")
             
-            if low_balance_detected:
-                feedback_parts.append(" ONYO: Salio la SMS limepungua au halipo!")
-            
             # Show main success message
             messages.success(request, " | ".join(feedback_parts))
             
@@ -2143,9 +2271,12 @@ def mark_attendance(request):
             if len(sms_errors) > 3:
                 messages.info(request, f"... na {len(sms_errors) - 3} errors nyingine")
             
-            # Special alert for low balance
-            if low_balance_detected:
-                messages.error(request, " TAHADHARI: Salio la SMS halipo! Wasiliana na Admin kuongeza salio.")
+            # Special alert when the SMS gateway is paused by the circuit breaker
+            if total_sms_queued > 0 and sms_breaker.state() != 'closed':
+                if sms_breaker.reason() == 'balance':
+                    messages.error(request, " TAHADHARI: Salio la SMS halipo! Wasiliana na Admin kuongeza salio.")
+                else:
+                    messages.warning(request, " SMS service is unreachable. Messages will be sent when it recovers.")
             
             return redirect('view_attendance')
 
@@ -2162,6 +2293,137 @@ def mark_attendance(request):
         return redirect('teacher_dashboard')
 
 
+@never_cache
+@login_required
+@user_passes_test(lambda u: u.role == 'teacher')
+async def mark_attendance_async(request):
+    """
+    Async twin of mark_attendance for ASGI workers.
+    The register is saved with async ORM calls and the absence SMS it queues are
+    delivered in the same request with concurrent gateway calls, so waiting on the
+    gateway does not hold a worker thread. Anything not delivered stays queued
+    for the dispatch_sms worker.
+    """
+    try:
+        user = await request.auser()
+        teacher = await aget_object_or_404(TeacherProfile, user=user)
+        active_year = await AcademicYear.objects.filter(is_active=True).afirst()
+
+        if not active_year:
+            messages.error(request, "No active academic year found.")
+            return redirect('teacher_dashboard')
+
+        teacher_enrollment = await Enrollment.objects.filter(
+            class_teacher=teacher,
+            academic_year=active_year
+        ).select_related('classroom__year', 'stream').afirst()
+
+        if not teacher_enrollment or not teacher_enrollment.classroom:
+            messages.error(request, "You are not assigned to a classroom or stream.")
+            return redirect('teacher_dashboard')
+
+        classroom = teacher_enrollment.classroom
+        stream = teacher_enrollment.stream
+
+        students = [
+            student async for student in
+            get_students_by_teacher_scope(classroom, stream, academic_year=active_year)
+            .select_related('user')
+            .order_by('admission_number')
+        ]
+
+        if request.method != "POST":
+            context = {
+                'students': students,
+                'classroom': classroom,
+                'stream': stream,
+                'teacher': teacher,
+                'submit_url': reverse('mark_attendance_async'),
+            }
+            return await sync_to_async(render)(request, 'attendance_app/mark_attendance.html', context)
+
+        today = timezone.localdate()
+        try:
+            submitted = parse_register_payload(request)
+        except ValueError:
+            messages.error(request, "Invalid attendance data. Please try again.")
+            return redirect('mark_attendance_async')
+
+        enrollments = {
+            enrollment.student_id: enrollment
+            async for enrollment in Enrollment.objects.filter(student__in=students, academic_year=active_year)
+        }
+        valid_statuses = {choice for choice, _ in Attendance.STATUS_CHOICES}
+
+        marked_at = timezone.now()
+        register = []
+        absent_students = []
+        for student in students:
+            status = submitted.get(str(student.id), 'present')
+            if status not in valid_statuses:
+                status = 'present'
+
+            student_enrollment = enrollments.get(student.id)
+            if not student_enrollment:
+                continue
+
+            register.append(Attendance(
+                student=student,
+                date=today,
+                enrollment=student_enrollment,
+                status=status,
+                marked_by=teacher,
+                marked_at=marked_at,
+            ))
+            if status == 'absent':
+                absent_students.append(student)
+
+        await aupsert_attendance(register)
+
+        total_sms_queued = 0
+        total_sms_failed = 0
+        notified = await sync_to_async(get_notified_student_ids)([s.id for s in absent_students], today)
+        for student in absent_students:
+            if student.id in notified:
+                continue
+            try:
+                queued_count, failed_count, _ = await sync_to_async(queue_absent_sms)(
+                    student, teacher=teacher, classroom=classroom
+                )
+                total_sms_queued += queued_count
+                total_sms_failed += failed_count
+            except Exception as e:
+                total_sms_failed += 1
+                logger.error(f"Error queueing absent SMS for {student.id}: {e}")
+
+        sms_sent = 0
+        if total_sms_queued:
+            sms_sent, sms_failed = await adispatch_pending_sms(
+                limit=total_sms_queued,
+                student_ids=[s.id for s in absent_students],
+            )
+            total_sms_failed += sms_failed
+
+        feedback_parts = [f" Attendance marked successfully for {today.strftime('%d/%m/%Y')}"]
+        if total_sms_queued > 0:
+            feedback_parts.append(f" SMS sent: {sms_sent}/{total_sms_queued} parent(s)")
+        if total_sms_failed > 0:
+            feedback_parts.append(f" SMS failed: {total_sms_failed}")
+        messages.success(request, " | ".join(feedback_parts))
+
+        if sms_sent < total_sms_queued and await sync_to_async(sms_breaker.state)() != 'closed':
+            if await sync_to_async(sms_breaker.reason)() == 'balance':
+                messages.error(request, " TAHADHARI: Salio la SMS halipo! Wasiliana na Admin kuongeza salio.")
+            else:
+                messages.warning(request, " SMS service is unreachable. Messages will be sent when it recovers.")
+
+        return redirect('view_attendance')
+    except Exception as e:
+        logger.error(f"Error in mark_attendance_async: {e}")
+        messages.error(request, f"An error occurred: {str(e)}")
+        return redirect('teacher_dashboard')
+
+
 
 @never_cache
 @login_required
@@ -2196,35 +2458,44 @@ def view_attendance(request):
         else:
             selected_date = timezone.localdate()
 
-        # GET ALL STUDENTS in the class (for total counts)
-        all_students_qs = StudentProfile.objects.filter(
-            enrollments__classroom=classroom,
-            enrollments__academic_year=active_year
-        ).select_related('user').distinct()
-        
+        # Class roster for the year; stays a subquery instead of a list of ids
+        roster = Enrollment.objects.filter(
+            academic_year=active_year,
+            classroom=classroom,
+            student__isnull=False
+        )
         if stream:
-            all_students_qs = all_students_qs.filter(enrollments__stream=stream)
-        
-        # Get ALL student IDs
-        all_student_ids = list(all_students_qs.values_list('id', flat=True))
-        students_count = len(all_student_ids)
-        
-        # Get gender counts from ALL students
-        male_student_ids = list(all_students_qs.filter(user__gender__iexact='Male').values_list('id', flat=True))
-        female_student_ids = list(all_students_qs.filter(user__gender__iexact='Female').values_list('id', flat=True))
-        male_count = len(male_student_ids)
-        female_count = len(female_student_ids)
+            roster = roster.filter(stream=stream)
+
+        # Roster size and gender split in one query
+        roster_counts = roster.aggregate(
+            students=Count('student', distinct=True),
+            male=Count('student', distinct=True, filter=Q(student__user__gender__iexact='Male')),
+            female=Count('student', distinct=True, filter=Q(student__user__gender__iexact='Female')),
+        )
+        students_count = roster_counts['students']
+        male_count = roster_counts['male']
+        female_count = roster_counts['female']
         
         # Get attendance for selected date
         attendance_qs = Attendance.objects.filter(
-            student_id__in=all_student_ids,
+            student_id__in=roster.values('student_id'),
             date=selected_date
-        ).select_related('student__user', 'marked_by__user')
+        ).select_related('student__user', 'marked_by__user').order_by(
+            'student__user__first_name', 'student__user__last_name', 'id'
+        )
         
-        # Calculate totals from attendance records
-        total_present = attendance_qs.filter(status='present').count()
-        total_absent = attendance_qs.filter(status='absent').count()
-        total_sick = attendance_qs.filter(status='sick').count()
+        # Day totals come from the daily class rollup
+        class_day = DailyClassAttendance.objects.filter(
+            academic_year=active_year, classroom=classroom, date=selected_date
+        )
+        if stream:
+            class_day = class_day.filter(stream=stream)
+        day_counts = sum_daily_rollups(class_day)
+
+        total_present = day_counts['present']
+        total_absent = day_counts['absent']
+        total_sick = day_counts['sick']
         total_records = total_present + total_absent + total_sick
         
         # Calculate percentages based on students who have attendance records
@@ -2235,11 +2506,10 @@ def view_attendance(request):
         else:
             present_percentage = absent_percentage = sick_percentage = 0
         
-        # Calculate Male attendance from attendance records
-        male_attendance = attendance_qs.filter(student_id__in=male_student_ids)
-        male_present = male_attendance.filter(status='present').count()
-        male_absent = male_attendance.filter(status='absent').count()
-        male_sick = male_attendance.filter(status='sick').count()
+        # Male attendance
+        male_present = day_counts['male_present']
+        male_absent = day_counts['male_absent']
+        male_sick = day_counts['male_sick']
         male_total = male_present + male_absent + male_sick
         
         # Calculate Male percentages
@@ -2250,11 +2520,10 @@ def view_attendance(request):
         else:
             male_present_pct = male_absent_pct = male_sick_pct = 0
         
-        # Calculate Female attendance from attendance records
-        female_attendance = attendance_qs.filter(student_id__in=female_student_ids)
-        female_present = female_attendance.filter(status='present').count()
-        female_absent = female_attendance.filter(status='absent').count()
-        female_sick = female_attendance.filter(status='sick').count()
+        # Female attendance
+        female_present = day_counts['female_present']
+        female_absent = day_counts['female_absent']
+        female_sick = day_counts['female_sick']
         female_total = female_present + female_absent + female_sick
         
         # Calculate Female percentages
@@ -2277,6 +2546,7 @@ def view_attendance(request):
             "attendance_records": attendance_records,
             "selected_date": selected_date.strftime("%Y-%m-%d"),
             "today": timezone.localdate(),
+            "term_calendar": [term for term in active_year.term_calendar if term[2]] if active_year else [],
             "students_count": students_count,
             "total_present": total_present,
             "total_absent": total_absent,
@@ -2320,8 +2590,11 @@ def edit_attendance(request, pk):
     if request.method == "POST":
         new_status = request.POST.get("status")
         if new_status in ["present", "absent", "sick"]:
-            attendance.status = new_status
-            attendance.save()
+            with transaction.atomic():
+                attendance.status = new_status
+                attendance.save()
+                refresh_daily_rollups(get_rollup_keys(Attendance.objects.filter(pk=attendance.pk)))
+                refresh_enrollment_counters(Enrollment.objects.filter(id=attendance.enrollment_id))
             
             # Hapa tunaiweka kwenye session ya Django Messages kabla ya kurudisha JSON.
             # Ukurasa ukijirefresh kupitia JS, base.html itaikuta na kuonyesha Toast kiotomatiki.
@@ -2345,7 +2618,11 @@ def delete_attendance(request, pk):
     if request.method == "POST" and request.headers.get("x-requested-with") == "XMLHttpRequest":
         try:
             attendance = get_object_or_404(Attendance, pk=pk)
-            attendance.delete()
+            with transaction.atomic():
+                rollup_keys = get_rollup_keys(Attendance.objects.filter(pk=attendance.pk))
+                attendance.delete()
+                refresh_daily_rollups(rollup_keys)
+                refresh_enrollment_counters(Enrollment.objects.filter(id=attendance.enrollment_id))
             return JsonResponse({"success": True, "message": "Attendance record deleted successfully."})
         except Exception as e:
             return JsonResponse({"success": False, "message": f"Failed to delete: {str(e)}"})
@@ -2354,6 +2631,10 @@ def delete_attendance(request, pk):
 
 @login_required
 def attendance_export_pdf(request):
+    """
+    Attendance register of the teacher's class as PDF, for one day (?date=, default today)
+    or a term/range (?term= or ?start=&end=), drawn directly with reportlab.
+    """
     teacher = get_object_or_404(TeacherProfile, user=request.user)
     classroom, stream = get_teacher_current_assignment(teacher)
     active_year = AcademicYear.objects.filter(is_active=True).first()
@@ -2362,33 +2643,30 @@ def attendance_export_pdf(request):
         messages.error(request, "You are not assigned to any classroom.")
         return redirect('teacher_dashboard')
 
-    raw_date = request.GET.get("date")
-    try:
-        selected_date = datetime.strptime(raw_date, "%Y-%m-%d").date() if raw_date else now().date()
-    except ValueError:
-        selected_date = now().date()
-
-    students = get_students_by_teacher_scope(classroom, stream, academic_year=active_year)
-    qs = Attendance.objects.filter(student__in=students, date=selected_date).select_related("student", "student__user")
-
-    html = render_to_string("attendance_app/attendance_pdf.html", {
-        "records": qs,
-        "classroom": classroom,
-        "date": selected_date
-    })
-
-    response = HttpResponse(content_type="application/pdf")
-    response["Content-Disposition"] = f'attachment; filename=Attendance_{classroom.name}_{selected_date}.pdf'
+    range_start, range_end = get_report_range(request, active_year)
+    if not (range_start or range_end):
+        range_start = range_end = parse_date_param(request.GET.get("date")) or now().date()
 
-    pisa_status = pisa.CreatePDF(html, dest=response)
-    if pisa_status.err:
-        return HttpResponse("Error generating PDF", status=500)
+    output = tempfile.TemporaryFile()
+    write_attendance_pdf(output, active_year, classroom, stream, range_start, range_end)
+    output.seek(0)
 
-    return response
+    period = "_".join(str(day) for day in dict.fromkeys((range_start, range_end)) if day)
+    return FileResponse(
+        output,
+        as_attachment=True,
+        filename=f"Attendance_{classroom.name}_{period}.pdf",
+        content_type=PDF_CONTENT_TYPE,
+    )
 
 
 @login_required
 def attendance_export_excel(request):
+    """
+    Attendance register of the teacher's class as XLSX: one day (?date=, default today) or a
+    term/range (?term= or ?start=&end=, which also adds a Student Analytics sheet).
+    Written by a write-only workbook to a temporary file and streamed back.
+    """
     teacher = get_object_or_404(TeacherProfile, user=request.user)
     classroom, stream = get_teacher_current_assignment(teacher)
     active_year = AcademicYear.objects.filter(is_active=True).first()
@@ -2397,78 +2675,122 @@ def attendance_export_excel(request):
         messages.error(request, "You are not assigned to any classroom.")
         return redirect('teacher_dashboard')
 
-    raw_date = request.GET.get("date")
-    try:
-        selected_date = datetime.strptime(raw_date, "%Y-%m-%d").date() if raw_date else now().date()
-    except ValueError:
-        selected_date = now().date()
-
-    students = get_students_by_teacher_scope(classroom, stream, academic_year=active_year)
-    qs = Attendance.objects.filter(student__in=students, date=selected_date).select_related("student", "student__user")
-
-    total = qs.count()
-    present = qs.filter(status="present").count()
-    absent = qs.filter(status="absent").count()
-    sick = qs.filter(status="sick").count()
-
-    def pct(x):
-        return round((x / total) * 100, 1) if total else 0
-
-    male_qs = qs.filter(student__user__gender="male")
-    female_qs = qs.filter(student__user__gender="female")
-
-    wb = openpyxl.Workbook()
-    ws = wb.active
-    ws.title = "Attendance"
-
-    bold = Font(bold=True)
-    center = Alignment(horizontal="center")
-
-    row = 1
-    ws.merge_cells(start_row=row, start_column=1, end_row=row, end_column=6)
-    ws.cell(row=row, column=1, value="SMARTPRESENCE – ATTENDANCE REPORT").font = bold
-    ws.cell(row=row, column=1).alignment = center
-    row += 2
-
-    ws.append(["Class:", classroom.name, "Year:", str(classroom.year), "Date:", selected_date.strftime("%Y-%m-%d")])
-    for col in range(1, 7):
-        ws.cell(row=row, column=col).font = bold
-    row += 2
-
-    ws.append(["SUMMARY"])
-    ws.cell(row=row, column=1).font = bold
-    row += 1
-    ws.append(["Total Students", total])
-    ws.append(["Present", f"{present} ({pct(present)}%)"])
-    ws.append(["Absent", f"{absent} ({pct(absent)}%)"])
-    ws.append(["Sick", f"{sick} ({pct(sick)}%)"])
-    row += 2
-
-    ws.append(["GENDER SUMMARY"])
-    ws.cell(row=row, column=1).font = bold
-    row += 1
-    ws.append(["Male", male_qs.count(), f"Present {male_qs.filter(status='present').count()}", f"Absent {male_qs.filter(status='absent').count()}", f"Sick {male_qs.filter(status='sick').count()}"])
-    ws.append(["Female", female_qs.count(), f"Present {female_qs.filter(status='present').count()}", f"Absent {female_qs.filter(status='absent').count()}", f"Sick {female_qs.filter(status='sick').count()}"])
-    row += 2
-
-    headers = ["No", "Admission No", "Student Name", "Gender", "Status", "Date"]
-    ws.append(headers)
-    for col in range(1, len(headers) + 1):
-        ws.cell(row=row, column=col).font = bold
-        ws.cell(row=row, column=col).alignment = center
-    row += 1
-
-    for i, r in enumerate(qs, start=1):
-        ws.append([i, r.student.admission_number, r.student.user.get_full_name(), r.student.user.gender.capitalize() if r.student.user.gender else "", r.status.capitalize(), r.date.strftime("%Y-%m-%d")])
-
-    widths = [6, 18, 28, 12, 14, 14]
-    for i, w in enumerate(widths, start=1):
-        ws.column_dimensions[openpyxl.utils.get_column_letter(i)].width = w
-
-    response = HttpResponse(content_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet")
-    response["Content-Disposition"] = f'attachment; filename=Attendance_{classroom.name}_{selected_date}.xlsx'
-    wb.save(response)
-    return response
+    range_start, range_end = get_report_range(request, active_year)
+    is_range = bool(range_start or range_end)
+    if not is_range:
+        range_start = range_end = parse_date_param(request.GET.get("date")) or now().date()
+
+    output = tempfile.TemporaryFile()
+    write_attendance_xlsx(output, active_year, classroom, stream, range_start, range_end, analytics=is_range)
+    output.seek(0)
+
+    period = "_".join(str(day) for day in dict.fromkeys((range_start, range_end)) if day)
+    return FileResponse(
+        output,
+        as_attachment=True,
+        filename=f"Attendance_{classroom.name}_{period}.xlsx",
+        content_type=XLSX_CONTENT_TYPE,
+    )
+
+
+# ================= EXPORT JOB VIEWS =================
+
+def export_job_payload(job):
+    payload = {
+        "id": job.id,
+        "status": job.status,
+        "progress": job.progress,
+        "error": job.error,
+        "status_url": reverse("export_status", args=[job.id]),
+        "download_url": None,
+    }
+    if job.status == 'done':
+        payload["download_url"] = reverse("download_export", args=[job.id])
+    return payload
+
+
+def get_export_job_for_user(user, job_id):
+    jobs = ExportJob.objects.select_related('academic_year', 'classroom')
+    if user.role != 'admin':
+        jobs = jobs.filter(requested_by=user)
+    return get_object_or_404(jobs, id=job_id)
+
+
+@never_cache
+@login_required
+@user_passes_test(lambda u: u.role in ['admin', 'teacher'])
+def export_request(request):
+    """
+    Queue an attendance register export (POST format=xlsx|pdf plus date=, term= or start=&end=)
+    for run_export_jobs. Teachers export their own class; admins pass classroom= and optional stream=.
+    format=zip (admins only) bundles every class and stream of year= (default: the active year)
+    over the term or range, or the whole year when none is given.
+    Answers with the job's status, already 'done' when the same data was exported before.
+    """
+    if request.method != 'POST':
+        return JsonResponse({"success": False, "message": "Invalid request."}, status=400)
+
+    export_format = request.POST.get('format')
+    if export_format not in EXPORT_CONTENT_TYPES:
+        return JsonResponse({"success": False, "message": "Unknown export format."}, status=400)
+
+    if export_format == 'zip':
+        if request.user.role != 'admin':
+            return JsonResponse({"success": False, "message": "Only admins can export the whole school."}, status=403)
+        year_id = request.POST.get('year')
+        academic_year = (
+            get_object_or_404(AcademicYear, id=year_id) if year_id
+            else AcademicYear.objects.filter(is_active=True).first()
+        )
+        if not academic_year:
+            return JsonResponse({"success": False, "message": "No active academic year."}, status=400)
+        classroom = stream = None
+    elif request.user.role == 'admin':
+        classroom = get_object_or_404(Classroom.objects.select_related('year'), id=request.POST.get('classroom'))
+        stream_id = request.POST.get('stream')
+        stream = get_object_or_404(Stream, id=stream_id, classroom=classroom) if stream_id else None
+        academic_year = classroom.year
+    else:
+        teacher = get_object_or_404(TeacherProfile, user=request.user)
+        classroom, stream = get_teacher_current_assignment(teacher)
+        academic_year = AcademicYear.objects.filter(is_active=True).first()
+        if not classroom:
+            return JsonResponse({"success": False, "message": "You are not assigned to any classroom."}, status=400)
+
+    term = request.POST.get('term')
+    if term and not (academic_year and academic_year.term_dates(term)):
+        return JsonResponse({"success": False, "message": "That term has no dates set for this year."}, status=400)
+
+    range_start, range_end = get_report_range(request, academic_year)
+    if not (range_start or range_end or classroom is None):
+        range_start = range_end = parse_date_param(request.POST.get("date")) or now().date()
+
+    job = request_export(request.user, export_format, academic_year, classroom, stream, range_start, range_end)
+    return JsonResponse({"success": True, **export_job_payload(job)}, status=202)
+
+
+@never_cache
+@login_required
+def export_status(request, job_id):
+    job = get_export_job_for_user(request.user, job_id)
+    return JsonResponse(export_job_payload(job))
+
+
+@never_cache
+@login_required
+def download_export(request, job_id):
+    job = get_export_job_for_user(request.user, job_id)
+    storage = get_export_storage()
+    if job.status != 'done' or not storage.exists(job.artifact_name):
+        return JsonResponse({"success": False, "message": "Export is not ready."}, status=404)
+
+    period = "_".join(str(day) for day in dict.fromkeys((job.start_date, job.end_date)) if day) or "year"
+    return FileResponse(
+        storage.open(job.artifact_name, 'rb'),
+        as_attachment=True,
+        filename=f"Attendance_{job.classroom.name if job.classroom else job.academic_year.year_start}_{period}.{job.format}",
+        content_type=EXPORT_CONTENT_TYPES[job.format],
+    )
 
 
 # ================= SMS LOGS VIEWS =================
@@ -2791,6 +3113,17 @@ def resend_sms(request, sms_id):
             'message': ' Ujumbe wa SMS uko tupu. Haiwezi kutumwa tena.'
         })
 
+    # Gateway paused by the circuit breaker: leave it queued for dispatch_sms
+    if sms_breaker.is_open():
+        sms_log.status = "pending"
+        sms_log.phone_number = normalize_parent_phone(sms_log.parent.user.phone_number) or ''
+        sms_log.claimed_at = None
+        sms_log.save()
+        return JsonResponse({
+            'success': True, 
+            'message': f' SMS ya mzazi wa {student_name} imewekwa kwenye foleni, itatumwa baadaye.'
+        })
+
     try:
         parent_phone = sms_log.parent.user.phone_number
         sms_sent, response_msg = send_sms(parent_phone, sms_log.message)
@@ -3061,10 +3394,14 @@ def edit_classroom(request, classroom_id):
 
         if delete_streams:
 
-            Stream.objects.filter(
-                id__in=delete_streams,
-                classroom=classroom
-            ).delete()
+            with transaction.atomic():
+                Stream.objects.filter(
+                    id__in=delete_streams,
+                    classroom=classroom
+                ).delete()
+
+                # Students of a deleted stream now count under the classroom without a stream
+                refresh_daily_rollups(get_rollup_keys(Attendance.objects.filter(enrollment__classroom=classroom)))
 
         # ADD NEW STREAM
         new_stream = request.POST.get('new_stream', '').strip()
@@ -3161,6 +3498,15 @@ def edit_academic_year(request, id):
         year.year_start = year_start
         year.year_end = year_start + 1
         year.is_active = 'is_active' in request.POST
+        for term, _, _, _ in year.term_calendar:
+            for bound in ('start', 'end'):
+                field = f'{term.lower()}_{bound}'
+                setattr(year, field, parse_date_param(request.POST.get(field)))
+        try:
+            year.clean()
+        except ValidationError as e:
+            messages.error(request, e.messages[0])
+            return redirect('academic_years')
         year.save()
         messages.success(request, f"Academic Year {year.year_start}/{year.year_end} updated successfully")
         return redirect('academic_years')
@@ -3228,35 +3574,34 @@ def attendance_report_cards(request):
     
     # Get classrooms for the selected academic year
     if selected_academic_year:
-        classrooms = Classroom.objects.filter(year=selected_academic_year).order_by('name')
+        classrooms = Classroom.objects.filter(year=selected_academic_year).select_related('year').order_by('name')
+
+        # Enrolled and attendance counts for every classroom (two grouped queries);
+        # today unless a term or date range is asked for
+        range_start, range_end = get_report_range(request, selected_academic_year)
+        if not (range_start or range_end):
+            range_start = range_end = timezone.localdate()
+        counts = get_report_card_counts(selected_academic_year, range_start, range_end)
         
         # Add attendance summary for each classroom
         for classroom in classrooms:
-            # Get students enrolled in this classroom for the selected year
-            students = StudentProfile.objects.filter(
-                enrollments__classroom=classroom,
-                enrollments__academic_year=selected_academic_year
-            ).distinct()
-            
-            classroom.total_students = students.count()
-            
-            # Get today's attendance summary for this classroom
-            today = now().date()
-            attendance_today = Attendance.objects.filter(
-                student__in=students,
-                date=today
-            )
-            
-            classroom.present_today = attendance_today.filter(status='present').count()
-            classroom.absent_today = attendance_today.filter(status='absent').count()
-            classroom.sick_today = attendance_today.filter(status='sick').count()
+            classroom_counts = counts.get(classroom.id, {})
+            classroom.total_students = classroom_counts.get('total_students', 0)
+            classroom.present = classroom_counts.get('present', 0)
+            classroom.absent = classroom_counts.get('absent', 0)
+            classroom.sick = classroom_counts.get('sick', 0)
     else:
         classrooms = Classroom.objects.none()
+        range_start = range_end = None
 
     context = {
         "classrooms": classrooms,
         "all_academic_years": all_academic_years,
         "selected_academic_year": selected_academic_year,
+        "terms": get_term_choices(selected_academic_year),
+        "selected_term": get_selected_term(request, selected_academic_year),
+        "range_start": range_start,
+        "range_end": range_end,
     }
     return render(request, "attendance_app/attendance_report_cards.html", context)
 
@@ -3295,7 +3640,7 @@ def view_class_attendance(request, classroom_id):
 
         if not active_year:
             messages.error(request, "No academic year found.")
-            return redirect('attendance_report_cards')
+            return redirect('attendance_report')
         
         # Get all students enrolled in this classroom for that academic year
         students_in_class = StudentProfile.objects.filter(
@@ -3323,6 +3668,48 @@ def view_class_attendance(request, classroom_id):
         students_with_attendance = attendance_qs.values_list('student_id', flat=True)
         students_without_attendance = students_in_class.exclude(id__in=students_with_attendance)
         
+        # Totals over a term or date range, one row per day, from the daily class rollup
+        range_start, range_end = get_report_range(request, active_year)
+        range_days = []
+        range_totals = None
+        student_analytics = []
+        snapshot_term = get_snapshot_term(request, active_year)
+        snapshot = None
+        if snapshot_term:
+            # Locked year and a term: totals, days and per-student metrics were frozen at lock time
+            snapshot = ClassSnapshot.objects.filter(
+                academic_year=active_year, classroom=classroom, term=snapshot_term,
+                stream_id=selected_stream_id or None
+            ).first()
+        if snapshot:
+            range_totals = {'present': snapshot.present, 'absent': snapshot.absent, 'sick': snapshot.sick}
+            range_days = [dict(day, date=date.fromisoformat(day['date'])) for day in snapshot.days]
+            student_snapshots = StudentSnapshot.objects.filter(
+                academic_year=active_year, classroom=classroom, term=snapshot_term
+            ).select_related('student__user').order_by('student__user__first_name', 'student__user__last_name')
+            if selected_stream_id:
+                student_snapshots = student_snapshots.filter(stream_id=selected_stream_id)
+            student_analytics = [{'student': row.student, **row.metrics} for row in student_snapshots]
+            if not raw_date:
+                # Today's register of a locked year is always empty; only read a day that was asked for
+                attendance_qs = Attendance.objects.none()
+                students_without_attendance = StudentProfile.objects.none()
+        elif range_start or range_end:
+            class_days = in_date_range(
+                DailyClassAttendance.objects.filter(academic_year=active_year, classroom=classroom),
+                range_start, range_end
+            )
+            if selected_stream_id:
+                class_days = class_days.filter(stream_id=selected_stream_id)
+            range_totals = sum_daily_rollups(class_days)
+            range_days = list(
+                class_days.values('date')
+                .annotate(present=Sum('present'), absent=Sum('absent'), sick=Sum('sick'))
+                .order_by('date')
+            )
+            selected_stream = streams.filter(id=selected_stream_id).first() if selected_stream_id else None
+            student_analytics = get_student_analytics(active_year, classroom, selected_stream, range_start, range_end)
+        
         # Get all academic years for the filter dropdown
         all_academic_years = AcademicYear.objects.all().order_by('-year_start')
         
@@ -3336,6 +3723,13 @@ def view_class_attendance(request, classroom_id):
             "active_year": active_year,
             "all_academic_years": all_academic_years,
             "selected_year_id": selected_year_id,
+            "terms": get_term_choices(active_year),
+            "selected_term": get_selected_term(request, active_year),
+            "range_start": range_start,
+            "range_end": range_end,
+            "range_totals": range_totals,
+            "range_days": range_days,
+            "student_analytics": student_analytics,
         }
 
         return render(request, "attendance_app/view_class_attendance.html", context)
@@ -3343,7 +3737,7 @@ def view_class_attendance(request, classroom_id):
     except Exception as e:
         logger.error(f"Error in view_class_attendance for class {classroom_id}: {e}")
         messages.error(request, "Could not load attendance data. Please try again or contact support.")
-        return redirect('attendance_report_cards')
+        return redirect('attendance_report')
 
 
 # ================= PROFILE & SETTINGS VIEWS =================
@@ -3536,35 +3930,93 @@ def school_settings(request):
 
 # ================= STUDENT EXPORT VIEWS =================
 
+class Echo:
+    """Pseudo-buffer for csv.writer: write() hands the formatted line back so it can be streamed."""
+
+    def write(self, value):
+        return value
+
+
+STUDENT_EXPORT_FIELDS = [
+    'admission_number', 'user__first_name', 'user__last_name', 'user__email',
+    'user__phone_number', 'user__gender', 'classroom_name', 'stream_name',
+]
+
+
+def stream_student_csv(rows):
+    """CSV lines for a values_list() of STUDENT_EXPORT_FIELDS, read in chunks from a server-side iterator."""
+    writer = csv.writer(Echo())
+    yield writer.writerow(["Admission No", "Name", "Email", "Phone", "Gender", "Classroom", "Stream"])
+    for admission_number, first_name, last_name, email, phone, gender, classroom_name, stream_name in rows.iterator(
+        chunk_size=settings.EXPORT_CHUNK_SIZE
+    ):
+        yield writer.writerow([
+            admission_number,
+            f"{first_name} {last_name}",
+            email,
+            phone or '—',
+            gender.capitalize() if gender else '—',
+            classroom_name or '—',
+            stream_name or '—',
+        ])
+
+
+def get_enrollment_export_rows(enrollments):
+    """STUDENT_EXPORT_FIELDS rows for an Enrollment queryset (one row per enrollment, no distinct())."""
+    return enrollments.filter(student__isnull=False).annotate(
+        admission_number=F('student__admission_number'),
+        classroom_name=F('classroom__name'),
+        stream_name=F('stream__name'),
+    ).values_list(
+        'admission_number', 'student__user__first_name', 'student__user__last_name', 'student__user__email',
+        'student__user__phone_number', 'student__user__gender', 'classroom_name', 'stream_name',
+    )
+
+
 @never_cache
 @login_required
 def export_students_excel(request):
-    teacher = get_object_or_404(TeacherProfile, user=request.user)
-    classroom, stream = get_teacher_current_assignment(teacher)
+    """
+    Students as CSV, streamed from a queryset iterator so memory stays flat whatever the size.
+    Teachers get their class. Admins get ?scope=year (every class of ?year=<id>, default the
+    active year) or ?scope=school (every student, with their most recent class).
+    """
     active_year = AcademicYear.objects.filter(is_active=True).first()
 
-    if not classroom:
-        messages.error(request, "You are not assigned to any classroom.")
-        return redirect('teacher_dashboard')
-
-    students = get_students_by_teacher_scope(classroom, stream, academic_year=active_year).select_related("user")
-
-    response = HttpResponse(content_type="text/csv")
-    response["Content-Disposition"] = f'attachment; filename="students_{classroom.name}.csv"'
+    if request.user.role == 'admin':
+        if request.GET.get('scope') == 'school':
+            latest = Enrollment.objects.filter(student=OuterRef('pk')).order_by('-academic_year__year_start')
+            rows = StudentProfile.objects.annotate(
+                classroom_name=Subquery(latest.values('classroom__name')[:1]),
+                stream_name=Subquery(latest.values('stream__name')[:1]),
+            ).order_by('admission_number').values_list(*STUDENT_EXPORT_FIELDS)
+            filename = "students_school.csv"
+        else:
+            year_id = request.GET.get('year', '')
+            academic_year = AcademicYear.objects.filter(id=year_id).first() if year_id.isdigit() else active_year
+            if not academic_year:
+                messages.error(request, "No academic year found.")
+                return redirect('manage_student')
+            rows = get_enrollment_export_rows(
+                Enrollment.objects.filter(academic_year=academic_year)
+            ).order_by('classroom_name', 'stream_name', 'admission_number')
+            filename = f"students_{academic_year.year_start}_{academic_year.year_end}.csv"
+    else:
+        teacher = get_object_or_404(TeacherProfile, user=request.user)
+        classroom, stream = get_teacher_current_assignment(teacher)
 
-    writer = csv.writer(response)
-    writer.writerow(["Admission No", "Name", "Email", "Phone", "Gender", "Classroom"])
+        if not classroom:
+            messages.error(request, "You are not assigned to any classroom.")
+            return redirect('teacher_dashboard')
 
-    for s in students:
-        writer.writerow([
-            s.admission_number,
-            f"{s.user.first_name} {s.user.last_name}",
-            s.user.email,
-            s.user.phone_number or '—',
-            s.user.gender.capitalize() if s.user.gender else '—',
-            classroom.name
-        ])
+        enrollments = Enrollment.objects.filter(academic_year=active_year, classroom=classroom, status='Active')
+        if stream:
+            enrollments = enrollments.filter(stream=stream)
+        rows = get_enrollment_export_rows(enrollments).order_by('admission_number')
+        filename = f"students_{classroom.name}.csv"
 
+    response = StreamingHttpResponse(stream_student_csv(rows), content_type="text/csv")
+    response["Content-Disposition"] = f'attachment; filename="{filename}"'
     return response
 
 
@@ -3698,108 +4150,6 @@ def reset_password(request):
     return render(request, "attendance_app/reset_password.html")
 
 
-# ================= HELPER FUNCTIONS FOR SMS =================
-
-def normalize_parent_phone(parent_phone):
-    if not parent_phone:
-        return None
-    parent_phone = re.sub(r"[^\d+]", "", parent_phone)
-    if parent_phone.startswith("0") and len(parent_phone) == 10:
-        parent_phone = "+255" + parent_phone[1:]
-    elif parent_phone.startswith(("6", "7")) and len(parent_phone) == 9:
-        parent_phone = "+255" + parent_phone
-    elif parent_phone.startswith("255") and len(parent_phone) == 12:
-        parent_phone = "+" + parent_phone
-    if re.match(r"^\+255[67]\d{8}$", parent_phone):
-        return parent_phone
-    return None
-
-
-def send_absent_sms(student, teacher=None):
-    """
-    Send SMS to all parents of absent student
-    Returns: (success_count, failed_count, messages)
-    """
-    parents = ParentProfile.objects.filter(student=student).select_related('user')
-    
-    if not parents.exists():
-        logger.warning(f"No parent found for student {student.user.get_full_name()}")
-        return 0, 1, ["No parent registered for this student"]
-
-    if teacher is None:
-        active_year = AcademicYear.objects.filter(is_active=True).first()
-        classroom_ids = student.enrollments.filter(
-            academic_year=active_year, 
-            status='Active'
-        ).values_list('classroom_id', flat=True)
-        teacher = TeacherProfile.objects.filter(
-            class_enrollments__classroom_id__in=classroom_ids,
-            class_enrollments__academic_year=active_year
-        ).first()
-
-    teacher_phone = teacher.user.phone_number if teacher and teacher.user.phone_number else "N/A"
-    teacher_name = teacher.user.get_full_name() if teacher else "Mwalimu"
-    
-    message_template = (
-        f"HABARI MZAZI: Mtoto wako {student.user.get_full_name()} "
-        f"hajafika shuleni leo {timezone.now().strftime('%d/%m/%Y')}. "
-        f"Tafadhali wasiliana na mwalim {teacher_name} kwa namba {teacher_phone}. Asante."
-    )
-
-    success_count = 0
-    failed_count = 0
-    messages_list = []
-    
-    for parent in parents:
-        parent_phone_raw = parent.user.phone_number
-        parent_phone = normalize_parent_phone(parent_phone_raw)
-
-        if not parent_phone:
-            failed_count += 1
-            msg = f"Invalid phone for {parent.user.get_full_name()}"
-            messages_list.append(msg)
-            SMSLog.objects.create(
-                student=student, 
-                parent=parent, 
-                message=message_template, 
-                status='failed'
-            )
-            continue
-
-        try:
-            success, response_msg = send_sms(parent_phone, message_template)
-            status = 'sent' if success else 'failed'
-            
-            SMSLog.objects.create(
-                student=student, 
-                parent=parent, 
-                message=message_template, 
-                status=status
-            )
-            
-            if success:
-                success_count += 1
-                logger.info(f"SMS sent to {parent_phone} for {student.user.get_full_name()}")
-            else:
-                failed_count += 1
-                messages_list.append(f"{parent.user.get_full_name()}: {response_msg}")
-                logger.error(f"SMS failed to {parent_phone}: {response_msg}")
-                
-        except Exception as e:
-            failed_count += 1
-            error_msg = str(e)
-            messages_list.append(f"{parent.user.get_full_name()}: {error_msg[:50]}")
-            logger.error(f"SMS exception for {student.id}: {e}")
-            SMSLog.objects.create(
-                student=student, 
-                parent=parent, 
-                message=message_template, 
-                status='failed'
-            )
-    
-    return success_count, failed_count, messages_list
-
-
 # ================= ACADEMIC YEAR PROMOTION VIEWS =================
 
 
@@ -4061,6 +4411,10 @@ def generate_academic_year(request):
             status='Inactive'
         ).count()
 
+        # ================= FREEZE OLD YEAR REPORTS =================
+        # Its data can no longer change, so its reports are served from snapshots
+        freeze_academic_year(old_year)
+
         # ================= SUCCESS MESSAGE =================
         messages.success(request,
             f"""Academic Year {new_year} created successfully!
@@ -4095,12 +4449,16 @@ TEACHERS:
 @never_cache
 @login_required
 def academic_year_summary(request):
-    """OPTIMIZED - Single query version"""
+    """
+    Per-classroom totals for a year, grouped in the database (three queries);
+    locked years are read from their ClassSnapshot rows (one query).
+    """
     try:
         years = AcademicYear.objects.all().order_by('-year_start')
         active_year_id = request.GET.get('year')
         active_year = None
         summary_data = []
+        range_start = range_end = None
 
         if active_year_id:
             try:
@@ -4111,63 +4469,57 @@ def academic_year_summary(request):
             active_year = AcademicYear.objects.filter(is_active=True).first()
 
         if active_year:
-            # OPTIMIZED: Single query with all relations
-            classrooms = Classroom.objects.filter(year=active_year).prefetch_related(
-                'streams',
-                'class_enrollments__student__user',
-                'class_enrollments__class_teacher__user'
-            )
-            
-            # Get all enrollments in ONE query
-            enrollments = Enrollment.objects.filter(
-                academic_year=active_year
-            ).select_related(
-                'student__user',
-                'classroom',
-                'class_teacher__user'
-            )
-            
-            # Group by classroom
-            classroom_data = {}
-            for enrollment in enrollments:
-                if enrollment.classroom:
-                    cid = enrollment.classroom.id
-                    if cid not in classroom_data:
-                        classroom_data[cid] = {
-                            'classroom': enrollment.classroom,
-                            'student_ids': set(),
-                            'teachers': set()
-                        }
-                    if enrollment.student:
-                        classroom_data[cid]['student_ids'].add(enrollment.student.id)
-                    if enrollment.class_teacher:
-                        classroom_data[cid]['teachers'].add(enrollment.class_teacher)
-            
-            # Get attendance in ONE query
-            all_student_ids = set()
-            for data in classroom_data.values():
-                all_student_ids.update(data['student_ids'])
-            
-            from django.db.models import Count, Q
-            attendance_stats = Attendance.objects.filter(
-                student_id__in=all_student_ids
-            ).values('student_id', 'status').annotate(total=Count('id'))
+            range_start, range_end = get_report_range(request, active_year)
+            snapshot_term = get_snapshot_term(request, active_year)
+            # (classroom, students_count, teacher names, present, absent, sick) per classroom
+            rows = []
+            if snapshot_term is not None:
+                # Locked year: frozen at lock time, no raw rows touched
+                rows = [
+                    (snapshot.classroom, snapshot.students_count, snapshot.teacher_names,
+                     snapshot.present, snapshot.absent, snapshot.sick)
+                    for snapshot in ClassSnapshot.objects.filter(
+                        academic_year=active_year, term=snapshot_term, stream__isnull=True
+                    ).select_related('classroom').order_by('classroom__name')
+                ]
+
+            if not rows:
+                # Classrooms with any enrollment this year, student counts grouped in the database
+                year_enrollments = Q(class_enrollments__academic_year=active_year)
+                classrooms = Classroom.objects.annotate(
+                    enrollments_count=Count('class_enrollments', filter=year_enrollments),
+                    students_count=Count('class_enrollments__student', filter=year_enrollments, distinct=True),
+                ).filter(enrollments_count__gt=0).order_by('name')
+
+                # Class teachers per classroom
+                teachers = {}
+                for enrollment in Enrollment.objects.filter(
+                    academic_year=active_year,
+                    classroom__isnull=False,
+                    class_teacher__isnull=False
+                ).select_related('class_teacher__user'):
+                    class_teachers = teachers.setdefault(enrollment.classroom_id, {})
+                    class_teachers[enrollment.class_teacher_id] = enrollment.class_teacher.user.get_full_name()
+
+                # Totals per classroom for the year (or the chosen term/range) from the daily class rollup
+                attendance_stats = {
+                    row['classroom_id']: row
+                    for row in in_date_range(
+                        DailyClassAttendance.objects.filter(academic_year=active_year), range_start, range_end
+                    )
+                    .values('classroom_id')
+                    .annotate(present=Sum('present'), absent=Sum('absent'), sick=Sum('sick'))
+                    .order_by()
+                }
+                for classroom in classrooms:
+                    stats = attendance_stats.get(classroom.id, {})
+                    rows.append((
+                        classroom, classroom.students_count, sorted(teachers.get(classroom.id, {}).values()),
+                        stats.get('present', 0), stats.get('absent', 0), stats.get('sick', 0),
+                    ))
             
             # Build summary
-            for data in classroom_data.values():
-                classroom = data['classroom']
-                students_count = len(data['student_ids'])
-                
-                total_present = total_absent = total_sick = 0
-                for stat in attendance_stats:
-                    if stat['student_id'] in data['student_ids']:
-                        if stat['status'] == 'present':
-                            total_present += stat['total']
-                        elif stat['status'] == 'absent':
-                            total_absent += stat['total']
-                        elif stat['status'] == 'sick':
-                            total_sick += stat['total']
-                
+            for classroom, students_count, teacher_names, total_present, total_absent, total_sick in rows:
                 total_records = total_present + total_absent + total_sick
                 
                 if students_count > 0 and total_records > 0:
@@ -4180,7 +4532,7 @@ def academic_year_summary(request):
                 summary_data.append({
                     'classroom': classroom,
                     'students_count': students_count,
-                    'teachers': list(data['teachers']),
+                    'teachers': teacher_names,
                     'total_present': total_present,
                     'total_absent': total_absent,
                     'total_sick': total_sick,
@@ -4193,8 +4545,12 @@ def academic_year_summary(request):
             'years': years,
             'active_year': active_year,
             'summary_data': summary_data,
-            'terms': [('TERM1', 'Term 1'), ('TERM2', 'Term 2'), ('TERM3', 'Term 3')],
-            'selected_term': request.GET.get('term'),
+            'terms': get_term_choices(active_year),
+            'selected_term': get_selected_term(request, active_year),
+            'start_date': request.GET.get('start', ''),
+            'end_date': request.GET.get('end', ''),
+            'range_start': range_start,
+            'range_end': range_end,
         }
         return render(request, 'attendance_app/academic_year_summary.html', context)
     except Exception as e:
@@ -27,6 +27,20 @@ DATABASES = {
     )
 }
 
+# =================== CACHE ===================
+# Shared by every worker (SMS circuit breaker, dashboard counters).
+# The database cache table is created by `python manage.py migrate`.
+CACHES = {
+    'default': {
+        'BACKEND': config('CACHE_BACKEND', default='django.core.cache.backends.db.DatabaseCache'),
+        'LOCATION': config('CACHE_LOCATION', default='attendance_cache'),
+    }
+}
+# Seconds the report cards reuse their counts (new attendance clears them sooner)
+REPORT_CARDS_CACHE_TIMEOUT = config('REPORT_CARDS_CACHE_TIMEOUT', default=300, cast=int)
+# Fallback lifetime of the admin dashboard counters (saves and deletes clear them sooner)
+ADMIN_DASHBOARD_CACHE_TIMEOUT = config('ADMIN_DASHBOARD_CACHE_TIMEOUT', default=120, cast=int)
+
 # =================== EMAIL ===================
 EMAIL_BACKEND = 'django.core.mail.backends.smtp.EmailBackend'
 EMAIL_HOST = config('EMAIL_HOST', default='smtp.example.com')
@@ -36,10 +50,49 @@ EMAIL_HOST_USER = config('EMAIL_HOST_USER', default='')
 EMAIL_HOST_PASSWORD = config('EMAIL_HOST_PASSWORD', default='')
 DEFAULT_FROM_EMAIL = config('DEFAULT_FROM_EMAIL', default='noreply@example.com')
 
+# =================== SMS ===================
+# attendance_app.sms_backends.AfricasTalkingBackend | SimulatorBackend | LocmemBackend
+SMS_BACKEND = config('SMS_BACKEND', default='attendance_app.sms_backends.AfricasTalkingBackend')
+# Where SimulatorBackend finds `python manage.py run_sms_simulator`
+SMS_SIMULATOR_URL = config('SMS_SIMULATOR_URL', default='http://127.0.0.1:8025')
+
 # =================== AFRICASTALKING ===================
 AFRICASTALKING_USERNAME = config('AFRICASTALKING_USERNAME', default='')
 AFRICASTALKING_API_KEY = config('AFRICASTALKING_API_KEY', default='')
 AFRICASTALKING_SENDER_ID = config('SENDER_ID', default='School_SMS')
+AFRICASTALKING_API_URL = config('AFRICASTALKING_API_URL', default='')
+SMS_CONNECT_TIMEOUT = config('SMS_CONNECT_TIMEOUT', default=3.05, cast=float)
+SMS_READ_TIMEOUT = config('SMS_READ_TIMEOUT', default=20, cast=float)
+# Recipients per gateway call when the outbox sends the same message to many parents
+SMS_BATCH_SIZE = config('SMS_BATCH_SIZE', default=100, cast=int)
+# Gateway requests one ASGI worker keeps in flight (async path)
+SMS_ASYNC_CONCURRENCY = config('SMS_ASYNC_CONCURRENCY', default=20, cast=int)
+# Circuit breaker: open after N failed gateway calls, retry after the cooldown (seconds)
+SMS_BREAKER_THRESHOLD = config('SMS_BREAKER_THRESHOLD', default=5, cast=int)
+SMS_BREAKER_COOLDOWN = config('SMS_BREAKER_COOLDOWN', default=60, cast=int)
+SMS_BREAKER_BALANCE_COOLDOWN = config('SMS_BREAKER_BALANCE_COOLDOWN', default=900, cast=int)
+
+# =================== ATTENDANCE SYNC API ===================
+# Largest batch the offline app may upload, and how many days back it may mark
+ATTENDANCE_SYNC_MAX_MARKS = config('ATTENDANCE_SYNC_MAX_MARKS', default=500, cast=int)
+ATTENDANCE_SYNC_MAX_AGE_DAYS = config('ATTENDANCE_SYNC_MAX_AGE_DAYS', default=7, cast=int)
+
+# =================== CHRONIC ABSENTEEISM ===================
+# Nightly flag_chronic_absenteeism: flag a student whose absence rate over the
+# window reaches the threshold (percent) or who misses N school days in a row
+ABSENTEEISM_WINDOW_DAYS = config('ABSENTEEISM_WINDOW_DAYS', default=30, cast=int)
+ABSENTEEISM_RATE_THRESHOLD = config('ABSENTEEISM_RATE_THRESHOLD', default=20.0, cast=float)
+ABSENTEEISM_STREAK_DAYS = config('ABSENTEEISM_STREAK_DAYS', default=3, cast=int)
+
+# =================== EXPORTS ===================
+# Rows fetched per database round trip by the streaming exports
+EXPORT_CHUNK_SIZE = config('EXPORT_CHUNK_SIZE', default=2000, cast=int)
+# Local directory for the files rendered by run_export_jobs (served through the app, not MEDIA)
+EXPORT_ROOT = config('EXPORT_ROOT', default=str(BASE_DIR / 'exports'))
+# Days run_export_jobs keeps finished export jobs and their files
+EXPORT_RETENTION_DAYS = config('EXPORT_RETENTION_DAYS', default=7, cast=int)
+# Processes rendering class registers for the whole-school ZIP bundle (0 or 1 renders them in the export worker)
+EXPORT_BUNDLE_WORKERS = config('EXPORT_BUNDLE_WORKERS', default=min(os.cpu_count() or 1, 4), cast=int)
 
 # =================== AUTH ===================
 AUTH_USER_MODEL = 'attendance_app.User'